@@ -0,0 +1,213 @@
+"""Achievement rules, declared as data.
+
+A rule awards ``code`` once ``metric`` reaches ``threshold``. ``user`` rules
+are earned per player (medals on the total score); ``team`` rules are shared
+by everybody (the dashboard trophies). Rules are only re-evaluated when an
+event that can move their metric fires, and only until they are earned: an
+award is kept, with the time it was earned, even if the metric drops later.
+"""
+import threading
+import time
+from typing import NamedTuple
+
+
+USER = "user"
+TEAM = "team"
+
+SCORE = "score"
+REGISTRATION = "registration"
+
+
+class Rule(NamedTuple):
+    code: str
+    scope: str
+    metric: str
+    threshold: int
+    icon: str
+    label: str
+    description: str
+    # Rules of one group are ranks: only the highest earned one is displayed
+    group: str = ""
+
+
+RULES = (
+    Rule("bronze", USER, "total_score", 200, "🥉", "Bronze", "200 points cumulés", group="medal"),
+    Rule("argent", USER, "total_score", 500, "🥈", "Argent", "500 points cumulés", group="medal"),
+    Rule("or", USER, "total_score", 1000, "🥇", "Or", "1000 points cumulés", group="medal"),
+    Rule("eclaireur", TEAM, "missions_completed", 3, "🏅", "Éclaireur", "3 missions activées"),
+    Rule("chef_equipe", TEAM, "total_rescuers", 5, "🚑", "Chef d'équipe", "Plus de 5 secouristes inscrits"),
+    Rule("precision", TEAM, "team_score", 200, "🎯", "Précision", "Score cumulé supérieur à 200"),
+)
+RULES_BY_CODE = {rule.code: rule for rule in RULES}
+
+# Events that can move each metric
+METRIC_EVENTS = {
+    "total_score": {SCORE},
+    "missions_completed": {SCORE},
+    "total_rescuers": {REGISTRATION},
+    "team_score": {SCORE},
+}
+
+
+def rules_for_event(event):
+    return [rule for rule in RULES if event in METRIC_EVENTS[rule.metric]]
+
+
+def team_rules():
+    return [rule for rule in RULES if rule.scope == TEAM]
+
+
+def evaluate(rules, earned, user_ids, team_metrics, user_metric):
+    """Return the (rule, owner) pairs newly reached.
+
+    ``earned`` holds the (code, owner) pairs already awarded; they are not
+    evaluated again. ``team_metrics(names)`` returns {name: value} and
+    ``user_metric(name, user_ids, minimum)`` returns {user_id: value} for the
+    players at or above ``minimum`` (``user_ids`` None meaning every player).
+    """
+    reached = []
+    team = [rule for rule in rules if rule.scope == TEAM and (rule.code, None) not in earned]
+    if team:
+        values = team_metrics({rule.metric for rule in team})
+        reached += [(rule, None) for rule in team if values[rule.metric] >= rule.threshold]
+    for metric in sorted({rule.metric for rule in rules if rule.scope == USER}):
+        metric_rules = [rule for rule in rules if rule.scope == USER and rule.metric == metric]
+        candidates = user_ids
+        if candidates is not None:
+            candidates = [
+                user_id for user_id in candidates
+                if any((rule.code, user_id) not in earned for rule in metric_rules)
+            ]
+            if not candidates:
+                continue
+        values = user_metric(metric, candidates, min(rule.threshold for rule in metric_rules))
+        for user_id, value in values.items():
+            reached += [
+                (rule, user_id) for rule in metric_rules
+                if value >= rule.threshold and (rule.code, user_id) not in earned
+            ]
+    return reached
+
+
+def serialize_badge(rule, earned_at=None):
+    badge = {"code": rule.code, "icon": rule.icon, "label": rule.label, "threshold": rule.threshold}
+    if earned_at is not None:
+        badge["earned_at"] = earned_at.isoformat()
+    return badge
+
+
+def displayed_badges(awards):
+    """Badges shown next to a player from ``{code: earned_at}``: the highest rank per group."""
+    shown = {}
+    for rule in RULES:
+        if rule.scope != USER or rule.code not in awards:
+            continue
+        key = rule.group or rule.code
+        if key not in shown or rule.threshold > shown[key][0].threshold:
+            shown[key] = (rule, awards[rule.code])
+    return [serialize_badge(rule, earned_at) for rule, earned_at in shown.values()]
+
+
+class MetricCache:
+    """Metric values and awards already known, so most events evaluate nothing.
+
+    Values are keyed by (metric, owner), owner None for team metrics. Each is
+    read from the database once, then moved by the deltas of committed writes
+    (``apply``); a value older than ``ttl`` seconds is read again, which
+    catches up with writes made by other processes. Awards are only ever
+    added, so the awards of an owner are loaded once and kept until
+    ``forget``.
+    """
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self._values = {}
+        # Bumped by every delta: a read that raced a commit is not stored
+        self._versions = {}
+        self._epoch = 0
+        self._awards = {}
+        self._lock = threading.Lock()
+
+    def value(self, metric, owner=None):
+        entry = self._values.get((metric, owner))
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def versions(self, keys):
+        with self._lock:
+            return self._epoch, {key: self._versions.get(key, 0) for key in keys}
+
+    def store(self, values, versions):
+        """Keep ``values`` read from the database unless a commit moved them meanwhile."""
+        epoch, key_versions = versions
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            for key, value in values.items():
+                if self._versions.get(key, 0) == key_versions[key]:
+                    self._values[key] = (value, expires)
+
+    def apply(self, deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._versions[key] = self._versions.get(key, 0) + 1
+                entry = self._values.get(key)
+                if entry is not None:
+                    self._values[key] = (entry[0] + delta, entry[1])
+
+    def invalidate(self):
+        """Drop every value, e.g. after writes whose deltas are unknown."""
+        with self._lock:
+            self._epoch += 1
+            self._values.clear()
+            self._versions.clear()
+
+    def unknown_owners(self, owners):
+        return [owner for owner in owners if owner not in self._awards]
+
+    def learn_awards(self, owners, pairs):
+        """Record every award of ``owners``, as (code, owner) pairs."""
+        with self._lock:
+            for owner in owners:
+                self._awards.setdefault(owner, set())
+            for code, owner in pairs:
+                if owner in self._awards:
+                    self._awards[owner].add(code)
+
+    def add_awards(self, pairs):
+        with self._lock:
+            for code, owner in pairs:
+                if owner in self._awards:
+                    self._awards[owner].add(code)
+
+    def earned(self, owners):
+        return {(code, owner) for owner in owners for code in self._awards.get(owner, ())}
+
+    def forget(self, owners):
+        with self._lock:
+            for owner in owners:
+                self._awards.pop(owner, None)
+
+    def reachable(self, rules, user_ids):
+        """Drop the rules, and players, the known values say cannot be newly earned.
+
+        A rule is kept while its metric is unknown or at its threshold and the
+        award is not known to be earned.
+        """
+        kept, candidates = [], set()
+        for rule in rules:
+            owners = [None] if rule.scope == TEAM else user_ids
+            open_owners = [owner for owner in owners if self._may_earn(rule, owner)]
+            if open_owners:
+                kept.append(rule)
+                if rule.scope == USER:
+                    candidates.update(open_owners)
+        return kept, [user_id for user_id in user_ids if user_id in candidates]
+
+    def _may_earn(self, rule, owner):
+        if rule.code in self._awards.get(owner, ()):
+            return False
+        value = self.value(rule.metric, owner)
+        return value is None or value >= rule.threshold
@@ -0,0 +1,222 @@
+"""Admission control: per-route concurrency limits with bounded queues.
+
+Each request is assigned a priority class from its endpoint. ``heavy`` routes
+(dashboard, designer listings, password hashing, exports) and ``standard``
+routes share bounded pools of slots; ``gameplay`` routes are never queued so a
+class loading the dashboard at once cannot starve score submissions. Heavy
+routes also get their own per-route limit. A request waits at most
+``ADMISSION_QUEUE_TIMEOUT`` seconds for a slot (longer for login and signup,
+see ``ROUTE_QUEUE_TIMEOUTS``); when the queue is full or the wait times out it
+is shed with a 503 and a ``Retry-After`` header.
+
+Routes whose cost depends on the caller are split by a ``variant`` function
+given to ``init_app``: it maps the endpoint to a limiter name, e.g. the
+designer's questionnaire listing, which loads every question.
+"""
+import math
+import os
+import threading
+import time
+
+from flask import g, jsonify, request
+
+import metrics
+
+
+GAMEPLAY = "gameplay"
+STANDARD = "standard"
+HEAVY = "heavy"
+
+ROUTE_CLASSES = {
+    "api_pendu_result": GAMEPLAY,
+    "api_pendu_word": GAMEPLAY,
+    "api_pendu_state": GAMEPLAY,
+    "api_ambulance_score": GAMEPLAY,
+    "api_progress": GAMEPLAY,
+    "api_record_questionnaire_result": GAMEPLAY,
+    "api_sync": GAMEPLAY,
+    "home": HEAVY,
+    "api_questionnaires_designer": HEAVY,
+    "api_login": HEAVY,
+    "api_register": HEAVY,
+    "api_admin_export": HEAVY,
+    "api_admin_bulk_users": HEAVY,
+}
+# Never limited: static files, scrapes and the SSE stream (it has its own cap)
+EXEMPT_ENDPOINTS = {"static", "metrics", "service_worker", "api_leaderboard_stream"}
+
+# (concurrent requests, queued requests); None means unlimited
+CLASS_LIMITS = {GAMEPLAY: None, STANDARD: (32, 64), HEAVY: (12, 24)}
+ROUTE_LIMITS = {
+    "home": (8, 16),
+    "api_questionnaires_designer": (4, 8),
+    # A whole class signs up or logs in at once; each request hashes a password
+    "api_login": (4, 64),
+    "api_register": (4, 64),
+    "api_admin_export": (2, 0),
+    "api_admin_bulk_users": (2, 2),
+}
+# Seconds a queued request may wait on these routes instead of ADMISSION_QUEUE_TIMEOUT
+ROUTE_QUEUE_TIMEOUTS = {"api_login": 15.0, "api_register": 15.0}
+
+ADMITTED = metrics.REGISTRY.counter(
+    "protec_admission_admitted_total", "Requests admitted by admission control.", ("priority",)
+)
+REJECTED = metrics.REGISTRY.counter(
+    "protec_admission_rejected_total", "Requests shed with a 503.", ("endpoint", "priority", "reason")
+)
+WAIT_SECONDS = metrics.REGISTRY.histogram(
+    "protec_admission_wait_seconds", "Time spent queued before admission.", ("priority",)
+)
+
+
+class Rejected(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Limiter:
+    """Counting semaphore with a bounded FIFO-ish wait queue and a timeout."""
+
+    def __init__(self, name, limit, max_queue):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout):
+        with self._condition:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                return
+            if self.waiting >= self.max_queue:
+                raise Rejected("queue_full")
+            self.waiting += 1
+            deadline = time.monotonic() + timeout
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Rejected("timeout")
+                    self._condition.wait(remaining)
+                self.active += 1
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def stats(self):
+        return {"active": self.active, "waiting": self.waiting, "limit": self.limit, "max_queue": self.max_queue}
+
+
+def parse_limits(value):
+    """Parse ``ADMISSION_LIMITS`` overrides: ``home=8/16,api_login=4``."""
+    limits = {}
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        name, spec = item.split("=", 1)
+        concurrency, _, queue = spec.partition("/")
+        concurrency = int(concurrency)
+        limits[name.strip()] = (concurrency, int(queue) if queue else concurrency * 2)
+    return limits
+
+
+class AdmissionController:
+    def __init__(self, class_limits, route_limits, queue_timeout):
+        self.queue_timeout = queue_timeout
+        self.classes = {
+            name: Limiter(name, *limit) for name, limit in class_limits.items() if limit is not None
+        }
+        self.routes = {name: Limiter(name, *limit) for name, limit in route_limits.items()}
+
+    def limiters_for(self, endpoint):
+        priority = ROUTE_CLASSES.get(endpoint, STANDARD)
+        # Route limiter first: requests queued on one route do not hold class slots
+        limiters = [self.routes[endpoint]] if endpoint in self.routes else []
+        if priority in self.classes:
+            limiters.append(self.classes[priority])
+        return priority, limiters
+
+    def admit(self, endpoint):
+        """Acquire every limiter for the endpoint; return what must be released."""
+        priority, limiters = self.limiters_for(endpoint)
+        timeout = ROUTE_QUEUE_TIMEOUTS.get(endpoint, self.queue_timeout)
+        held = []
+        start = time.perf_counter()
+        try:
+            for limiter in limiters:
+                limiter.acquire(max(timeout - (time.perf_counter() - start), 0))
+                held.append(limiter)
+        except Rejected:
+            for limiter in reversed(held):
+                limiter.release()
+            raise
+        if limiters:
+            WAIT_SECONDS.observe(time.perf_counter() - start, priority=priority)
+        ADMITTED.inc(priority=priority)
+        return held
+
+    def stats(self):
+        return {
+            "classes": {name: limiter.stats() for name, limiter in self.classes.items()},
+            "routes": {name: limiter.stats() for name, limiter in self.routes.items()},
+        }
+
+
+def init_app(app, variant=None):
+    if os.environ.get("ADMISSION_CONTROL", "1") == "0":
+        return None
+    queue_timeout = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 2))
+    retry_after = str(max(1, math.ceil(queue_timeout)))
+    route_limits = dict(ROUTE_LIMITS)
+    route_limits.update(parse_limits(os.environ.get("ADMISSION_LIMITS")))
+    controller = AdmissionController(CLASS_LIMITS, route_limits, queue_timeout)
+    app.extensions["admission"] = controller
+
+    metrics.REGISTRY.gauge(
+        "protec_admission_in_flight", "Requests holding an admission slot.", ("limiter",),
+        callback=lambda: {
+            (name,): limiter.active
+            for group in (controller.classes, controller.routes) for name, limiter in group.items()
+        },
+    )
+    metrics.REGISTRY.gauge(
+        "protec_admission_queued", "Requests waiting for an admission slot.", ("limiter",),
+        callback=lambda: {
+            (name,): limiter.waiting
+            for group in (controller.classes, controller.routes) for name, limiter in group.items()
+        },
+    )
+
+    @app.before_request
+    def _admit_request():
+        endpoint = request.endpoint
+        if endpoint is None or endpoint in EXEMPT_ENDPOINTS:
+            return None
+        if variant is not None:
+            endpoint = variant(endpoint)
+        try:
+            g.admission_held = controller.admit(endpoint)
+        except Rejected as exc:
+            priority = ROUTE_CLASSES.get(endpoint, STANDARD)
+            REJECTED.inc(endpoint=endpoint, priority=priority, reason=exc.reason)
+            response = jsonify({"error": "Serveur saturé, réessayez dans un instant"})
+            response.status_code = 503
+            response.headers["Retry-After"] = retry_after
+            return response
+        return None
+
+    @app.teardown_request
+    def _release_request(_exc):
+        # Streamed responses release their slots once the stream is closed
+        for limiter in reversed(g.pop("admission_held", ())):
+            limiter.release()
+
+    return controller
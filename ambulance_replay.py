@@ -0,0 +1,241 @@
+"""Server-side replay of ``ambulance_chase`` games.
+
+The client submits its seed, the number of enemy steps played (``ticks``) and
+the moves that changed the ambulance's position, each stamped with the tick
+at which it happened. ``verify_batch`` replays many games at once: every game
+is one row of NumPy arrays, so one Python iteration per tick advances the
+whole batch. Rules mirror ``static/js/ambulance_game.js`` and both sides must
+change together.
+"""
+import numpy as np
+
+
+MAZE = np.array([
+    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [1, 0, 1, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1, 1, 0, 1],
+    [1, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 1],
+    [1, 0, 1, 0, 1, 1, 1, 0, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1, 0, 1],
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1],
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1],
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [1, 0, 1, 1, 1, 0, 1, 1, 1, 0, 0, 1, 1, 1, 0, 1, 1, 1, 0, 1],
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [1, 0, 1, 0, 1, 1, 1, 0, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1, 0, 1],
+    [1, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 1],
+    [1, 0, 1, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1, 1, 0, 1],
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1],
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1],
+    [1, 0, 1, 1, 1, 1, 1, 1, 1, 0, 0, 1, 1, 1, 1, 1, 1, 1, 0, 1],
+    [1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+], dtype=np.int8)
+OPEN = MAZE == 0
+GRID_HEIGHT, GRID_WIDTH = MAZE.shape
+COINS_PER_POINT = 4
+SPAWN_EVERY_TICKS = 20  # spawnInterval (10 s) / enemy step (500 ms)
+PLAYER_START = (1, 1)
+ENEMY_START = ((18, 1), (1, 18), (18, 18), (10, 1), (1, 10), (18, 10), (10, 18), (5, 5))
+CORNERS = np.array([(1, 1), (18, 1), (1, 18), (18, 18)], dtype=np.int16)
+DIRECTIONS = {"u": (0, -1), "d": (0, 1), "l": (-1, 0), "r": (1, 0)}
+DIRECTION_CODES = {key: code for code, key in enumerate(DIRECTIONS)}
+DX = np.array([step[0] for step in DIRECTIONS.values()], dtype=np.int16)
+DY = np.array([step[1] for step in DIRECTIONS.values()], dtype=np.int16)
+
+MAX_TICKS = 7200  # one hour of play
+MAX_MOVES = 20000
+
+
+def parse_log(replay):
+    """Validate a submitted input log and return (seed, ticks, moves)."""
+    if not isinstance(replay, dict):
+        raise ValueError("Journal de partie invalide")
+    try:
+        seed = int(replay.get("seed"))
+        ticks = int(replay.get("ticks"))
+    except (TypeError, ValueError):
+        raise ValueError("Journal de partie invalide")
+    if not 0 < seed < 2 ** 32:
+        raise ValueError("Graine invalide")
+    if not 0 <= ticks <= MAX_TICKS:
+        raise ValueError("Durée de partie invalide")
+
+    moves = replay.get("moves") or []
+    if not isinstance(moves, list) or len(moves) > MAX_MOVES:
+        raise ValueError("Déplacements invalides")
+    parsed = []
+    previous = 0
+    for move in moves:
+        if not isinstance(move, (list, tuple)) or len(move) != 2 or move[1] not in DIRECTIONS:
+            raise ValueError("Déplacements invalides")
+        try:
+            tick = int(move[0])
+        except (TypeError, ValueError):
+            raise ValueError("Déplacements invalides")
+        if tick < previous or tick > ticks:
+            raise ValueError("Déplacements hors séquence")
+        parsed.append([tick, move[1]])
+        previous = tick
+    return seed, ticks, parsed
+
+
+def _xorshift32(state):
+    state ^= state << np.uint32(13)
+    state ^= state >> np.uint32(17)
+    state ^= state << np.uint32(5)
+    return state
+
+
+def replay_batch(games):
+    """Replay (seed, ticks, moves) games and return one dict per game.
+
+    Each result has the replayed ``score``, ``coins``, ``won``, whether the
+    game reached its end (``over``), the tick it ended at and, when the log
+    cannot come from the real client, an ``error``.
+    """
+    count = len(games)
+    if not count:
+        return []
+
+    seeds = np.array([game[0] for game in games], dtype=np.uint32)
+    ticks = np.array([game[1] for game in games], dtype=np.int32)
+    move_counts = np.array([len(game[2]) for game in games], dtype=np.int32)
+    max_moves = max(1, int(move_counts.max()))
+    move_ticks = np.full((count, max_moves), -1, dtype=np.int32)
+    move_dirs = np.zeros((count, max_moves), dtype=np.int8)
+    for row, (_, _, moves) in enumerate(games):
+        if moves:
+            move_ticks[row, :len(moves)] = [tick for tick, _ in moves]
+            move_dirs[row, :len(moves)] = [DIRECTION_CODES[key] for _, key in moves]
+
+    rows = np.arange(count)
+    max_enemies = len(ENEMY_START) + int(ticks.max()) // SPAWN_EVERY_TICKS
+    enemy_x = np.zeros((count, max_enemies), dtype=np.int16)
+    enemy_y = np.zeros((count, max_enemies), dtype=np.int16)
+    enemy_x[:, :len(ENEMY_START)] = [x for x, _ in ENEMY_START]
+    enemy_y[:, :len(ENEMY_START)] = [y for _, y in ENEMY_START]
+    enemies = np.full(count, len(ENEMY_START), dtype=np.int32)
+    active = np.arange(max_enemies)[None, :] < enemies[:, None]
+
+    player_x = np.full(count, PLAYER_START[0], dtype=np.int16)
+    player_y = np.full(count, PLAYER_START[1], dtype=np.int16)
+    coins = np.broadcast_to(OPEN, (count, GRID_HEIGHT, GRID_WIDTH)).copy()
+    coins[:, PLAYER_START[1], PLAYER_START[0]] = False
+    coins_left = coins.sum(axis=(1, 2)).astype(np.int32)
+    collected = np.zeros(count, dtype=np.int32)
+    over = np.zeros(count, dtype=bool)
+    won = np.zeros(count, dtype=bool)
+    ended_at = np.full(count, -1, dtype=np.int32)
+    pointer = np.zeros(count, dtype=np.int32)
+    rng = seeds.copy()
+
+    for tick in range(int(ticks.max()) + 1):
+        # Player moves stamped with this tick, in order (several per tick are common)
+        while True:
+            pending = ~over & (pointer < move_counts)
+            pending[pending] &= move_ticks[rows[pending], pointer[pending]] == tick
+            moving = np.flatnonzero(pending)
+            if not moving.size:
+                break
+            direction = move_dirs[moving, pointer[moving]]
+            pointer[moving] += 1
+            new_x = player_x[moving] + DX[direction]
+            new_y = player_y[moving] + DY[direction]
+            passable = OPEN[new_y, new_x]
+            moving, new_x, new_y = moving[passable], new_x[passable], new_y[passable]
+            player_x[moving] = new_x
+            player_y[moving] = new_y
+
+            hit = (active[moving] & (enemy_x[moving] == new_x[:, None]) & (enemy_y[moving] == new_y[:, None])).any(axis=1)
+            over[moving[hit]] = True
+            ended_at[moving[hit]] = tick
+
+            moving, new_x, new_y = moving[~hit], new_x[~hit], new_y[~hit]
+            picked = coins[moving, new_y, new_x]
+            moving, new_x, new_y = moving[picked], new_x[picked], new_y[picked]
+            coins[moving, new_y, new_x] = False
+            collected[moving] += 1
+            coins_left[moving] -= 1
+            cleared = moving[coins_left[moving] == 0]
+            over[cleared] = True
+            won[cleared] = True
+            ended_at[cleared] = tick
+
+        stepping = np.flatnonzero(~over & (tick < ticks))
+        if not stepping.size:
+            continue
+
+        # Enemy step: move along the larger axis towards the player, else the other one
+        ex, ey = enemy_x[stepping], enemy_y[stepping]
+        px, py = player_x[stepping, None], player_y[stepping, None]
+        dx, dy = np.sign(px - ex), np.sign(py - ey)
+        horizontal = np.abs(px - ex) > np.abs(py - ey)
+        first_x = np.where(horizontal, ex + dx, ex)
+        first_y = np.where(horizontal, ey, ey + dy)
+        second_x = np.where(horizontal, ex, ex + dx)
+        second_y = np.where(horizontal, ey + dy, ey)
+        first_ok = OPEN[first_y, first_x]
+        second_ok = OPEN[second_y, second_x]
+        moved_x = np.where(first_ok, first_x, np.where(second_ok, second_x, ex))
+        moved_y = np.where(first_ok, first_y, np.where(second_ok, second_y, ey))
+        alive = active[stepping]
+        enemy_x[stepping] = np.where(alive, moved_x, ex)
+        enemy_y[stepping] = np.where(alive, moved_y, ey)
+
+        caught = (alive & (moved_x == px) & (moved_y == py)).any(axis=1)
+        over[stepping[caught]] = True
+        ended_at[stepping[caught]] = tick + 1
+
+        # Spawn on the game's PRNG every SPAWN_EVERY_TICKS steps, on a corner free of the player
+        if (tick + 1) % SPAWN_EVERY_TICKS:
+            continue
+        spawning = stepping[~caught]
+        if not spawning.size:
+            continue
+        rng[spawning] = _xorshift32(rng[spawning])
+        free = ~((CORNERS[None, :, 0] == player_x[spawning, None]) & (CORNERS[None, :, 1] == player_y[spawning, None]))
+        choice = rng[spawning] % free.sum(axis=1).astype(np.uint32)
+        corner = np.argmax(free & (np.cumsum(free, axis=1) - 1 == choice[:, None]), axis=1)
+        slot = enemies[spawning]
+        enemy_x[spawning, slot] = CORNERS[corner, 0]
+        enemy_y[spawning, slot] = CORNERS[corner, 1]
+        active[spawning, slot] = True
+        enemies[spawning] += 1
+
+    results = []
+    for row in range(count):
+        result = {
+            "score": int(collected[row]) // COINS_PER_POINT,
+            "coins": int(collected[row]),
+            "won": bool(won[row]),
+            "over": bool(over[row]),
+            "ended_at": int(ended_at[row]),
+        }
+        if not over[row]:
+            result["error"] = "Partie non terminée"
+        elif pointer[row] < move_counts[row]:
+            result["error"] = "Déplacements après la fin de partie"
+        elif ended_at[row] != ticks[row]:
+            result["error"] = "Durée de partie incohérente"
+        results.append(result)
+    return results
+
+
+def verify_batch(submissions):
+    """Check (seed, ticks, moves, claimed_score) submissions.
+
+    Returns one (ok, score, reason) tuple per submission, where ``score`` is
+    the replayed score.
+    """
+    replays = replay_batch([submission[:3] for submission in submissions])
+    verdicts = []
+    for (_, _, _, claimed), replay in zip(submissions, replays):
+        if "error" in replay:
+            verdicts.append((False, replay["score"], replay["error"]))
+        elif replay["score"] != claimed:
+            verdicts.append((False, replay["score"], "Score différent de la partie rejouée"))
+        else:
+            verdicts.append((True, replay["score"], None))
+    return verdicts
@@ -0,0 +1,106 @@
+"""Bucketing and summaries for the per-level / per-questionnaire rollups.
+
+Each ``Progress`` or ``QuestionnaireResult`` row contributes a handful of
+(metric, bucket, count, total) increments to the rollup of the day it was
+last updated. Score-writing paths add the new contribution and subtract the
+old one, so summing the rollups always matches a full scan of the tables.
+"""
+from bisect import bisect_right
+
+
+LEVEL_SCORE_EDGES = (0, 10, 25, 50, 100, 250, 500, 1000, 2000)
+QUESTIONNAIRE_PERCENT_EDGES = (0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100)
+ATTEMPT_EDGES = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100, 200)
+# A questionnaire counts as completed once half of the points are scored
+QUESTIONNAIRE_PASS_RATIO = 0.5
+
+EDGES = {
+    ("level", "score"): LEVEL_SCORE_EDGES,
+    ("questionnaire", "score"): QUESTIONNAIRE_PERCENT_EDGES,
+    ("level", "attempts"): ATTEMPT_EDGES,
+    ("questionnaire", "attempts"): ATTEMPT_EDGES,
+}
+
+
+def bucket_index(edges, value):
+    return max(0, bisect_right(edges, value) - 1)
+
+
+def level_contribution(slug, score, status, data):
+    """Return {metric: (bucket, total)} for a Progress row."""
+    score = score or 0
+    contribution = {"score": (bucket_index(LEVEL_SCORE_EDGES, score), score)}
+    if status == "termine":
+        contribution["completed"] = (0, 1)
+    if slug == "pendu_300" and isinstance(data, dict):
+        # Words played is the only per-level attempt counter we keep
+        played = len(data.get("played_ids") or data.get("played_indices") or [])
+        contribution["attempts"] = (bucket_index(ATTEMPT_EDGES, played), played)
+    return contribution
+
+
+def questionnaire_contribution(score, max_score, attempts):
+    """Return {metric: (bucket, total)} for a QuestionnaireResult row."""
+    score = score or 0
+    max_score = max_score or 0
+    attempts = attempts or 0
+    percent = round(100 * score / max_score) if max_score else 0
+    contribution = {
+        "score": (bucket_index(QUESTIONNAIRE_PERCENT_EDGES, percent), score),
+        "attempts": (bucket_index(ATTEMPT_EDGES, attempts), attempts),
+    }
+    if max_score and score >= QUESTIONNAIRE_PASS_RATIO * max_score:
+        contribution["completed"] = (0, 1)
+    return contribution
+
+
+def median_from_buckets(edges, counts):
+    total = sum(counts)
+    if not total:
+        return None
+    seen = 0
+    for edge, count in zip(edges, counts):
+        seen += count
+        if seen * 2 >= total:
+            return edge
+    return edges[-1]
+
+
+def summarize(kind, rows):
+    """Fold (ref_id, metric, bucket, count, total) rows into one summary per ref_id."""
+    summaries = {}
+    for ref_id, metric, bucket, count, total in rows:
+        summary = summaries.setdefault(ref_id, {
+            "players": 0,
+            "completed": 0,
+            "score_sum": 0,
+            "score_histogram": [0] * len(EDGES[(kind, "score")]),
+            "attempts_histogram": [0] * len(EDGES[(kind, "attempts")]),
+            "attempts_count": 0,
+            "attempts_sum": 0,
+        })
+        if metric == "score":
+            summary["players"] += count
+            summary["score_sum"] += total
+            summary["score_histogram"][bucket] += count
+        elif metric == "completed":
+            summary["completed"] += count
+        elif metric == "attempts":
+            summary["attempts_count"] += count
+            summary["attempts_sum"] += total
+            summary["attempts_histogram"][bucket] += count
+
+    score_edges = EDGES[(kind, "score")]
+    attempt_edges = EDGES[(kind, "attempts")]
+    for summary in summaries.values():
+        players = summary["players"]
+        summary["completion_rate"] = round(summary["completed"] / players, 4) if players else 0.0
+        summary["mean_score"] = round(summary["score_sum"] / players, 2) if players else 0.0
+        summary["median_attempts"] = median_from_buckets(attempt_edges, summary["attempts_histogram"])
+        summary["score_buckets"] = [
+            {"from": edge, "count": count} for edge, count in zip(score_edges, summary.pop("score_histogram"))
+        ]
+        summary["attempt_buckets"] = [
+            {"from": edge, "count": count} for edge, count in zip(attempt_edges, summary.pop("attempts_histogram"))
+        ]
+    return summaries
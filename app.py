@@ -1,13 +1,53 @@
+import csv
+import hashlib
+import io
+import json
 import os
-from datetime import datetime
-from flask import Flask, jsonify, redirect, render_template, request, session, url_for
+import random
+import threading
+import time
+from collections import defaultdict
+import click
+from datetime import datetime, timedelta
+from flask import (
+    Flask,
+    Response,
+    current_app,
+    g,
+    jsonify,
+    make_response,
+    redirect,
+    render_template,
+    request,
+    send_from_directory,
+    session,
+    stream_with_context,
+    url_for,
+)
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func, inspect, text, JSON
+from sqlalchemy import bindparam, case, cast, delete, event, func, insert, inspect, or_, select, text, update, JSON
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session as OrmSession, selectinload
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.schema import AddConstraint
 from werkzeug.security import generate_password_hash, check_password_hash
-from pendu_words import PENDU_WORDS
+import achievements
+import admission
+import ambulance_replay
+import analytics
+import attempt_log
+import db_routing
+import fragment_cache
+import jobs
+import metrics
+import query_profiler
+import question_search
+import session_claims
+import word_bank
+from live_leaderboard import LeaderboardHub
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": db_routing.RoutingSession})
 
 
 def create_app():
@@ -20,37 +60,108 @@ def create_app():
 
     app.config["SQLALCHEMY_DATABASE_URI"] = database_url or "sqlite:///protec_rescue.db"
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["QUERY_PROFILER"] = os.environ.get("QUERY_PROFILER") == "1"
+    app.config["STATIC_VERSION"], app.config["STATIC_ASSETS"] = static_manifest(app.static_folder)
+    db_routing.configure(app)
+    fragment_cache.init_app(app)
 
     db.init_app(app)
 
     with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", enable_sqlite_foreign_keys)
         db.create_all()
         ensure_avatar_column()
         ensure_role_column()
+        ensure_session_version_column()
+        ensure_search_name_column()
         ensure_locked_column()
         ensure_level_category_column()
         ensure_progress_data_column()
         ensure_bonus_points_column()
+        ensure_question_position_column()
+        # Before the foreign key migration, which reindexes after removing orphans
+        ensure_question_search_index()
+        ensure_cascading_foreign_keys()
+        ensure_user_indexes()
+        ensure_awards()
         bootstrap_levels()
+        migrate_pendu_word_ids()
         ensure_admin_account()
 
     register_routes(app)
+    register_commands(app)
+    metrics.init_app(app, db)
+    admission.init_app(app, variant=admission_variant)
+    jobs.init_app(app, db, Job)
+    start_attempt_log(app)
+    db_routing.init_app(app, db)
+    rebuild_interval = float(os.environ.get("ANALYTICS_REBUILD_INTERVAL") or 0)
+    if rebuild_interval > 0:
+        start_rollup_refresher(app, rebuild_interval)
+    verify_interval = float(os.environ.get("AMBULANCE_VERIFY_INTERVAL", 2))
+    if verify_interval > 0:
+        start_replay_verifier(app, verify_interval)
+    query_profiler.init_app(app, db)
     return app
 
 
+def static_manifest(static_folder: str):
+    """List the static files precached by the service worker, with a version hash."""
+    digest = hashlib.sha1()
+    assets = []
+    for root, _, files in sorted(os.walk(static_folder)):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, static_folder).replace(os.sep, "/")
+            stat = os.stat(path)
+            digest.update(f"{relative}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+            assets.append(f"/static/{relative}")
+    return digest.hexdigest()[:12], assets
+
+
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys (and ON DELETE CASCADE) unless asked, per connection
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def hash_password(password: str) -> str:
+    with metrics.PASSWORD_HASH_SECONDS.time(operation="hash"):
+        return generate_password_hash(password)
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), nullable=False)
+    # Lowercase, accent-free username for the admin prefix search (SQLite's
+    # lower() only folds ASCII); the default covers bulk Core inserts
+    search_name = db.Column(
+        db.String(80), default=lambda context: question_search.fold(context.get_current_parameters().get("username"))
+    )
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False, default="participant")
+    # Bumped on role or password change; signed session claims carry it
+    session_version = db.Column(db.Integer, nullable=False, default=0)
     avatar = db.Column(db.String(40), default="alpha")
     bonus_points = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    progress = db.relationship("Progress", back_populates="user", cascade="all, delete")
+    # Child rows are removed by ON DELETE CASCADE, never loaded to be deleted
+    progress = db.relationship("Progress", back_populates="user", cascade="all, delete", passive_deletes=True)
+    sync_receipts = db.relationship("SyncReceipt", cascade="all, delete", passive_deletes=True)
+    ambulance_replays = db.relationship("AmbulanceReplay", cascade="all, delete", passive_deletes=True)
 
     def verify_password(self, password: str) -> bool:
-        return check_password_hash(self.password_hash, password)
+        with metrics.PASSWORD_HASH_SECONDS.time(operation="verify"):
+            return check_password_hash(self.password_hash, password)
+
+
+@event.listens_for(User.username, "set")
+def _fold_username(user, value, oldvalue, initiator):
+    user.search_name = question_search.fold(value)
 
 
 class Level(db.Model):
@@ -62,21 +173,23 @@ class Level(db.Model):
     icon = db.Column(db.String(40), nullable=False)
     category = db.Column(db.String(20), default="mission")
     is_locked = db.Column(db.Boolean, default=False)
-    progress = db.relationship("Progress", back_populates="level", cascade="all, delete")
+    progress = db.relationship("Progress", back_populates="level", cascade="all, delete", passive_deletes=True)
 
 
 class Progress(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     score = db.Column(db.Integer, default=0)
     status = db.Column(db.String(20), default="non_commence")
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    level_id = db.Column(db.Integer, db.ForeignKey("level.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    level_id = db.Column(db.Integer, db.ForeignKey("level.id", ondelete="CASCADE"), nullable=False)
     data = db.Column(db.JSON, default={})
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     user = db.relationship("User", back_populates="progress")
     level = db.relationship("Level", back_populates="progress")
 
+    __table_args__ = (db.Index("ix_progress_user_level", "user_id", "level_id"),)
+
 
 class Questionnaire(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -84,9 +197,16 @@ class Questionnaire(db.Model):
     description = db.Column(db.Text, nullable=True)
     category = db.Column(db.String(120), nullable=False, default="Général")
     icon = db.Column(db.String(60), nullable=False, default="sparkles")
-    created_by = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    # Questionnaires outlive the account of their author
+    created_by = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="SET NULL"), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    questions = db.relationship("Question", back_populates="questionnaire", cascade="all, delete-orphan")
+    questions = db.relationship(
+        "Question",
+        back_populates="questionnaire",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="Question.position",
+    )
 
 
 class QuestionnaireResult(db.Model):
@@ -94,29 +214,136 @@ class QuestionnaireResult(db.Model):
     score = db.Column(db.Integer, default=0)
     max_score = db.Column(db.Integer, default=0)
     attempts = db.Column(db.Integer, default=0)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    questionnaire_id = db.Column(db.Integer, db.ForeignKey("questionnaire.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    questionnaire_id = db.Column(db.Integer, db.ForeignKey("questionnaire.id", ondelete="CASCADE"), nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (db.Index("ix_questionnaire_result_user", "user_id", "questionnaire_id"),)
+
 
 class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.Text, nullable=False)
     type = db.Column(db.String(20), nullable=False, default="single")
     points = db.Column(db.Integer, nullable=False, default=1)
-    questionnaire_id = db.Column(db.Integer, db.ForeignKey("questionnaire.id"), nullable=False)
+    questionnaire_id = db.Column(db.Integer, db.ForeignKey("questionnaire.id", ondelete="CASCADE"), nullable=False)
+    # Rank within the questionnaire, kept across edits (attempt bitmaps are
+    # keyed on it); positions of removed questions are never reused
+    position = db.Column(db.Integer, nullable=False)
     questionnaire = db.relationship("Questionnaire", back_populates="questions")
-    options = db.relationship("AnswerOption", back_populates="question", cascade="all, delete-orphan")
+    options = db.relationship(
+        "AnswerOption", back_populates="question", cascade="all, delete-orphan", passive_deletes=True
+    )
+
+    __table_args__ = (db.Index("ix_question_questionnaire_position", "questionnaire_id", "position"),)
 
 
 class AnswerOption(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     label = db.Column(db.String(255), nullable=False)
     is_correct = db.Column(db.Boolean, default=False)
-    question_id = db.Column(db.Integer, db.ForeignKey("question.id"), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey("question.id", ondelete="CASCADE"), nullable=False)
     question = db.relationship("Question", back_populates="options")
 
 
+class SyncReceipt(db.Model):
+    # One row per client-stamped offline event already applied, for idempotent replays
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    event_id = db.Column(db.String(64), nullable=False)
+    kind = db.Column(db.String(40), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    result = db.Column(db.JSON, default={})
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint("user_id", "event_id", name="uq_sync_receipt_event"),)
+
+
+class AmbulanceReplay(db.Model):
+    # Ambulance score waiting for (or checked by) the background replay verifier
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    seed = db.Column(db.BigInteger, nullable=False)
+    ticks = db.Column(db.Integer, nullable=False)
+    moves = db.Column(db.JSON, default=[])
+    claimed_score = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="pending", index=True)
+    verified_score = db.Column(db.Integer, nullable=True)
+    reason = db.Column(db.String(120), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    checked_at = db.Column(db.DateTime, nullable=True)
+
+
+class AnalyticsRollup(db.Model):
+    # kind is "level" or "questionnaire", ref_id the Level / Questionnaire id
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    ref_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    metric = db.Column(db.String(20), nullable=False)
+    bucket = db.Column(db.Integer, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint("kind", "ref_id", "day", "metric", "bucket", name="uq_analytics_rollup_key"),
+    )
+
+
+class QuestionnaireAttempt(db.Model):
+    # Append-only, written in batches; answers are bitmaps over question positions (see attempt_log.py)
+    id = db.Column(db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    questionnaire_id = db.Column(db.Integer, db.ForeignKey("questionnaire.id", ondelete="CASCADE"), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    score = db.Column(db.Integer, nullable=False, default=0)
+    max_score = db.Column(db.Integer, nullable=False, default=0)
+    asked = db.Column(db.LargeBinary, nullable=True)
+    correct = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_questionnaire_attempt_user", "user_id", "questionnaire_id", "id"),
+        db.Index("ix_questionnaire_attempt_questionnaire", "questionnaire_id", "day"),
+        db.Index("ix_questionnaire_attempt_day", "day"),
+    )
+
+
+class QuestionStat(db.Model):
+    # Per-question difficulty index, bumped with each batch of logged attempts
+    question_id = db.Column(db.Integer, db.ForeignKey("question.id", ondelete="CASCADE"), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Job(db.Model):
+    # Background admin task, see jobs.py; status is queued/running/succeeded/failed/cancelled
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    params = db.Column(db.JSON, default={})
+    status = db.Column(db.String(20), nullable=False, default="queued", index=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.String(500), nullable=True)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_by = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="SET NULL"), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+class Award(db.Model):
+    # Achievement earned (see achievements.RULES); user_id is NULL for team trophies
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(40), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=True, index=True)
+    earned_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # NULL owners never collide in a plain unique constraint
+    __table_args__ = (db.Index("uq_award_code_owner", "code", text("coalesce(user_id, 0)"), unique=True),)
+
+
 LEVEL_SEED = [
     {
         "slug": "arret_cardiaque",
@@ -129,7 +356,7 @@ LEVEL_SEED = [
     {
         "slug": "pendu_300",
         "name": "Challenge Lexique 300",
-        "description": "Devinez les 300 mots du secourisme. Un seul essai par mot !",
+        "description": f"Devinez les {word_bank.TOTAL} mots du secourisme. Un seul essai par mot !",
         "difficulty": "expert",
         "icon": "brain",
         "category": "minigame",
@@ -152,6 +379,41 @@ AVATAR_EMOJIS = {
     "delta": "🧭",
 }
 USER_ROLES = {"participant", "formateur", "admin"}
+# Level id -> slug, filled by bootstrap_levels() for the rollup hooks
+LEVEL_SLUGS = {}
+
+BULK_MAX_OPERATIONS = 1000
+SYNC_MAX_EVENTS = 200
+SYNC_RECEIPT_TTL = timedelta(days=30)
+REPLAY_BATCH_SIZE = 2000
+PENDU_PREFETCH_MAX = 20
+SEARCH_MAX_PER_PAGE = 50
+QUESTIONNAIRE_SAMPLE_MAX = 200
+ADMIN_USERS_PAGE = 50
+ADMIN_USERS_MAX_PAGE = 200
+ATTEMPT_MAX_ANSWERS = 1000
+ATTEMPT_HISTORY_LIMIT = 200
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+# Known achievement metrics and awards, moved by the flush hooks below
+ACHIEVEMENT_CACHE = achievements.MetricCache(ttl=float(os.environ.get("ACHIEVEMENT_CACHE_TTL", 60)))
+LEADERBOARD_HUB = LeaderboardHub(max_clients=int(os.environ.get("SSE_MAX_CLIENTS", 500)))
+metrics.REGISTRY.gauge(
+    "protec_sse_clients", "Browsers connected to the live leaderboard stream.",
+    callback=lambda: {(): LEADERBOARD_HUB.client_count},
+)
+REPLAYS_CHECKED = metrics.REGISTRY.counter(
+    "protec_ambulance_replays_total", "Ambulance games replayed by the verifier.", ("status",)
+)
+REPLAY_BATCH_SECONDS = metrics.REGISTRY.histogram(
+    "protec_ambulance_replay_batch_seconds", "Time spent replaying one batch of ambulance games."
+)
+ATTEMPTS_LOGGED = metrics.REGISTRY.counter(
+    "protec_questionnaire_attempts_logged_total", "Questionnaire attempts written to the attempt log."
+)
+AWARDS_GRANTED = metrics.REGISTRY.counter(
+    "protec_achievements_awarded_total", "Achievements awarded.", ("code",)
+)
 
 
 def ensure_avatar_column():
@@ -203,6 +465,42 @@ def ensure_role_column():
     db.session.commit()
 
 
+def ensure_session_version_column():
+    inspector = inspect(db.engine)
+    column_names = {column["name"] for column in inspector.get_columns("user")}
+    if "session_version" in column_names:
+        return
+
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        db.session.execute(text("ALTER TABLE user ADD COLUMN session_version INTEGER NOT NULL DEFAULT 0"))
+    else:
+        db.session.execute(
+            text('ALTER TABLE "user" ADD COLUMN IF NOT EXISTS session_version INTEGER NOT NULL DEFAULT 0')
+        )
+    db.session.commit()
+
+
+def ensure_search_name_column(batch_size: int = 1000):
+    inspector = inspect(db.engine)
+    column_names = {column["name"] for column in inspector.get_columns("user")}
+    if "search_name" not in column_names:
+        db.session.execute(text('ALTER TABLE "user" ADD COLUMN search_name VARCHAR(80)'))
+        db.session.commit()
+    # Accounts created before the column, or by a version that did not fill it
+    while True:
+        rows = db.session.execute(
+            select(User.id, User.username).where(User.search_name.is_(None)).limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        db.session.execute(
+            update(User.__table__).where(User.__table__.c.id == bindparam("user_id")).values(search_name=bindparam("folded")),
+            [{"user_id": user_id, "folded": question_search.fold(username)} for user_id, username in rows],
+        )
+        db.session.commit()
+
+
 def ensure_locked_column():
     inspector = inspect(db.engine)
     column_names = {column["name"] for column in inspector.get_columns("level")}
@@ -236,6 +534,178 @@ def ensure_bonus_points_column():
         db.session.commit()
 
 
+def ensure_question_position_column():
+    inspector = inspect(db.engine)
+    column_names = {column["name"] for column in inspector.get_columns("question")}
+    if "position" in column_names:
+        return
+
+    db.session.execute(text("ALTER TABLE question ADD COLUMN position INTEGER NOT NULL DEFAULT 0"))
+    # Existing banks keep their insertion order
+    db.session.execute(
+        text(
+            "UPDATE question SET position = ("
+            "SELECT COUNT(*) FROM question AS earlier "
+            "WHERE earlier.questionnaire_id = question.questionnaire_id AND earlier.id < question.id)"
+        )
+    )
+    db.session.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_question_questionnaire_position "
+            "ON question (questionnaire_id, position)"
+        )
+    )
+    db.session.commit()
+
+
+def _stale_foreign_key_tables(inspector):
+    stale = []
+    for table in db.metadata.sorted_tables:
+        expected = {fk.parent.name: (fk.ondelete or "").upper() for fk in table.foreign_keys}
+        if not expected:
+            continue
+        actual = {
+            fk["constrained_columns"][0]: ((fk.get("options") or {}).get("ondelete") or "").upper()
+            for fk in inspector.get_foreign_keys(table.name)
+        }
+        if any(actual.get(column) != action for column, action in expected.items()):
+            stale.append(table)
+    return stale
+
+
+def _rebuild_sqlite_tables(tables) -> int:
+    """Recreate tables from the models (SQLite cannot alter a foreign key)."""
+    inspector = inspect(db.engine)
+    removed = 0
+    with db.engine.connect() as connection:
+        # Both pragmas are no-ops inside a transaction: set them first
+        connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        # Keep references from other tables pointing at the original name
+        connection.exec_driver_sql("PRAGMA legacy_alter_table=ON")
+        connection.exec_driver_sql("BEGIN")
+        for table in tables:
+            old_name = f"{table.name}__old"
+            columns = ", ".join(
+                f'"{column["name"]}"' for column in inspector.get_columns(table.name) if column["name"] in table.c
+            )
+            indexes = connection.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                (table.name,),
+            ).scalars().all()
+            connection.exec_driver_sql(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"')
+            for index in indexes:
+                connection.exec_driver_sql(f'DROP INDEX "{index}"')
+            table.create(connection)
+            connection.exec_driver_sql(f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{old_name}"')
+            connection.exec_driver_sql(f'DROP TABLE "{old_name}"')
+        # Rows left behind while SQLite was not enforcing foreign keys;
+        # parents come first so orphans of orphans are caught too
+        for table in db.metadata.sorted_tables:
+            for fk in table.foreign_keys:
+                missing_parent = (
+                    f'"{fk.parent.name}" IS NOT NULL AND "{fk.parent.name}" NOT IN '
+                    f'(SELECT "{fk.column.name}" FROM "{fk.column.table.name}")'
+                )
+                if fk.ondelete == "CASCADE":
+                    result = connection.exec_driver_sql(f'DELETE FROM "{table.name}" WHERE {missing_parent}')
+                    removed += max(result.rowcount, 0)
+                elif fk.ondelete == "SET NULL":
+                    connection.exec_driver_sql(f'UPDATE "{table.name}" SET "{fk.parent.name}" = NULL WHERE {missing_parent}')
+        connection.commit()
+        connection.exec_driver_sql("PRAGMA legacy_alter_table=OFF")
+        connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+    return removed
+
+
+def _alter_postgres_foreign_keys(tables, inspector) -> None:
+    preparer = db.engine.dialect.identifier_preparer
+    for table in tables:
+        for fk in inspector.get_foreign_keys(table.name):
+            db.session.execute(
+                text(f"ALTER TABLE {preparer.quote(table.name)} DROP CONSTRAINT {preparer.quote(fk['name'])}")
+            )
+        for fk in table.foreign_keys:
+            if fk.ondelete == "SET NULL":
+                db.session.execute(
+                    text(f"ALTER TABLE {preparer.quote(table.name)} ALTER COLUMN {preparer.quote(fk.parent.name)} DROP NOT NULL")
+                )
+            db.session.execute(AddConstraint(fk.constraint))
+    db.session.commit()
+
+
+def ensure_cascading_foreign_keys():
+    # Databases created before the ondelete= declarations on the models
+    inspector = inspect(db.engine)
+    stale = _stale_foreign_key_tables(inspector)
+    if not stale:
+        return
+    if db.engine.dialect.name == "sqlite":
+        db.session.commit()
+        if _rebuild_sqlite_tables(stale):
+            # Orphans were still counted by the rollups and the search index
+            rebuild_rollups()
+            rebuild_question_index()
+    else:
+        _alter_postgres_foreign_keys(stale, inspector)
+
+
+def ensure_user_indexes():
+    # create_all() only creates indexes together with new tables
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_progress_user_level ON progress (user_id, level_id)"))
+    # Case- and accent-insensitive prefix search of the admin user list;
+    # Postgres needs text_pattern_ops for LIKE 'abc%' to use the index
+    pattern_ops = " text_pattern_ops" if db.engine.dialect.name == "postgresql" else ""
+    db.session.execute(text(f'CREATE INDEX IF NOT EXISTS ix_user_email_lower ON "user" (lower(email){pattern_ops})'))
+    db.session.execute(text(f'CREATE INDEX IF NOT EXISTS ix_user_search_name ON "user" (search_name{pattern_ops})'))
+    db.session.execute(text("DROP INDEX IF EXISTS ix_user_username_lower"))
+    db.session.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_questionnaire_result_user "
+            "ON questionnaire_result (user_id, questionnaire_id)"
+        )
+    )
+    db.session.commit()
+
+
+def ensure_question_search_index():
+    question_search.ensure_index(db.session.connection())
+    if question_search.is_empty(db.session.connection()) and db.session.query(Question.id).first() is not None:
+        rebuild_question_index()
+    db.session.commit()
+
+
+def ensure_awards():
+    # Databases created before the achievement engine: award what is already reached
+    if db.session.query(Award.id).first() is None and db.session.query(User.id).first() is not None:
+        rebuild_awards()
+
+
+def migrate_pendu_word_ids(batch_size: int = 1000):
+    # Progress rows written before word ids stored positions in the sorted word list
+    level = Level.query.filter_by(slug="pendu_300").first()
+    if not level:
+        return
+    rows = db.session.execute(
+        select(Progress.id, Progress.data).where(
+            Progress.level_id == level.id, cast(Progress.data, db.String).like('%"played_indices"%')
+        )
+    ).all()
+    updates = []
+    for progress_id, data in rows:
+        migrated = word_bank.migrate_played(data)
+        if migrated is not None:
+            updates.append({"progress_id": progress_id, "data": migrated})
+    # Played count is unchanged, so the analytics rollups stay valid
+    statement = (
+        update(Progress.__table__)
+        .where(Progress.__table__.c.id == bindparam("progress_id"))
+        .values(data=bindparam("data"))
+    )
+    for start in range(0, len(updates), batch_size):
+        db.session.execute(statement, updates[start:start + batch_size])
+    db.session.commit()
+
+
 def ensure_level_category_column():
     inspector = inspect(db.engine)
     column_names = {column["name"] for column in inspector.get_columns("level")}
@@ -255,14 +725,15 @@ def ensure_level_category_column():
 def ensure_admin_account():
     admin_email = "admin@protec.local"
     admin_user = User.query.filter_by(email=admin_email).first()
-    password_hash = generate_password_hash("admin")
 
     if admin_user:
-        admin_user.password_hash = password_hash
+        # Only write what differs: a new hash would sign the admin out at every start
+        if not admin_user.verify_password("admin"):
+            admin_user.password_hash = hash_password("admin")
         admin_user.role = "admin"
     else:
         admin_user = User(
-            username="Admin", email=admin_email, password_hash=password_hash, avatar="alpha", role="admin"
+            username="Admin", email=admin_email, password_hash=hash_password("admin"), avatar="alpha", role="admin"
         )
         db.session.add(admin_user)
     db.session.commit()
@@ -291,6 +762,702 @@ def bootstrap_levels():
             existing.category = data.get("category", "mission")
             
     db.session.commit()
+    LEVEL_SLUGS.clear()
+    LEVEL_SLUGS.update({level.id: level.slug for level in Level.query.all()})
+
+
+def level_id_for_slug(slug: str) -> int:
+    # Levels are only created by bootstrap_levels(): no query for the built-in ones
+    for level_id, level_slug in LEVEL_SLUGS.items():
+        if level_slug == slug:
+            return level_id
+    return Level.query.filter_by(slug=slug).first_or_404().id
+
+
+def _progress_contribution(level_id, score, status, data):
+    return "level", level_id, analytics.level_contribution(LEVEL_SLUGS.get(level_id), score, status, data)
+
+
+def _result_contribution(questionnaire_id, score, max_score, attempts):
+    return "questionnaire", questionnaire_id, analytics.questionnaire_contribution(score, max_score, attempts)
+
+
+def _add_contribution(deltas, contribution, day, sign):
+    kind, ref_id, metrics_ = contribution
+    if ref_id is None:
+        return
+    for metric, (bucket, total) in metrics_.items():
+        delta = deltas[(kind, ref_id, day, metric, bucket)]
+        delta[0] += sign
+        delta[1] += sign * total
+
+
+def _row_contribution(obj, values):
+    if isinstance(obj, Progress):
+        return _progress_contribution(values["level_id"], values["score"], values["status"], values["data"])
+    return _result_contribution(values["questionnaire_id"], values["score"], values["max_score"], values["attempts"])
+
+
+ROLLUP_FIELDS = {
+    Progress: ("level_id", "score", "status", "data", "updated_at"),
+    QuestionnaireResult: ("questionnaire_id", "score", "max_score", "attempts", "updated_at"),
+}
+
+
+def _committed_values(obj):
+    values = {}
+    for field in ROLLUP_FIELDS[type(obj)]:
+        history = get_history(obj, field)
+        if history.deleted:
+            values[field] = history.deleted[0]
+        elif history.unchanged:
+            values[field] = history.unchanged[0]
+        else:
+            values[field] = None
+    return values
+
+
+def _current_values(obj):
+    values = {field: getattr(obj, field) for field in ROLLUP_FIELDS[type(obj)]}
+    if isinstance(obj, Progress) and values["level_id"] is None and obj.level is not None:
+        # Foreign key not populated yet for rows built from relationships
+        values["level_id"] = obj.level.id
+    return values
+
+
+def apply_rollup_deltas(connection, deltas) -> None:
+    rows = [
+        {"kind": kind, "ref_id": ref_id, "day": day, "metric": metric, "bucket": bucket, "count": count, "total": total}
+        for (kind, ref_id, day, metric, bucket), (count, total) in deltas.items()
+        if count or total
+    ]
+    if not rows:
+        return
+    table = AnalyticsRollup.__table__
+    dialect = connection.dialect.name
+    if dialect in {"sqlite", "postgresql"}:
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        statement = upsert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=["kind", "ref_id", "day", "metric", "bucket"],
+            set_={"count": table.c.count + statement.excluded.count, "total": table.c.total + statement.excluded.total},
+        )
+        connection.execute(statement, rows)
+        return
+    for row in rows:
+        key = [table.c[name] == row[name] for name in ("kind", "ref_id", "day", "metric", "bucket")]
+        updated = connection.execute(
+            update(table).where(*key).values(count=table.c.count + row["count"], total=table.c.total + row["total"])
+        )
+        if not updated.rowcount:
+            connection.execute(table.insert(), row)
+
+
+# Everything the shared dashboard panels show; see fragment_cache
+fragment_cache.track_models(OrmSession, "dashboard", (User, Progress, QuestionnaireResult, Award))
+
+
+@event.listens_for(OrmSession, "before_flush")
+def _track_score_rollups(session, flush_context, instances):
+    # Incremental rollup refresh: move each changed row's contribution from
+    # the day it was last updated to today, in the same transaction
+    deltas = defaultdict(lambda: [0, 0])
+    today = datetime.utcnow().date()
+    with session.no_autoflush:
+        for obj in session.new:
+            if type(obj) in ROLLUP_FIELDS:
+                _add_contribution(deltas, _row_contribution(obj, _current_values(obj)), today, 1)
+        for obj in session.dirty:
+            if type(obj) in ROLLUP_FIELDS and session.is_modified(obj):
+                old = _committed_values(obj)
+                old_day = old["updated_at"].date() if old["updated_at"] else today
+                _add_contribution(deltas, _row_contribution(obj, old), old_day, -1)
+                _add_contribution(deltas, _row_contribution(obj, _current_values(obj)), today, 1)
+        for obj in session.deleted:
+            if type(obj) in ROLLUP_FIELDS:
+                old = _committed_values(obj)
+                old_day = old["updated_at"].date() if old["updated_at"] else today
+                _add_contribution(deltas, _row_contribution(obj, old), old_day, -1)
+    if deltas:
+        apply_rollup_deltas(session.connection(), deltas)
+
+
+REVOKED_SESSIONS = "revoked_sessions"
+
+
+@event.listens_for(OrmSession, "before_flush")
+def _bump_session_versions(session, flush_context, instances):
+    # A new role or password signs the account's sessions out
+    for obj in session.dirty:
+        if isinstance(obj, User) and any(
+            get_history(obj, name).has_changes() for name in ("role", "password_hash")
+        ):
+            obj.session_version = User.session_version + 1
+            session.info.setdefault(REVOKED_SESSIONS, set()).add(obj.id)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _publish_revoked_sessions(session):
+    user_ids = session.info.pop(REVOKED_SESSIONS, None)
+    if user_ids:
+        session_claims.VERSIONS.changed(user_ids)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_revoked_sessions(session):
+    session.info.pop(REVOKED_SESSIONS, None)
+
+
+def revoke_sessions(user_ids) -> None:
+    # For set-based updates and deletes, which skip the flush hook;
+    # applied to the version map once the transaction commits
+    db.session.info.setdefault(REVOKED_SESSIONS, set()).update(user_ids)
+
+
+def apply_question_stat_deltas(connection, deltas) -> None:
+    rows = [
+        {"question_id": question_id, "attempts": attempts, "correct": correct}
+        for question_id, (attempts, correct) in deltas.items()
+    ]
+    if not rows:
+        return
+    table = QuestionStat.__table__
+    dialect = connection.dialect.name
+    if dialect in {"sqlite", "postgresql"}:
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        statement = upsert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=["question_id"],
+            set_={
+                "attempts": table.c.attempts + statement.excluded.attempts,
+                "correct": table.c.correct + statement.excluded.correct,
+            },
+        )
+        connection.execute(statement, rows)
+        return
+    for row in rows:
+        updated = connection.execute(
+            update(table)
+            .where(table.c.question_id == row["question_id"])
+            .values(attempts=table.c.attempts + row["attempts"], correct=table.c.correct + row["correct"])
+        )
+        if not updated.rowcount:
+            connection.execute(table.insert(), row)
+
+
+def write_attempts(rows) -> int:
+    """Insert a batch of buffered attempts and bump the per-question difficulty counters."""
+    user_ids = {row["user_id"] for row in rows}
+    questionnaire_ids = {row["questionnaire_id"] for row in rows}
+    question_ids = {question_id for row in rows for question_id in row["answers"]}
+    # Accounts and questionnaires deleted since the attempt was buffered are skipped
+    live_users = set(db.session.execute(select(User.id).where(User.id.in_(user_ids))).scalars())
+    # Bitmap width: positions are stable, so removed questions leave gaps
+    sizes = dict(
+        db.session.execute(
+            select(Question.questionnaire_id, func.max(Question.position) + 1)
+            .where(Question.questionnaire_id.in_(questionnaire_ids))
+            .group_by(Question.questionnaire_id)
+        ).all()
+    )
+    positions = {}
+    if question_ids:
+        positions = {
+            question_id: (questionnaire_id, position)
+            for question_id, questionnaire_id, position in db.session.execute(
+                select(Question.id, Question.questionnaire_id, Question.position).where(Question.id.in_(question_ids))
+            )
+        }
+
+    attempts = []
+    deltas = defaultdict(lambda: [0, 0])
+    for row in rows:
+        size = sizes.get(row["questionnaire_id"])
+        if row["user_id"] not in live_users or not size:
+            continue
+        outcomes = {}
+        for question_id, ok in row["answers"].items():
+            # Ids of questions removed by an edit no longer resolve and are ignored
+            questionnaire_id, position = positions.get(question_id, (None, None))
+            if questionnaire_id == row["questionnaire_id"] and position < size:
+                outcomes[position] = ok
+                deltas[question_id][0] += 1
+                deltas[question_id][1] += int(ok)
+        asked, correct = attempt_log.encode_answers(outcomes, size)
+        attempts.append({
+            "user_id": row["user_id"],
+            "questionnaire_id": row["questionnaire_id"],
+            "day": row["created_at"].date(),
+            "created_at": row["created_at"],
+            "score": row["score"],
+            "max_score": row["max_score"],
+            "asked": asked,
+            "correct": correct,
+        })
+    if attempts:
+        db.session.execute(insert(QuestionnaireAttempt), attempts)
+    apply_question_stat_deltas(db.session.connection(), deltas)
+    db.session.commit()
+    ATTEMPTS_LOGGED.inc(len(attempts))
+    return len(attempts)
+
+
+def start_attempt_log(app: Flask) -> None:
+    def flush(rows):
+        with app.app_context():
+            try:
+                write_attempts(rows)
+            except Exception:
+                db.session.rollback()
+                raise
+
+    buffer = attempt_log.AttemptBuffer(
+        flush,
+        batch_size=int(os.environ.get("ATTEMPT_LOG_BATCH", 500)),
+        interval=float(os.environ.get("ATTEMPT_LOG_FLUSH_INTERVAL", 2)),
+        on_error=lambda exc: app.logger.error("Attempt log write failed: %s", exc),
+    )
+    app.extensions["attempt_log"] = buffer
+    metrics.REGISTRY.gauge(
+        "protec_attempt_log_pending", "Questionnaire attempts waiting to be written.",
+        callback=lambda: {(): buffer.pending_count},
+    )
+    metrics.REGISTRY.gauge(
+        "protec_attempt_log_dropped", "Questionnaire attempts dropped after failed writes.",
+        callback=lambda: {(): buffer.dropped},
+    )
+
+
+def serialize_attempt(attempt: QuestionnaireAttempt):
+    return {
+        "id": attempt.id,
+        "created_at": attempt.created_at.isoformat(),
+        "score": attempt.score,
+        "max_score": attempt.max_score,
+        # Positions of the questions asked (None: all of them) and answered correctly
+        "asked": None if attempt.asked is None else attempt_log.unpack_positions(attempt.asked),
+        "correct": attempt_log.unpack_positions(attempt.correct),
+    }
+
+
+def forget_user_rollups(user_ids) -> None:
+    # Set-based deletes bypass the flush hook: subtract those rows explicitly
+    deltas = defaultdict(lambda: [0, 0])
+    today = datetime.utcnow().date()
+    progress_rows = db.session.query(
+        Progress.level_id, Progress.score, Progress.status, Progress.data, Progress.updated_at
+    ).filter(Progress.user_id.in_(user_ids))
+    for level_id, score, status, data, updated_at in progress_rows:
+        contribution = _progress_contribution(level_id, score, status, data)
+        _add_contribution(deltas, contribution, updated_at.date() if updated_at else today, -1)
+    result_rows = db.session.query(
+        QuestionnaireResult.questionnaire_id,
+        QuestionnaireResult.score,
+        QuestionnaireResult.max_score,
+        QuestionnaireResult.attempts,
+        QuestionnaireResult.updated_at,
+    ).filter(QuestionnaireResult.user_id.in_(user_ids))
+    for questionnaire_id, score, max_score, attempts, updated_at in result_rows:
+        contribution = _result_contribution(questionnaire_id, score, max_score, attempts)
+        _add_contribution(deltas, contribution, updated_at.date() if updated_at else today, -1)
+    apply_rollup_deltas(db.session.connection(), deltas)
+
+
+def rebuild_rollups(batch_size: int = 5000) -> int:
+    """Recompute every rollup from Progress and QuestionnaireResult (repair path)."""
+    deltas = defaultdict(lambda: [0, 0])
+    today = datetime.utcnow().date()
+    progress_rows = db.session.execute(
+        select(Progress.level_id, Progress.score, Progress.status, Progress.data, Progress.updated_at)
+        .execution_options(yield_per=batch_size)
+    )
+    for level_id, score, status, data, updated_at in progress_rows:
+        contribution = _progress_contribution(level_id, score, status, data)
+        _add_contribution(deltas, contribution, updated_at.date() if updated_at else today, 1)
+    result_rows = db.session.execute(
+        select(
+            QuestionnaireResult.questionnaire_id,
+            QuestionnaireResult.score,
+            QuestionnaireResult.max_score,
+            QuestionnaireResult.attempts,
+            QuestionnaireResult.updated_at,
+        ).execution_options(yield_per=batch_size)
+    )
+    for questionnaire_id, score, max_score, attempts, updated_at in result_rows:
+        contribution = _result_contribution(questionnaire_id, score, max_score, attempts)
+        _add_contribution(deltas, contribution, updated_at.date() if updated_at else today, 1)
+
+    db.session.execute(delete(AnalyticsRollup))
+    apply_rollup_deltas(db.session.connection(), deltas)
+    db.session.commit()
+    return len(deltas)
+
+
+ACHIEVEMENT_DELTAS = "achievement_deltas"
+ACHIEVEMENT_STALE = "achievement_stale"
+ACHIEVEMENT_FORGET = "achievement_forget"
+ACHIEVEMENT_FIELDS = {
+    User: ("bonus_points",),
+    Progress: ("user_id", "score", "status"),
+    QuestionnaireResult: ("user_id", "score"),
+}
+
+
+def _metric_contribution(obj, values):
+    # What one row adds to the achievement metrics, keyed by (metric, owner)
+    if isinstance(obj, User):
+        contribution = {("total_rescuers", None): 1}
+        if obj.id is not None:
+            contribution[("total_score", obj.id)] = values["bonus_points"] or 0
+        return contribution
+    score = values["score"] or 0
+    contribution = {("total_score", values["user_id"]): score, ("team_score", None): score}
+    if isinstance(obj, Progress):
+        contribution[("missions_completed", None)] = int((values["status"] or "non_commence") != "non_commence")
+    return contribution
+
+
+def _add_metric_delta(deltas, obj, committed, sign):
+    values = {}
+    for field in ACHIEVEMENT_FIELDS[type(obj)]:
+        if committed:
+            history = get_history(obj, field)
+            values[field] = (history.deleted or history.unchanged or [None])[0]
+        else:
+            values[field] = getattr(obj, field)
+    for key, amount in _metric_contribution(obj, values).items():
+        deltas[key] += sign * amount
+
+
+@event.listens_for(OrmSession, "before_flush")
+def _track_achievement_metrics(session, flush_context, instances):
+    # Deltas of the cached achievement metrics, applied once the write commits
+    deltas = session.info.setdefault(ACHIEVEMENT_DELTAS, defaultdict(int))
+    with session.no_autoflush:
+        for obj in session.new:
+            if type(obj) in ACHIEVEMENT_FIELDS:
+                if isinstance(obj, User) or obj.user_id is not None:
+                    _add_metric_delta(deltas, obj, False, 1)
+                else:
+                    session.info[ACHIEVEMENT_STALE] = True
+        for obj in session.dirty:
+            if type(obj) in ACHIEVEMENT_FIELDS and session.is_modified(obj):
+                _add_metric_delta(deltas, obj, True, -1)
+                _add_metric_delta(deltas, obj, False, 1)
+        for obj in session.deleted:
+            if isinstance(obj, (User, Level, Questionnaire)):
+                # Their progress, results and awards go with ON DELETE CASCADE, out of sight
+                session.info[ACHIEVEMENT_STALE] = True
+                if isinstance(obj, User):
+                    session.info.setdefault(ACHIEVEMENT_FORGET, set()).add(obj.id)
+            elif type(obj) in ACHIEVEMENT_FIELDS:
+                _add_metric_delta(deltas, obj, True, -1)
+
+
+@event.listens_for(OrmSession, "do_orm_execute")
+def _track_achievement_statements(orm_execute_state):
+    # Set-based writes skip the flush: their deltas are unknown
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table in {User.__table__, Progress.__table__, QuestionnaireResult.__table__}:
+            orm_execute_state.session.info[ACHIEVEMENT_STALE] = True
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _apply_achievement_deltas(session):
+    deltas = session.info.pop(ACHIEVEMENT_DELTAS, None)
+    forgotten = session.info.pop(ACHIEVEMENT_FORGET, None)
+    if forgotten:
+        ACHIEVEMENT_CACHE.forget(forgotten)
+    if session.info.pop(ACHIEVEMENT_STALE, False):
+        ACHIEVEMENT_CACHE.invalidate()
+    elif deltas:
+        ACHIEVEMENT_CACHE.apply({key: delta for key, delta in deltas.items() if delta})
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_achievement_deltas(session):
+    for key in (ACHIEVEMENT_DELTAS, ACHIEVEMENT_STALE, ACHIEVEMENT_FORGET):
+        session.info.pop(key, None)
+
+
+def achievement_team_metrics(names):
+    expressions = {
+        "missions_completed": select(func.count(Progress.id))
+        .where(Progress.status != "non_commence")
+        .scalar_subquery(),
+        "total_rescuers": select(func.count(User.id)).scalar_subquery(),
+        "team_score": select(func.coalesce(func.sum(Progress.score), 0)).scalar_subquery()
+        + select(func.coalesce(func.sum(QuestionnaireResult.score), 0)).scalar_subquery(),
+    }
+    names = sorted(names)
+    row = db.session.execute(select(*(expressions[name] for name in names))).one()
+    return {name: int(value or 0) for name, value in zip(names, row)}
+
+
+def achievement_user_metric(name, user_ids, minimum):
+    # The only per-player metric is the total score: missions + quiz + bonus points
+    mission_score = (
+        select(func.coalesce(func.sum(Progress.score), 0)).where(Progress.user_id == User.id).scalar_subquery()
+    )
+    quiz_score = (
+        select(func.coalesce(func.sum(QuestionnaireResult.score), 0))
+        .where(QuestionnaireResult.user_id == User.id)
+        .scalar_subquery()
+    )
+    total = mission_score + quiz_score + func.coalesce(User.bonus_points, 0)
+    statement = select(User.id, total)
+    if minimum is not None:
+        statement = statement.where(total >= minimum)
+    if user_ids is not None:
+        statement = statement.where(User.id.in_(user_ids))
+    return {user_id: int(value) for user_id, value in db.session.execute(statement)}
+
+
+def grant_awards(reached, batch_size: int = 5000) -> int:
+    if not reached:
+        return 0
+    now = datetime.utcnow()
+    rows = [{"code": rule.code, "user_id": owner, "earned_at": now} for rule, owner in reached]
+    try:
+        # Table insert: one executemany for team and player rows alike
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(insert(Award.__table__), rows[start:start + batch_size])
+        db.session.commit()
+    except IntegrityError:
+        # Awarded meanwhile by a concurrent request; the next event reloads
+        # these owners' awards and retries the rest
+        db.session.rollback()
+        ACHIEVEMENT_CACHE.forget({owner for _, owner in reached})
+        return 0
+    ACHIEVEMENT_CACHE.add_awards((rule.code, owner) for rule, owner in reached)
+    for rule, _ in reached:
+        AWARDS_GRANTED.inc(code=rule.code)
+    return len(rows)
+
+
+def cached_team_metrics(names):
+    values = {name: ACHIEVEMENT_CACHE.value(name) for name in names}
+    if any(value is None for value in values.values()):
+        # Every team metric comes from the same single query
+        names = {rule.metric for rule in achievements.team_rules()}
+        versions = ACHIEVEMENT_CACHE.versions([(name, None) for name in names])
+        read = achievement_team_metrics(names)
+        ACHIEVEMENT_CACHE.store({(name, None): value for name, value in read.items()}, versions)
+        values = {name: read[name] for name in values}
+    return values
+
+
+def cached_user_metric(name, user_ids, minimum):
+    values = {user_id: ACHIEVEMENT_CACHE.value(name, user_id) for user_id in user_ids}
+    missing = [user_id for user_id, value in values.items() if value is None]
+    if missing:
+        versions = ACHIEVEMENT_CACHE.versions([(name, user_id) for user_id in missing])
+        read = achievement_user_metric(name, missing, None)
+        read = {user_id: read.get(user_id, 0) for user_id in missing}
+        ACHIEVEMENT_CACHE.store({(name, user_id): value for user_id, value in read.items()}, versions)
+        values.update(read)
+    return {user_id: value for user_id, value in values.items() if value >= minimum}
+
+
+def award_achievements(user_ids, event: str) -> int:
+    """Evaluate the rules ``event`` can move for these players and store new awards."""
+    user_ids = list(user_ids)
+    rules = achievements.rules_for_event(event)
+    if not rules or not user_ids:
+        return 0
+    # Rules still below their threshold, or already earned, cost no query
+    rules, user_ids = ACHIEVEMENT_CACHE.reachable(rules, user_ids)
+    if not rules:
+        return 0
+    owners = [None, *user_ids]
+    unknown = ACHIEVEMENT_CACHE.unknown_owners(owners)
+    if unknown:
+        # Every award of these owners, loaded once per process
+        conditions = [Award.user_id.in_([owner for owner in unknown if owner is not None])]
+        if None in unknown:
+            conditions.append(Award.user_id.is_(None))
+        pairs = db.session.execute(select(Award.code, Award.user_id).where(or_(*conditions))).all()
+        ACHIEVEMENT_CACHE.learn_awards(unknown, pairs)
+    earned = ACHIEVEMENT_CACHE.earned(owners)
+    return grant_awards(achievements.evaluate(rules, earned, user_ids, cached_team_metrics, cached_user_metric))
+
+
+def rebuild_awards() -> int:
+    """Award every rule already reached (repair path); earned awards are kept."""
+    earned = set(db.session.execute(select(Award.code, Award.user_id)).all())
+    return grant_awards(
+        achievements.evaluate(achievements.RULES, earned, None, achievement_team_metrics, achievement_user_metric)
+    )
+
+
+def load_awards(user_ids=None):
+    """{user_id: {code: earned_at}}; every award, team ones under None, when ``user_ids`` is None."""
+    statement = select(Award.user_id, Award.code, Award.earned_at)
+    if user_ids is not None:
+        statement = statement.where(Award.user_id.in_(user_ids))
+    awards = defaultdict(dict)
+    for user_id, code, earned_at in db.session.execute(statement):
+        awards[user_id][code] = earned_at
+    return awards
+
+
+def team_trophies(earned):
+    return [
+        {
+            "icon": rule.icon,
+            "title": rule.label,
+            "description": rule.description,
+            "earned": rule.code in earned,
+            "earned_at": earned[rule.code].isoformat() if rule.code in earned else None,
+        }
+        for rule in achievements.team_rules()
+    ]
+
+
+def question_documents(connection, question_ids):
+    """Build the search documents of the given questions (missing ids are skipped)."""
+    rows = connection.execute(
+        select(Question.id, Question.questionnaire_id, Question.text, Questionnaire.title, Questionnaire.category)
+        .join(Questionnaire, Question.questionnaire_id == Questionnaire.id)
+        .where(Question.id.in_(question_ids))
+    ).all()
+    labels = defaultdict(list)
+    for question_id, label in connection.execute(
+        select(AnswerOption.question_id, AnswerOption.label)
+        .where(AnswerOption.question_id.in_(question_ids))
+        .order_by(AnswerOption.id)
+    ):
+        labels[question_id].append(label)
+    return [
+        {
+            "id": question_id,
+            "questionnaire_id": questionnaire_id,
+            "text": question_text,
+            "options": " ".join(labels[question_id]),
+            "title": title,
+            "category": category or "",
+        }
+        for question_id, questionnaire_id, question_text, title, category in rows
+    ]
+
+
+def reindex_questions(connection, question_ids) -> None:
+    question_ids = sorted(question_ids)
+    for start in range(0, len(question_ids), 500):
+        chunk = question_ids[start:start + 500]
+        question_search.delete_questions(connection, chunk)
+        question_search.index_documents(connection, question_documents(connection, chunk))
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _track_question_index(session, flush_context):
+    # Keep the full-text index in the same transaction as the question bank
+    stale = set()
+    removed = set()
+    removed_questionnaires = set()
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, Question):
+                stale.add(obj.id)
+            elif isinstance(obj, AnswerOption):
+                stale.add(obj.question_id)
+        for obj in session.dirty:
+            if not session.is_modified(obj):
+                continue
+            if isinstance(obj, Question):
+                stale.add(obj.id)
+            elif isinstance(obj, AnswerOption):
+                stale.add(obj.question_id)
+            elif isinstance(obj, Questionnaire) and any(
+                get_history(obj, field).has_changes() for field in ("title", "category")
+            ):
+                stale.update(session.execute(select(Question.id).where(Question.questionnaire_id == obj.id)).scalars())
+        for obj in session.deleted:
+            if isinstance(obj, Question):
+                removed.add(obj.id)
+            elif isinstance(obj, AnswerOption):
+                stale.add(obj.question_id)
+            elif isinstance(obj, Questionnaire):
+                removed_questionnaires.add(obj.id)
+    if not (stale or removed or removed_questionnaires):
+        return
+    connection = session.connection()
+    question_search.delete_questionnaires(connection, removed_questionnaires)
+    question_search.delete_questions(connection, removed)
+    reindex_questions(connection, stale - removed - {None})
+
+
+def rebuild_question_index(batch_size: int = 2000) -> int:
+    """Rebuild the whole full-text index (after bulk Core inserts or as a repair)."""
+    connection = db.session.connection()
+    connection.execute(text(f"DELETE FROM {question_search.TABLE}"))
+    indexed = 0
+    last_id = 0
+    while True:
+        ids = db.session.execute(
+            select(Question.id).where(Question.id > last_id).order_by(Question.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        question_search.index_documents(connection, question_documents(connection, ids))
+        indexed += len(ids)
+        last_id = ids[-1]
+    db.session.commit()
+    return indexed
+
+
+def analytics_report(since=None):
+    query = db.session.query(
+        AnalyticsRollup.kind,
+        AnalyticsRollup.ref_id,
+        AnalyticsRollup.metric,
+        AnalyticsRollup.bucket,
+        func.sum(AnalyticsRollup.count),
+        func.sum(AnalyticsRollup.total),
+    )
+    if since:
+        query = query.filter(AnalyticsRollup.day >= since)
+    rows = query.group_by(
+        AnalyticsRollup.kind, AnalyticsRollup.ref_id, AnalyticsRollup.metric, AnalyticsRollup.bucket
+    ).all()
+    level_summaries = analytics.summarize("level", [row[1:] for row in rows if row[0] == "level"])
+    questionnaire_summaries = analytics.summarize("questionnaire", [row[1:] for row in rows if row[0] == "questionnaire"])
+    return {
+        "since": since.isoformat() if since else None,
+        "levels": [
+            {"id": level.id, "slug": level.slug, "name": level.name, **level_summaries[level.id]}
+            for level in Level.query.order_by(Level.id)
+            if level.id in level_summaries
+        ],
+        "questionnaires": [
+            {"id": q_id, "title": title, "category": category, **questionnaire_summaries[q_id]}
+            for q_id, title, category in db.session.query(Questionnaire.id, Questionnaire.title, Questionnaire.category)
+            .filter(Questionnaire.id.in_(questionnaire_summaries))
+            .order_by(Questionnaire.id)
+        ],
+    }
+
+
+def start_rollup_refresher(app: Flask, interval: float) -> None:
+    # Queues a re-aggregation job; a job still queued or running is not doubled
+    def refresh():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    app.extensions["jobs"].submit("analytics_rebuild")
+                except Exception:
+                    app.logger.exception("Could not queue the analytics re-aggregation")
+                    db.session.rollback()
+
+    threading.Thread(target=refresh, name="analytics-refresher", daemon=True).start()
 
 
 def serialize_progress(progress: Progress):
@@ -367,6 +1534,53 @@ def serialize_questionnaire(questionnaire: Questionnaire, include_questions: boo
     return data
 
 
+def build_answer_options(q_type: str, options) -> list:
+    if q_type in {"single", "multiple"}:
+        # For single-choice, only the first marked option is kept as correct
+        built = []
+        seen_correct = False
+        for opt in options:
+            label = (opt.get("label") or "").strip()
+            if not label:
+                continue
+            is_correct = bool(opt.get("is_correct")) and (q_type == "multiple" or not seen_correct)
+            if is_correct and q_type == "single":
+                seen_correct = True
+            built.append(AnswerOption(label=label, is_correct=is_correct))
+        return built
+    if q_type == "text":
+        text_option = next(
+            ((opt.get("label") or "").strip() for opt in options if (opt.get("label") or "").strip()),
+            None,
+        )
+        if text_option:
+            return [AnswerOption(label=text_option, is_correct=True)]
+    return []
+
+
+def sample_seed(user_id: int, questionnaire_id: int, seed: str) -> int:
+    # Same user, questionnaire and seed -> same draw, on any process
+    digest = hashlib.sha256(f"{user_id}:{questionnaire_id}:{seed}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def sample_questions(questionnaire_id: int, size: int, seed: int):
+    """Draw ``size`` questions without loading the bank: returns (bank_size, questions in draw order)."""
+    # Only the positions are read: the bank can have gaps left by edits
+    bank = db.session.execute(
+        select(Question.position).where(Question.questionnaire_id == questionnaire_id).order_by(Question.position)
+    ).scalars().all()
+    bank_size = len(bank)
+    positions = random.Random(seed).sample(bank, min(size, bank_size))
+    if not positions:
+        return bank_size, []
+    questions = Question.query.options(selectinload(Question.options)).filter(
+        Question.questionnaire_id == questionnaire_id, Question.position.in_(positions)
+    ).all()
+    by_position = {question.position: question for question in questions}
+    return bank_size, [by_position[position] for position in positions if position in by_position]
+
+
 def serialize_questionnaire_result(result: QuestionnaireResult):
     if not result:
         return None
@@ -379,113 +1593,713 @@ def serialize_questionnaire_result(result: QuestionnaireResult):
     }
 
 
-def current_user():
+def session_user():
+    """Signed claims (id, role) of the signed-in user, or None.
+
+    Fresh claims are trusted without reading the ``user`` table. Expired
+    ones, or ones whose version this process saw change, are checked against
+    the account and reissued; an outdated version or a deleted account signs
+    the session out.
+    """
+    if "session_user" in g:
+        return g.session_user
     user_id = session.get("user_id")
+    claims = session_claims.read(session)
     if not user_id:
+        claims = None
+    elif not (
+        claims
+        and claims.id == user_id
+        and claims.fresh
+        and session_claims.VERSIONS.accepts(user_id, claims.version)
+    ):
+        user = db.session.get(User, user_id)
+        if user is None or (claims and claims.id == user_id and claims.version != user.session_version):
+            session_claims.clear(session)
+            claims = None
+        else:
+            claims = session_claims.issue(session, user.id, user.role, user.session_version)
+            g.user = user
+    g.session_user = claims
+    return claims
+
+
+def admission_variant(endpoint: str) -> str:
+    # Designers list every question with its options; read from the claims, no query
+    if endpoint == "api_questionnaires":
+        claims = session_claims.read(session)
+        if claims and claims.role in {"admin", "formateur"}:
+            return "api_questionnaires_designer"
+    return endpoint
+
+
+def current_user():
+    # The full account, for the views that display it
+    claims = session_user()
+    if claims is None:
         return None
-    return User.query.get(user_id)
+    if "user" not in g:
+        g.user = db.session.get(User, claims.id)
+    return g.user
 
-def get_user_badges(points):
-    badges = []
-    if points >= 1000:
-        badges.append({"icon": "🥇", "label": "Or", "threshold": 1000})
-    elif points >= 500:
-        badges.append({"icon": "🥈", "label": "Argent", "threshold": 500})
-    elif points >= 200:
-        badges.append({"icon": "🥉", "label": "Bronze", "threshold": 200})
-    return badges
 
+def sign_in(user: User) -> None:
+    session["user_id"] = user.id
+    session_claims.issue(session, user.id, user.role, user.session_version)
+    g.pop("session_user", None)
 
-def register_routes(app: Flask) -> None:
-    def build_dashboard_context(user: User):
-        progress_map = {p.level_id: serialize_progress(p) for p in (user.progress if user else [])}
-        levels = [serialize_level(level, progress_map.get(level.id)) for level in Level.query.all()]
-
-        missions_completed = Progress.query.filter(Progress.status != "non_commence").count()
-        total_rescuers = User.query.count()
-        progress_scores = (
-            db.session.query(
-                Progress.user_id.label("user_id"),
-                func.count(Progress.id).label("missions"),
-                func.coalesce(func.sum(Progress.score), 0).label("mission_score"),
-            )
-            .group_by(Progress.user_id)
-            .subquery()
+
+def sign_out() -> None:
+    session_claims.clear(session)
+    g.pop("session_user", None)
+    g.pop("user", None)
+
+def build_dashboard_levels(user: User):
+    # Load levels first so progress.level resolves from the identity map
+    all_levels = Level.query.all()
+    progress_map = {p.level_id: serialize_progress(p) for p in (user.progress if user else [])}
+    return [serialize_level(level, progress_map.get(level.id)) for level in all_levels]
+
+
+def build_dashboard_stats():
+    counts = achievement_team_metrics({"missions_completed", "total_rescuers"})
+    missions_completed, total_rescuers = counts["missions_completed"], counts["total_rescuers"]
+    progress_scores = (
+        db.session.query(
+            Progress.user_id.label("user_id"),
+            func.count(Progress.id).label("missions"),
+            func.coalesce(func.sum(Progress.score), 0).label("mission_score"),
+        )
+        .group_by(Progress.user_id)
+        .subquery()
+    )
+
+    questionnaire_scores = (
+        db.session.query(
+            QuestionnaireResult.user_id.label("user_id"),
+            func.coalesce(func.sum(QuestionnaireResult.score), 0).label("quiz_score"),
         )
+        .group_by(QuestionnaireResult.user_id)
+        .subquery()
+    )
+
+    leaderboard_rows = (
+        db.session.query(
+            User.id,
+            User.username,
+            User.avatar,
+            func.coalesce(progress_scores.c.missions, 0),
+            func.coalesce(progress_scores.c.mission_score, 0),
+            func.coalesce(questionnaire_scores.c.quiz_score, 0),
+            func.coalesce(User.bonus_points, 0),
+        )
+        .outerjoin(progress_scores, User.id == progress_scores.c.user_id)
+        .outerjoin(questionnaire_scores, User.id == questionnaire_scores.c.user_id)
+        .order_by((func.coalesce(progress_scores.c.mission_score, 0) + func.coalesce(questionnaire_scores.c.quiz_score, 0)).desc())
+        .all()
+    )
+    awards = load_awards()
+    leaderboard = []
+    for row in leaderboard_rows:
+        # score is mission + quiz + bonus points, all fetched by the query above
+        base_score = int((row[4] or 0) + (row[5] or 0))
+        total_score = base_score + int(row[6] or 0)
+        
+        leaderboard.append({
+            "user_id": row[0],
+            "username": row[1],
+            "avatar": row[2] or "alpha",
+            "missions": row[3],
+            "score": total_score,
+            "badges": achievements.displayed_badges(awards.get(row[0], {})),
+        })
+    trophies = team_trophies(awards.get(None, {}))
+    dashboard_stats = {
+        "missions_completed": missions_completed,
+        "total_rescuers": total_rescuers,
+        "leaderboard": leaderboard,
+        "trophies": trophies,
+        "trophies_unlocked": sum(1 for trophy in trophies if trophy["earned"]),
+    }
+    return dashboard_stats
+
+
+def leaderboard_entry(user_id: int):
+    missions = select(func.count(Progress.id)).where(Progress.user_id == User.id).scalar_subquery()
+    mission_score = (
+        select(func.coalesce(func.sum(Progress.score), 0)).where(Progress.user_id == User.id).scalar_subquery()
+    )
+    quiz_score = (
+        select(func.coalesce(func.sum(QuestionnaireResult.score), 0))
+        .where(QuestionnaireResult.user_id == User.id)
+        .scalar_subquery()
+    )
+    row = (
+        db.session.query(User.id, User.username, User.avatar, missions, mission_score, quiz_score, User.bonus_points)
+        .filter(User.id == user_id)
+        .first()
+    )
+    if not row:
+        return None
+    total_score = int((row[4] or 0) + (row[5] or 0) + (row[6] or 0))
+    return {
+        "user_id": row[0],
+        "username": row[1],
+        "avatar": row[2] or "alpha",
+        "missions": row[3],
+        "score": total_score,
+        "badges": achievements.displayed_badges(load_awards([user_id]).get(user_id, {})),
+    }
 
-        questionnaire_scores = (
-            db.session.query(
-                QuestionnaireResult.user_id.label("user_id"),
-                func.coalesce(func.sum(QuestionnaireResult.score), 0).label("quiz_score"),
+
+def export_columns(level_slugs):
+    columns = ["id", "username", "email", "role", "created_at", "bonus_points"]
+    for slug in level_slugs:
+        columns += [f"{slug}_score", f"{slug}_status"]
+    return columns + ["quiz_completed", "quiz_score", "quiz_max_score", "total_score"]
+
+
+def iter_score_export(batch_size: int = 1000):
+    """Yield (columns, rows) for every user with per-level and questionnaire totals.
+
+    Correlated subqueries on the (user_id, ...) indexes keep the statement
+    streamable: rows come back in id order through a server-side cursor
+    instead of being materialized first.
+    """
+    levels = Level.query.order_by(Level.id).all()
+    level_columns = []
+    for level in levels:
+        for attribute in (Progress.score, Progress.status):
+            level_columns.append(
+                select(attribute)
+                .where(Progress.user_id == User.id, Progress.level_id == level.id)
+                .limit(1)
+                .scalar_subquery()
             )
-            .group_by(QuestionnaireResult.user_id)
-            .subquery()
+    quiz_filter = QuestionnaireResult.user_id == User.id
+    statement = select(
+        User.id,
+        User.username,
+        User.email,
+        User.role,
+        User.created_at,
+        func.coalesce(User.bonus_points, 0),
+        *level_columns,
+        select(func.count(QuestionnaireResult.id)).where(quiz_filter).scalar_subquery(),
+        select(func.coalesce(func.sum(QuestionnaireResult.score), 0)).where(quiz_filter).scalar_subquery(),
+        select(func.coalesce(func.sum(QuestionnaireResult.max_score), 0)).where(quiz_filter).scalar_subquery(),
+    ).order_by(User.id)
+
+    columns = export_columns([level.slug for level in levels])
+    yield columns
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    for row in result:
+        row = list(row)
+        row[4] = row[4].isoformat() if row[4] else None
+        level_scores = row[6:6 + 2 * len(levels):2]
+        quiz_score = row[-2]
+        row.append(int(row[5] + sum(score or 0 for score in level_scores) + quiz_score))
+        yield row
+
+
+def stream_export(rows, export_format: str, chunk_rows: int = 500):
+    columns = next(rows)
+    buffer = io.StringIO()
+    if export_format == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        if export_format == "csv":
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+            buffer.write("\n")
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def prefix_match(expression, prefix: str):
+    """``expression`` starts with ``prefix``, in a form the expression index can serve."""
+    if db.engine.dialect.name == "postgresql":
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return expression.like(escaped + "%", escape="\\")
+    # SQLite never uses an expression index for LIKE: use the equivalent range
+    return (expression >= prefix) & (expression < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def admin_users_page(query: str, limit: int, after=None):
+    """Newest users first, optionally filtered by a username or e-mail prefix (case and accents ignored)."""
+    users = User.query
+    if query:
+        users = users.filter(
+            prefix_match(User.search_name, question_search.fold(query) or query.lower())
+            | prefix_match(func.lower(User.email), query.lower())
         )
+    if after:
+        users = users.filter(User.id < after)
+    return users.order_by(User.id.desc()).limit(limit).all()
 
-        leaderboard_rows = (
-            db.session.query(
-                User.id,
-                User.username,
-                User.avatar,
-                func.coalesce(progress_scores.c.missions, 0),
-                func.coalesce(progress_scores.c.mission_score, 0),
-                func.coalesce(questionnaire_scores.c.quiz_score, 0),
-            )
-            .outerjoin(progress_scores, User.id == progress_scores.c.user_id)
-            .outerjoin(questionnaire_scores, User.id == questionnaire_scores.c.user_id)
-            .order_by((func.coalesce(progress_scores.c.mission_score, 0) + func.coalesce(questionnaire_scores.c.quiz_score, 0)).desc())
-            .all()
+
+def delete_users(user_ids) -> None:
+    # Progress, results, sync receipts and replays go with ON DELETE CASCADE
+    user_ids = list(user_ids)
+    forget_user_rollups(user_ids)
+    revoke_sessions(user_ids)
+    ACHIEVEMENT_CACHE.forget(user_ids)
+    db.session.execute(delete(User).where(User.id.in_(user_ids)), execution_options={"synchronize_session": False})
+
+
+def record_score_change(user_ids) -> None:
+    # Called once after a score-writing commit: award what the new scores
+    # reached, then push the leaderboard entries
+    user_ids = list(user_ids)
+    award_achievements(user_ids, achievements.SCORE)
+    for user_id in user_ids:
+        publish_score_change(user_id)
+
+
+def publish_score_change(user_id: int) -> None:
+    # Skipped when nobody listens
+    if not LEADERBOARD_HUB.has_subscribers:
+        return
+    entry = leaderboard_entry(user_id)
+    if entry:
+        LEADERBOARD_HUB.publish(entry)
+
+
+def _user_progress(user: User, level: Level, **defaults):
+    progress = Progress.query.filter_by(user_id=user.id, level_id=level.id).first()
+    if not progress:
+        progress = Progress(user_id=user.id, level=level, **defaults)
+        db.session.add(progress)
+    return progress
+
+
+def parse_score(value) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        raise ValueError("Score invalide") from None
+
+
+def apply_level_progress(user: User, level: Level, status, score) -> Progress:
+    # Parsed before the row is touched: a rejected sync event must not write
+    score = parse_score(score)
+    status = status or "en_cours"
+    if not isinstance(status, str) or len(status) > 20:
+        raise ValueError("Statut invalide")
+    progress = _user_progress(user, level)
+    progress.status = status
+    progress.score = max(progress.score or 0, score)
+    return progress
+
+
+def apply_ambulance_score(user: User, score) -> Progress:
+    score = parse_score(score)
+    level = Level.query.filter_by(slug="ambulance_chase").first_or_404()
+    progress = _user_progress(user, level, status="en_cours")
+    # Update score if new score is higher
+    if score > (progress.score or 0):
+        progress.score = score
+        progress.status = "termine"
+    return progress
+
+
+def queue_ambulance_replay(user: User, score, replay) -> AmbulanceReplay:
+    """Store a score with its input log; it is credited once the replay matches."""
+    seed, ticks, moves = ambulance_replay.parse_log(replay)
+    submission = AmbulanceReplay(
+        user_id=user.id, seed=seed, ticks=ticks, moves=moves, claimed_score=parse_score(score)
+    )
+    db.session.add(submission)
+    return submission
+
+
+def submit_ambulance_score(user: User, payload: dict):
+    if payload.get("replay") is not None:
+        queue_ambulance_replay(user, payload.get("score"), payload["replay"])
+        best_score = (
+            db.session.query(Progress.score)
+            .join(Level)
+            .filter(Progress.user_id == user.id, Level.slug == "ambulance_chase")
+            .scalar()
+        ) or 0
+        return {"score": best_score, "best_score": best_score, "pending": True}
+    if os.environ.get("AMBULANCE_REPLAY_REQUIRED") == "1":
+        raise ValueError("Journal de partie requis")
+    progress = apply_ambulance_score(user, payload.get("score", 0))
+    return {"score": progress.score, "best_score": progress.score}
+
+
+def verify_pending_replays(limit: int = REPLAY_BATCH_SIZE) -> dict:
+    """Replay one batch of pending ambulance games and credit the valid scores."""
+    submissions = (
+        AmbulanceReplay.query.filter_by(status="pending")
+        .order_by(AmbulanceReplay.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not submissions:
+        return {"verified": 0, "rejected": 0}
+
+    with REPLAY_BATCH_SECONDS.time():
+        verdicts = ambulance_replay.verify_batch(
+            [(s.seed, s.ticks, [tuple(move) for move in s.moves or []], s.claimed_score) for s in submissions]
         )
-        leaderboard = []
-        for row in leaderboard_rows:
-            # score is mission + quiz. We need to fetch bonus points separately or include it in the query.
-            # Simplified approach: fetch user object or trust the query. 
-            # The query above DOES NOT include bonus points. Let's fix the query or the loop.
-            # Re-fetching user for simplicity as this is low traffic app.
-            u = User.query.filter_by(username=row[1]).first()
-            bonus = u.bonus_points if u else 0
-            
-            base_score = int((row[4] or 0) + (row[5] or 0))
-            total_score = base_score + bonus
-            
-            leaderboard.append({
-                "username": row[1],
-                "avatar": row[2] or "alpha",
-                "missions": row[3],
-                "score": total_score,
-                "badges": get_user_badges(total_score)
-            })
-        trophies = [
-            {
-                "icon": "🏅",
-                "title": "Éclaireur",
-                "description": "3 missions activées",
-                "earned": missions_completed >= 3,
-            },
-            {
-                "icon": "🚑",
-                "title": "Chef d'équipe",
-                "description": "Plus de 5 secouristes inscrits",
-                "earned": total_rescuers >= 5,
-            },
-            {
-                "icon": "🎯",
-                "title": "Précision",
-                "description": "Score cumulé supérieur à 200",
-                "earned": sum((item[4] or 0) + (item[5] or 0) for item in leaderboard_rows) >= 200,
-            },
-        ]
-        dashboard_stats = {
-            "missions_completed": missions_completed,
-            "total_rescuers": total_rescuers,
-            "leaderboard": leaderboard,
-            "trophies": trophies,
-            "trophies_unlocked": sum(1 for trophy in trophies if trophy["earned"]),
-        }
-        return {"levels": levels, "user": user, "dashboard_stats": dashboard_stats}
 
+    now = datetime.utcnow()
+    best = {}
+    counts = {"verified": 0, "rejected": 0}
+    for submission, (ok, score, reason) in zip(submissions, verdicts):
+        submission.status = "verified" if ok else "rejected"
+        submission.verified_score = score
+        submission.reason = reason
+        submission.checked_at = now
+        counts[submission.status] += 1
+        if ok:
+            best[submission.user_id] = max(best.get(submission.user_id, 0), score)
+
+    for user in User.query.filter(User.id.in_(best)):
+        apply_ambulance_score(user, best[user.id])
+    db.session.commit()
+    for status, value in counts.items():
+        REPLAYS_CHECKED.inc(value, status=status)
+    record_score_change(best)
+    return counts
+
+
+def start_replay_verifier(app: Flask, interval: float) -> None:
+    # Started by the first request served, not by create_app(): CLI commands
+    # and scripts that only import the app get no background thread
+    started = threading.Event()
+    lock = threading.Lock()
+
+    def verify():
+        while True:
+            with app.app_context():
+                try:
+                    # Keep draining while full batches come back
+                    while sum(verify_pending_replays().values()) >= REPLAY_BATCH_SIZE:
+                        pass
+                except Exception:
+                    app.logger.exception("Ambulance replay verification failed")
+                    db.session.rollback()
+            time.sleep(interval)
+
+    @app.before_request
+    def _start_replay_verifier():
+        if started.is_set():
+            return
+        with lock:
+            if started.is_set():
+                return
+            started.set()
+        threading.Thread(target=verify, name="ambulance-replay-verifier", daemon=True).start()
+
+
+def job_export_dir() -> str:
+    path = os.environ.get("JOB_EXPORT_DIR") or os.path.join(current_app.instance_path, "exports")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@jobs.job("analytics_rebuild", "Recalcul des agrégats d'analyse", exclusive=True)
+def analytics_rebuild_job(ctx):
+    return {"rollups": rebuild_rollups()}
+
+
+@jobs.job("search_reindex", "Réindexation de la banque de questions", exclusive=True)
+def search_reindex_job(ctx):
+    return {"questions": rebuild_question_index()}
+
+
+@jobs.job("achievements_rebuild", "Rattrapage des médailles et trophées", exclusive=True)
+def achievements_rebuild_job(ctx):
+    return {"awards": rebuild_awards()}
+
+
+@jobs.job("verify_replays", "Vérification des parties d'ambulance", exclusive=True)
+def verify_replays_job(ctx):
+    totals = {"verified": 0, "rejected": 0}
+    ctx.progress(0, AmbulanceReplay.query.filter_by(status="pending").count())
+    while True:
+        ctx.check()
+        counts = verify_pending_replays()
+        for status, value in counts.items():
+            totals[status] += value
+        ctx.progress(sum(totals.values()))
+        if sum(counts.values()) < REPLAY_BATCH_SIZE:
+            return totals
+
+
+@jobs.job("attempts_prune", "Purge du journal des tentatives", exclusive=True)
+def attempts_prune_job(ctx, days=None, batch_size=5000):
+    # The difficulty counters keep what the pruned attempts contributed
+    days = int(os.environ.get("ATTEMPT_LOG_RETENTION_DAYS", 365) if days is None else days)
+    cutoff = datetime.utcnow().date() - timedelta(days=days)
+    deleted = 0
+    while True:
+        ctx.check()
+        ids = db.session.execute(
+            select(QuestionnaireAttempt.id)
+            .where(QuestionnaireAttempt.day < cutoff)
+            .order_by(QuestionnaireAttempt.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            return {"deleted": deleted, "before": cutoff.isoformat()}
+        db.session.execute(delete(QuestionnaireAttempt).where(QuestionnaireAttempt.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+        ctx.progress(deleted)
+
+
+@jobs.job("export_scores", "Export des scores")
+def export_scores_job(ctx, format="csv"):
+    if format not in EXPORT_FORMATS:
+        raise ValueError("Format inconnu (csv ou ndjson)")
+    total = db.session.query(func.count(User.id)).scalar()
+    filename = f"protec-scores-job{ctx.job_id}.{format}"
+    path = os.path.join(job_export_dir(), filename)
+    rows = iter_score_export()
+    written = 0
+
+    def tracked():
+        nonlocal written
+        yield next(rows)
+        for row in rows:
+            yield row
+            written += 1
+            if written % 500 == 0:
+                ctx.progress(written, total)
+                ctx.check()
+
+    try:
+        with open(path + ".part", "w", encoding="utf-8", newline="") as output:
+            for chunk in stream_export(tracked(), format):
+                output.write(chunk)
+        os.replace(path + ".part", path)
+    finally:
+        if os.path.exists(path + ".part"):
+            os.remove(path + ".part")
+    ctx.progress(written, total)
+    return {"rows": written, "format": format, "file": filename}
+
+
+def serialize_job(job: Job):
+    progress, total = job.progress, job.total
+    live = current_app.extensions["jobs"].live_progress(job.id) if job.status == jobs.RUNNING else None
+    if live is not None:
+        progress, total = live
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "label": jobs.JOB_TYPES[job.kind].label if job.kind in jobs.JOB_TYPES else job.kind,
+        "params": job.params or {},
+        "status": job.status,
+        "progress": progress,
+        "total": total,
+        "result": job.result,
+        "error": job.error,
+        "cancel_requested": job.cancel_requested,
+        "created_by": job.created_by,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def pendu_data(progress: Progress) -> dict:
+    """Copy of the pendu progress data, with pre-id rows converted on the fly."""
+    data = progress.data if isinstance(progress.data, dict) else {}
+    return word_bank.migrate_played(data) or dict(data)
+
+
+def pendu_word_ref(payload: dict):
+    # Queued offline results from older clients still send the legacy position
+    if payload.get("id") is None and payload.get("index") is not None:
+        return word_bank.LEGACY_INDEX_TO_ID.get(payload.get("index"))
+    return payload.get("id")
+
+
+def apply_pendu_result(user: User, word_id, success) -> Progress:
+    if word_id is None or success is None:
+        raise ValueError("Invalid payload")
+    if not word_bank.get(word_id):
+        raise ValueError("Mot inconnu")
+
+    level = Level.query.filter_by(slug="pendu_300").first_or_404()
+    progress = _user_progress(user, level, status="en_cours", data={"played_ids": [], "won": 0, "lost": 0})
+
+    data = pendu_data(progress)
+    if word_id in set(data.get("played_ids", [])):
+        raise ValueError("Already played")
+
+    # Fresh list so the previous value stays intact for the rollup hook
+    data["played_ids"] = list(data.get("played_ids", [])) + [word_id]
+    if success:
+        data["won"] = data.get("won", 0) + 1
+    else:
+        data["lost"] = data.get("lost", 0) + 1
+    progress.data = data
+
+    if len(data["played_ids"]) >= word_bank.TOTAL:
+        progress.status = "termine"
+    # Enforce score calculation rule: 10 pts per win
+    progress.score = data["won"] * 10
+    return progress
+
+
+def pendu_summary(progress: Progress):
+    data = pendu_data(progress)
+    return {
+        "score": progress.score,
+        "won": data.get("won", 0),
+        "lost": data.get("lost", 0),
+        "finished": len(data.get("played_ids", [])) >= word_bank.TOTAL,
+    }
+
+
+def apply_sync_event(user: User, kind: str, payload: dict):
+    """Apply one queued offline event and return its JSON result."""
+    if kind == "pendu_result":
+        return pendu_summary(apply_pendu_result(user, pendu_word_ref(payload), payload.get("success")))
+    if kind == "ambulance_score":
+        return submit_ambulance_score(user, payload)
+    if kind == "progress":
+        try:
+            level = db.session.get(Level, int(payload.get("level_id") or 0))
+        except (TypeError, ValueError):
+            level = None
+        if not level:
+            raise ValueError("Niveau introuvable")
+        return serialize_progress(apply_level_progress(user, level, payload.get("status"), payload.get("score")))
+    raise ValueError("Type d'événement inconnu")
+
+
+def register_commands(app: Flask) -> None:
+    @app.cli.command("seed-synthetic")
+    @click.option("--users", default=1000, show_default=True, help="Utilisateurs à générer.")
+    @click.option("--questionnaires", default=20, show_default=True)
+    @click.option("--questions", default=10, show_default=True, help="Questions par questionnaire.")
+    @click.option("--options", default=4, show_default=True, help="Réponses par question.")
+    @click.option("--results-per-user", default=3.0, show_default=True, help="Questionnaires passés en moyenne.")
+    @click.option("--batch-size", default=5000, show_default=True)
+    @click.option("--seed", default=38, show_default=True)
+    def seed_synthetic_command(users, questionnaires, questions, options, results_per_user, batch_size, seed):
+        """Génère un jeu de données synthétique pour les tests de charge."""
+        from synthetic import SYNTHETIC_PASSWORD, seed_synthetic
+
+        counts = seed_synthetic(
+            users=users,
+            questionnaires=questionnaires,
+            questions_per_questionnaire=questions,
+            options_per_question=options,
+            results_per_user=results_per_user,
+            batch_size=batch_size,
+            seed=seed,
+            log=click.echo,
+        )
+        click.echo(f"{sum(v for k, v in counts.items() if k != 'seconds')} lignes en {counts['seconds']} s")
+        click.echo(f"Mot de passe des comptes synthétiques : {SYNTHETIC_PASSWORD}")
+
+    @app.cli.command("analytics-rebuild")
+    def analytics_rebuild_command():
+        """Recalcule entièrement les agrégats d'analyse (réparation)."""
+        started = time.perf_counter()
+        keys = rebuild_rollups()
+        click.echo(f"{keys} agrégats recalculés en {time.perf_counter() - started:.1f} s")
+
+    @app.cli.command("search-reindex")
+    def search_reindex_command():
+        """Reconstruit l'index de recherche plein texte des questions."""
+        started = time.perf_counter()
+        indexed = rebuild_question_index()
+        click.echo(f"{indexed} questions indexées en {time.perf_counter() - started:.1f} s")
+
+    @app.cli.command("achievements-rebuild")
+    def achievements_rebuild_command():
+        """Attribue les trophées et médailles déjà atteints (réparation)."""
+        click.echo(f"{rebuild_awards()} récompenses attribuées")
+
+    @app.cli.command("job-run")
+    @click.argument("kind", type=click.Choice(sorted(jobs.JOB_TYPES)))
+    @click.option("--param", "-p", "params", multiple=True, help="Paramètre cle=valeur (répétable).")
+    def job_run_command(kind, params):
+        """Exécute une tâche de fond dans ce processus, sans serveur web."""
+        params = dict(item.split("=", 1) for item in params if "=" in item)
+        try:
+            jobs.validate_params(kind, params)
+        except ValueError as exc:
+            raise click.ClickException(str(exc))
+        runner = app.extensions["jobs"]
+        job, created = runner.submit(kind, params, background=False)
+        if not created:
+            raise click.ClickException(f"Tâche {job.kind} déjà en cours (#{job.id})")
+        started = time.perf_counter()
+        status = runner.run(job.id)
+        job = db.session.get(Job, job.id, populate_existing=True)
+        click.echo(f"Tâche #{job.id} {status} en {time.perf_counter() - started:.1f} s : {job.result or job.error}")
+        if status != jobs.SUCCEEDED:
+            raise SystemExit(1)
+
+    @app.cli.command("job-worker")
+    @click.option("--once", is_flag=True, help="Vide la file puis s'arrête.")
+    @click.option("--interval", default=2.0, show_default=True, help="Secondes entre deux relevés de la file.")
+    def job_worker_command(once, interval):
+        """Exécute les tâches en file (serveur web lancé avec JOB_WORKERS=0)."""
+        runner = app.extensions["jobs"]
+        runner.recover(resubmit=False)
+        while True:
+            for job_id in runner.run_queued():
+                click.echo(f"Tâche #{job_id} terminée")
+            if once:
+                break
+            time.sleep(interval)
+
+    @app.cli.command("verify-replays")
+    def verify_replays_command():
+        """Rejoue les parties d'ambulance en attente et crédite les scores valides."""
+        totals = {"verified": 0, "rejected": 0}
+        while True:
+            counts = verify_pending_replays()
+            for status, value in counts.items():
+                totals[status] += value
+            if sum(counts.values()) < REPLAY_BATCH_SIZE:
+                break
+        click.echo(f"{totals['verified']} parties validées, {totals['rejected']} rejetées")
+
+    @app.cli.command("replica-refresh")
+    def replica_refresh_command():
+        """Copie la base principale SQLite vers la réplique (tests locaux du routage)."""
+        replica = db.engines.get(db_routing.REPLICA_BIND)
+        if replica is None:
+            raise click.ClickException("DATABASE_READ_URL n'est pas défini")
+        if db.engine.dialect.name != "sqlite" or replica.dialect.name != "sqlite":
+            raise click.ClickException("Réservé à deux bases SQLite ; Postgres réplique lui-même")
+        db_routing.copy_sqlite_database(db.engine, replica)
+        click.echo(f"Réplique {replica.url.database} mise à jour")
+
+    @app.cli.command("export-scores")
+    @click.option("--format", "export_format", type=click.Choice(sorted(EXPORT_FORMATS)), default="csv", show_default=True)
+    @click.option("--output", type=click.File("w", encoding="utf-8"), default="-", help="Fichier de sortie (stdout par défaut).")
+    def export_scores_command(export_format, output):
+        """Exporte les utilisateurs avec leurs scores par niveau et questionnaire."""
+        for chunk in stream_export(iter_score_export(), export_format):
+            output.write(chunk)
+
+
+def register_routes(app: Flask) -> None:
     def ensure_admin_access():
-        user = current_user()
+        user = session_user()
         if not user:
             return user, (jsonify({"error": "Authentification requise"}), 401)
         if user.role != "admin":
@@ -493,7 +2307,7 @@ def register_routes(app: Flask) -> None:
         return user, None
 
     def ensure_designer_access():
-        user = current_user()
+        user = session_user()
         if not user:
             return user, (jsonify({"error": "Authentification requise"}), 401)
         if user.role not in {"admin", "formateur"}:
@@ -504,11 +2318,16 @@ def register_routes(app: Flask) -> None:
         user = current_user()
         if not user:
             return redirect(url_for("auth"))
-        context = build_dashboard_context(user)
-        context["current_page"] = page
-        context["avatar_emojis"] = AVATAR_EMOJIS
-        if page == "admin" and user.role == "admin":
-            context["users"] = User.query.order_by(User.created_at.desc()).all()
+        # Shared panels are cached per data version: their queries only run
+        # when the template renders a fragment that missed the cache
+        context = {
+            "levels": build_dashboard_levels(user),
+            "user": user,
+            "dashboard_stats": fragment_cache.Lazy(build_dashboard_stats),
+            "dashboard_version": fragment_cache.DATA_VERSIONS.current("dashboard"),
+            "current_page": page,
+            "avatar_emojis": AVATAR_EMOJIS,
+        }
         return render_template("index.html", **context)
 
     @app.route("/")
@@ -531,6 +2350,8 @@ def register_routes(app: Flask) -> None:
             progress = Progress(user_id=user.id, level_id=level.id, status="en_cours")
             db.session.add(progress)
             db.session.commit()
+            # An activated mission counts towards the team trophies
+            award_achievements([user.id], achievements.SCORE)
             
         # Calculate total score for the context
         progress_scores = sum(p.score for p in user.progress)
@@ -548,13 +2369,25 @@ def register_routes(app: Flask) -> None:
         
         
         if level.slug == 'pendu_300':
-            return render_template("mission_pendu.html", level=level, progress=progress, total_score=total_score)
+            return render_template(
+                "mission_pendu.html", level=level, progress=progress, total_score=total_score, total_words=word_bank.TOTAL
+            )
         
         if level.slug == 'ambulance_chase':
             return render_template("mission_ambulance.html", level=level, progress=progress)
             
         return render_template("mission.html", level=level, progress=progress, avatar_emojis=AVATAR_EMOJIS)
 
+    @app.route("/sw.js")
+    def service_worker():
+        # Served from the root so its scope covers every page
+        response = make_response(render_template(
+            "sw.js", cache_version=app.config["STATIC_VERSION"], assets=app.config["STATIC_ASSETS"]
+        ))
+        response.headers["Content-Type"] = "application/javascript; charset=utf-8"
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
     @app.route("/mini-game")
     def mini_game_page():
         return render_shell("mini-game")
@@ -592,7 +2425,7 @@ def register_routes(app: Flask) -> None:
         if User.query.filter_by(email=email).first():
             return jsonify({"error": "Un compte existe déjà avec cet e-mail"}), 400
 
-        hashed = generate_password_hash(data["password"])
+        hashed = hash_password(data["password"])
         user = User(
             username=data["username"].strip(),
             email=email,
@@ -601,7 +2434,8 @@ def register_routes(app: Flask) -> None:
         )
         db.session.add(user)
         db.session.commit()
-        session["user_id"] = user.id
+        sign_in(user)
+        award_achievements([user.id], achievements.REGISTRATION)
         return jsonify({"id": user.id, "username": user.username, "avatar": user.avatar})
 
     @app.route("/api/login", methods=["POST"])
@@ -612,12 +2446,12 @@ def register_routes(app: Flask) -> None:
         user = User.query.filter_by(email=email).first()
         if not user or not user.verify_password(password or ""):
             return jsonify({"error": "Identifiants invalides"}), 401
-        session["user_id"] = user.id
+        sign_in(user)
         return jsonify({"id": user.id, "username": user.username, "avatar": user.avatar})
 
     @app.route("/api/logout", methods=["POST"])
     def api_logout():
-        session.pop("user_id", None)
+        sign_out()
         return jsonify({"ok": True})
 
     @app.route("/api/menu")
@@ -625,42 +2459,73 @@ def register_routes(app: Flask) -> None:
         user = current_user()
         if not user:
             return jsonify({"error": "Authentification requise"}), 401
+        all_levels = Level.query.all()
         progress_map = {p.level_id: serialize_progress(p) for p in (user.progress if user else [])}
-        levels = [serialize_level(level, progress_map.get(level.id)) for level in Level.query.all()]
+        levels = [serialize_level(level, progress_map.get(level.id)) for level in all_levels]
         return jsonify({"levels": levels, "user": serialize_user(user)})
 
+    @app.route("/api/leaderboard/stream")
+    def api_leaderboard_stream():
+        user = current_user()
+        if not user:
+            return jsonify({"error": "Authentification requise"}), 401
+        subscriber = LEADERBOARD_HUB.subscribe()
+        if subscriber is None:
+            return jsonify({"error": "Trop de connexions en direct"}), 503, {"Retry-After": "30"}
+        # The stream outlives the request: give the DB connection back to the pool now
+        db.session.close()
+        return Response(
+            LEADERBOARD_HUB.stream(subscriber),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.route("/api/leaderboard/fragment")
+    def api_leaderboard_fragment():
+        # What a live client re-fetches on resync: served from the fragment
+        # cache while the dashboard data version is unchanged
+        if not current_user():
+            return jsonify({"error": "Authentification requise"}), 401
+        return render_template(
+            "_scoreboard.html",
+            dashboard_stats=fragment_cache.Lazy(build_dashboard_stats),
+            dashboard_version=fragment_cache.DATA_VERSIONS.current("dashboard"),
+            avatar_emojis=AVATAR_EMOJIS,
+        )
+
     @app.route("/api/progress/<int:level_id>", methods=["POST"])
     def api_progress(level_id: int):
-        user = current_user()
+        user = session_user()
         if not user:
             return jsonify({"error": "Authentification requise"}), 401
         level = Level.query.get_or_404(level_id)
         data = request.get_json() or {}
-        status = data.get("status") or "en_cours"
-        score = int(data.get("score") or 0)
-
-        progress = Progress.query.filter_by(user_id=user.id, level_id=level.id).first()
-        if not progress:
-            progress = Progress(user=user, level=level)
-            db.session.add(progress)
-
-        progress.status = status
-        progress.score = max(progress.score or 0, score)
+        try:
+            progress = apply_level_progress(user, level, data.get("status"), data.get("score"))
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        # Serialized before the commit expires the row: no reload afterwards
+        db.session.flush()
+        body = serialize_progress(progress)
         db.session.commit()
-        return jsonify(serialize_progress(progress))
+        record_score_change([user.id])
+        return jsonify(body)
 
     @app.route("/api/profile")
     def api_profile():
         user = current_user()
         if not user:
             return jsonify({"user": None})
+        # Load levels first so progress.level resolves from the identity map
+        levels = {level.id: level for level in Level.query.all()}
         progress_list = [serialize_progress(p) for p in user.progress]
         questionnaire_results = QuestionnaireResult.query.filter_by(user_id=user.id).all()
         quiz_points = sum(result.score for result in questionnaire_results)
-        mission_points = sum(p.score for p in user.progress if p.level.category == 'mission')
-        minigame_points = sum(p.score for p in user.progress if p.level.category == 'minigame')
+        mission_points = sum(p.score for p in user.progress if levels[p.level_id].category == 'mission')
+        minigame_points = sum(p.score for p in user.progress if levels[p.level_id].category == 'minigame')
         bonus_points = user.bonus_points or 0
         total_points = quiz_points + mission_points + minigame_points + bonus_points
+        awards = load_awards([user.id]).get(user.id, {})
         
         return jsonify(
             {
@@ -672,7 +2537,12 @@ def register_routes(app: Flask) -> None:
                 "minigame_points": minigame_points,
                 "bonus_points": bonus_points,
                 "total_points": total_points,
-                "badges": get_user_badges(total_points),
+                "badges": achievements.displayed_badges(awards),
+                "awards": [
+                    achievements.serialize_badge(achievements.RULES_BY_CODE[code], earned_at)
+                    for code, earned_at in sorted(awards.items(), key=lambda item: item[1])
+                    if code in achievements.RULES_BY_CODE
+                ],
             }
         )
 
@@ -699,9 +2569,12 @@ def register_routes(app: Flask) -> None:
         user.username = username.strip()
         user.avatar = avatar
         if password:
-            user.password_hash = generate_password_hash(password)
+            user.password_hash = hash_password(password)
 
         db.session.commit()
+        if password:
+            # Other sessions are signed out, this one carries the new version
+            sign_in(user)
         return jsonify(serialize_user(user))
 
     @app.route("/api/profile", methods=["DELETE"])
@@ -710,57 +2583,135 @@ def register_routes(app: Flask) -> None:
         if not user:
             return jsonify({"error": "Authentification requise"}), 401
 
-        db.session.delete(user)
+        delete_users([user.id])
         db.session.commit()
-        session.pop("user_id", None)
+        sign_out()
         return jsonify({"ok": True})
 
     @app.route("/api/ambulance/score", methods=["POST"])
     def api_ambulance_score():
-        user = current_user()
+        user = session_user()
         if not user:
             return jsonify({"error": "Authentification requise"}), 401
         
-        payload = request.get_json()
-        score = payload.get("score", 0)
-        
-        level = Level.query.filter_by(slug="ambulance_chase").first_or_404()
-        progress = Progress.query.filter_by(user_id=user.id, level_id=level.id).first()
-        
-        if not progress:
-            progress = Progress(user_id=user.id, level_id=level.id, status="en_cours")
-            db.session.add(progress)
-        
-        # Update score if new score is higher
-        if score > progress.score:
-            progress.score = score
-            progress.status = "termine"
-        
+        payload = request.get_json() or {}
+        try:
+            result = submit_ambulance_score(user, payload)
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
         db.session.commit()
-        
-        return jsonify({
-            "ok": True,
-            "score": progress.score,
-            "best_score": progress.score
-        })
+        if not result.get("pending"):
+            record_score_change([user.id])
+
+        return jsonify({"ok": True, **result})
 
     @app.route("/api/admin/users", methods=["GET"])
     def api_admin_users():
         _, error = ensure_admin_access()
         if error:
             return error
-        
-        users = User.query.all()
-        # Return list directly to match main.js expectation
-        return jsonify([
-            {
-                "id": u.id,
-                "username": u.username,
-                "email": u.email,
-                "bonus_points": u.bonus_points or 0
-            }
-            for u in users
-        ])
+
+        query = (request.args.get("q") or "").strip().lower()
+        limit = request.args.get("limit", ADMIN_USERS_PAGE, type=int) or ADMIN_USERS_PAGE
+        limit = min(max(limit, 1), ADMIN_USERS_MAX_PAGE)
+        users = admin_users_page(query, limit + 1, request.args.get("after", type=int))
+        # Keyset paging: the next page starts below the last id returned
+        next_cursor = users[limit - 1].id if len(users) > limit else None
+        return jsonify({
+            "users": [{**serialize_user_admin(u), "bonus_points": u.bonus_points or 0} for u in users[:limit]],
+            "next": next_cursor,
+        })
+
+    @app.route("/api/admin/export")
+    def api_admin_export():
+        _, error = ensure_admin_access()
+        if error:
+            return error
+        export_format = (request.args.get("format") or "csv").lower()
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({"error": "Format inconnu (csv ou ndjson)"}), 400
+        filename = f"protec-scores-{datetime.utcnow():%Y%m%d-%H%M}.{export_format}"
+        return Response(
+            stream_with_context(stream_export(iter_score_export(), export_format)),
+            mimetype=EXPORT_FORMATS[export_format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+    @app.route("/api/admin/analytics")
+    def api_admin_analytics():
+        _, error = ensure_designer_access()
+        if error:
+            return error
+        days = request.args.get("days", type=int)
+        since = datetime.utcnow().date() - timedelta(days=days - 1) if days and days > 0 else None
+        return jsonify(analytics_report(since))
+
+    @app.route("/api/admin/analytics/rebuild", methods=["POST"])
+    def api_admin_analytics_rebuild():
+        admin_user, error = ensure_admin_access()
+        if error:
+            return error
+        job, _ = app.extensions["jobs"].submit("analytics_rebuild", created_by=admin_user.id)
+        return jsonify({"ok": True, "job": serialize_job(job)}), 202
+
+    @app.route("/api/admin/jobs")
+    def api_admin_jobs():
+        _, error = ensure_admin_access()
+        if error:
+            return error
+        limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+        query = Job.query
+        if request.args.get("status"):
+            query = query.filter(Job.status == request.args["status"])
+        recent = query.order_by(Job.id.desc()).limit(limit).all()
+        return jsonify({
+            "jobs": [serialize_job(job) for job in recent],
+            "kinds": [{"kind": job_type.kind, "label": job_type.label} for job_type in jobs.JOB_TYPES.values()],
+        })
+
+    @app.route("/api/admin/jobs", methods=["POST"])
+    def api_admin_jobs_submit():
+        admin_user, error = ensure_admin_access()
+        if error:
+            return error
+        data = request.get_json() or {}
+        kind, params = data.get("kind"), data.get("params") or {}
+        try:
+            jobs.validate_params(kind, params)
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        job, created = app.extensions["jobs"].submit(kind, params, created_by=admin_user.id)
+        return jsonify(serialize_job(job)), 202 if created else 200
+
+    @app.route("/api/admin/jobs/<int:job_id>")
+    def api_admin_job(job_id):
+        _, error = ensure_admin_access()
+        if error:
+            return error
+        return jsonify(serialize_job(Job.query.get_or_404(job_id)))
+
+    @app.route("/api/admin/jobs/<int:job_id>/cancel", methods=["POST"])
+    def api_admin_job_cancel(job_id):
+        _, error = ensure_admin_access()
+        if error:
+            return error
+        job = Job.query.get_or_404(job_id)
+        if job.status not in jobs.ACTIVE:
+            return jsonify({"error": "Tâche déjà terminée"}), 409
+        app.extensions["jobs"].cancel(job.id)
+        db.session.refresh(job)
+        return jsonify(serialize_job(job))
+
+    @app.route("/api/admin/jobs/<int:job_id>/download")
+    def api_admin_job_download(job_id):
+        _, error = ensure_admin_access()
+        if error:
+            return error
+        job = Job.query.get_or_404(job_id)
+        filename = (job.result or {}).get("file") if job.status == jobs.SUCCEEDED else None
+        if not filename:
+            return jsonify({"error": "Aucun fichier pour cette tâche"}), 404
+        return send_from_directory(job_export_dir(), filename, as_attachment=True)
 
     @app.route("/api/admin/users/<int:user_id>/bonus", methods=["POST"])
     def api_admin_update_bonus(user_id):
@@ -777,9 +2728,96 @@ def register_routes(app: Flask) -> None:
             
         target_user.bonus_points = bonus
         db.session.commit()
+        record_score_change([target_user.id])
         
         return jsonify({"success": True, "bonus_points": target_user.bonus_points})
 
+    @app.route("/api/admin/users/bulk", methods=["POST"])
+    def api_admin_bulk_users():
+        admin_user, error = ensure_admin_access()
+        if error:
+            return error
+
+        operations = (request.get_json() or {}).get("operations")
+        if not isinstance(operations, list) or not operations:
+            return jsonify({"error": "Aucune opération fournie"}), 400
+        if len(operations) > BULK_MAX_OPERATIONS:
+            return jsonify({"error": f"{BULK_MAX_OPERATIONS} opérations maximum par lot"}), 400
+
+        results = []
+        roles, bonuses, deletions = {}, {}, set()
+        for operation in operations:
+            try:
+                user_id = int(operation.get("id"))
+            except (AttributeError, TypeError, ValueError):
+                results.append({"id": None, "ok": False, "error": "Identifiant invalide"})
+                continue
+            result = {"id": user_id, "ok": True}
+            results.append(result)
+            if operation.get("delete"):
+                if user_id == admin_user.id:
+                    result.update(ok=False, error="Impossible de supprimer votre propre compte")
+                else:
+                    deletions.add(user_id)
+                continue
+            role = (operation.get("role") or "").lower()
+            if role and role not in USER_ROLES:
+                result.update(ok=False, error="Rôle invalide")
+                continue
+            bonus = operation.get("bonus")
+            if bonus is not None:
+                try:
+                    bonus = int(bonus)
+                except (TypeError, ValueError):
+                    result.update(ok=False, error="Bonus invalide")
+                    continue
+            if not role and bonus is None:
+                result.update(ok=False, error="Aucune modification fournie")
+                continue
+            if role:
+                roles[user_id] = role
+            if bonus is not None:
+                bonuses[user_id] = bonus
+
+        requested = set(roles) | set(bonuses) | deletions
+        existing = set()
+        if requested:
+            existing = {row[0] for row in db.session.query(User.id).filter(User.id.in_(requested))}
+        for result in results:
+            if result["ok"] and result["id"] not in existing:
+                result.update(ok=False, error="Utilisateur introuvable")
+        roles = {user_id: role for user_id, role in roles.items() if user_id in existing and user_id not in deletions}
+        bonuses = {user_id: bonus for user_id, bonus in bonuses.items() if user_id in existing and user_id not in deletions}
+        deletions &= existing
+
+        # One set-based statement per kind of change, all in a single transaction
+        if roles:
+            db.session.execute(
+                update(User)
+                .where(User.id.in_(roles))
+                .values(role=case(roles, value=User.id), session_version=User.session_version + 1),
+                execution_options={"synchronize_session": False},
+            )
+            revoke_sessions(roles)
+        if bonuses:
+            db.session.execute(
+                update(User).where(User.id.in_(bonuses)).values(bonus_points=case(bonuses, value=User.id)),
+                execution_options={"synchronize_session": False},
+            )
+        if deletions:
+            delete_users(deletions)
+        db.session.commit()
+
+        record_score_change(bonuses)
+        for user_id in deletions:
+            LEADERBOARD_HUB.publish({"user_id": user_id, "removed": True})
+
+        return jsonify({
+            "results": results,
+            "updated": len(set(roles) | set(bonuses)),
+            "deleted": len(deletions),
+        })
+
     @app.route("/api/admin/users/<int:user_id>", methods=["PUT"])
     def api_admin_update_user(user_id: int):
         admin_user, error = ensure_admin_access()
@@ -801,8 +2839,10 @@ def register_routes(app: Flask) -> None:
         if password:
             if len(password) < 8:
                 return jsonify({"error": "Le mot de passe doit contenir au moins 8 caractères"}), 400
-            user.password_hash = generate_password_hash(password)
+            user.password_hash = hash_password(password)
         db.session.commit()
+        if user.id == admin_user.id:
+            sign_in(user)
         return jsonify(serialize_user_admin(user))
 
     @app.route("/api/admin/users/<int:user_id>", methods=["DELETE"])
@@ -815,7 +2855,7 @@ def register_routes(app: Flask) -> None:
         if admin_user.id == user.id:
             return jsonify({"error": "Impossible de supprimer votre propre compte"}), 400
 
-        db.session.delete(user)
+        delete_users([user.id])
         db.session.commit()
         return jsonify({"ok": True})
 
@@ -832,11 +2872,16 @@ def register_routes(app: Flask) -> None:
         
     @app.route("/api/questionnaires", methods=["GET"])
     def api_questionnaires():
-        user = current_user()
+        user = session_user()
         if not user:
             return jsonify({"error": "Authentification requise"}), 401
-        questionnaires = Questionnaire.query.order_by(Questionnaire.created_at.desc()).all()
         include_questions = user.role in {"admin", "formateur"}
+        questions_loader = selectinload(Questionnaire.questions)
+        if include_questions:
+            questions_loader = questions_loader.selectinload(Question.options)
+        questionnaires = (
+            Questionnaire.query.options(questions_loader).order_by(Questionnaire.created_at.desc()).all()
+        )
         user_results = {}
         if user:
             results = QuestionnaireResult.query.filter_by(user_id=user.id).all()
@@ -848,23 +2893,84 @@ def register_routes(app: Flask) -> None:
             ]
         })
 
+    @app.route("/api/questions/search")
+    def api_questions_search():
+        _, error = ensure_designer_access()
+        if error:
+            return error
+        query = (request.args.get("q") or "").strip()
+        page = max(request.args.get("page", 1, type=int) or 1, 1)
+        per_page = min(max(request.args.get("per_page", 20, type=int) or 20, 1), SEARCH_MAX_PER_PAGE)
+        # One extra hit tells whether a next page exists without counting matches
+        hits = question_search.search(db.session.connection(), query, per_page + 1, (page - 1) * per_page)
+        has_more = len(hits) > per_page
+        hits = hits[:per_page]
+        questions = {
+            question.id: question
+            for question in Question.query.options(
+                selectinload(Question.options), selectinload(Question.questionnaire)
+            ).filter(Question.id.in_([question_id for question_id, _ in hits]))
+        } if hits else {}
+        results = []
+        for question_id, rank in hits:
+            question = questions.get(question_id)
+            if question is None:
+                continue
+            results.append({
+                **serialize_question(question),
+                "rank": round(rank, 6),
+                "questionnaire": {
+                    "id": question.questionnaire.id,
+                    "title": question.questionnaire.title,
+                    "category": question.questionnaire.category,
+                },
+            })
+        return jsonify({"query": query, "page": page, "per_page": per_page, "has_more": has_more, "results": results})
+
     @app.route("/api/questionnaires/<int:questionnaire_id>")
     def api_questionnaire_detail(questionnaire_id: int):
-        user = current_user()
+        user = session_user()
         if not user:
             return jsonify({"error": "Authentification requise"}), 401
 
-        questionnaire = Questionnaire.query.get_or_404(questionnaire_id)
+        sample_size = request.args.get("sample", type=int)
+        questionnaires = Questionnaire.query
+        if not sample_size:
+            questionnaires = questionnaires.options(
+                selectinload(Questionnaire.questions).selectinload(Question.options)
+            )
+        questionnaire = questionnaires.filter_by(id=questionnaire_id).first_or_404()
         existing = None
         if user:
             existing = QuestionnaireResult.query.filter_by(user_id=user.id, questionnaire_id=questionnaire.id).first()
+        if sample_size:
+            # Exam mode: only the drawn questions and their options are loaded
+            seed = (request.args.get("seed") or "")[:64]
+            sample_size = min(max(sample_size, 1), QUESTIONNAIRE_SAMPLE_MAX)
+            bank_size, questions = sample_questions(
+                questionnaire.id, sample_size, sample_seed(user.id, questionnaire.id, seed)
+            )
+            # Not serialize_questionnaire(): its counts would load the whole bank
+            return jsonify({
+                "id": questionnaire.id,
+                "title": questionnaire.title,
+                "description": questionnaire.description,
+                "category": questionnaire.category,
+                "icon": questionnaire.icon,
+                "created_at": questionnaire.created_at.isoformat() if questionnaire.created_at else None,
+                "question_count": len(questions),
+                "total_points": sum(question.points or 0 for question in questions),
+                "questions": [serialize_question(question) for question in questions],
+                "sample": {"size": len(questions), "bank_size": bank_size, "seed": seed},
+                "user_result": serialize_questionnaire_result(existing),
+            })
         return jsonify(
             {**serialize_questionnaire(questionnaire, include_questions=True), "user_result": serialize_questionnaire_result(existing)}
         )
 
     @app.route("/api/questionnaires/<int:questionnaire_id>/result", methods=["POST"])
     def api_record_questionnaire_result(questionnaire_id: int):
-        user = current_user()
+        user = session_user()
         if not user:
             return jsonify({"error": "Authentification requise"}), 401
 
@@ -882,8 +2988,57 @@ def register_routes(app: Flask) -> None:
         result.score = max(result.score or 0, score)
         result.max_score = max(result.max_score or 0, max_score)
         db.session.commit()
+        record_score_change([user.id])
+        app.extensions["attempt_log"].add({
+            "user_id": user.id,
+            "questionnaire_id": questionnaire.id,
+            "score": score,
+            "max_score": max_score,
+            "answers": attempt_log.parse_answers(data.get("answers"), ATTEMPT_MAX_ANSWERS),
+            "created_at": datetime.utcnow(),
+        })
         return jsonify(serialize_questionnaire_result(result))
 
+    @app.route("/api/questionnaires/<int:questionnaire_id>/attempts")
+    def api_questionnaire_attempts(questionnaire_id: int):
+        user = session_user()
+        if not user:
+            return jsonify({"error": "Authentification requise"}), 401
+        user_id = user.id
+        if request.args.get("user_id") and user.role in {"formateur", "admin"}:
+            user_id = request.args.get("user_id", type=int)
+        attempts = (
+            QuestionnaireAttempt.query.filter_by(user_id=user_id, questionnaire_id=questionnaire_id)
+            .order_by(QuestionnaireAttempt.id.desc())
+            .limit(ATTEMPT_HISTORY_LIMIT)
+            .all()
+        )
+        return jsonify({"attempts": [serialize_attempt(attempt) for attempt in reversed(attempts)]})
+
+    @app.route("/api/questionnaires/<int:questionnaire_id>/difficulty")
+    def api_questionnaire_difficulty(questionnaire_id: int):
+        _, error = ensure_designer_access()
+        if error:
+            return error
+        rows = db.session.execute(
+            select(Question.id, Question.position, Question.text, QuestionStat.attempts, QuestionStat.correct)
+            .outerjoin(QuestionStat, QuestionStat.question_id == Question.id)
+            .where(Question.questionnaire_id == questionnaire_id)
+            .order_by(Question.position)
+        ).all()
+        return jsonify({
+            "questions": [
+                {
+                    "id": question_id,
+                    "position": position,
+                    "text": text_value,
+                    "attempts": attempts or 0,
+                    "success_rate": round(correct / attempts, 4) if attempts else None,
+                }
+                for question_id, position, text_value, attempts, correct in rows
+            ]
+        })
+
     @app.route("/api/questionnaires/<int:questionnaire_id>", methods=["DELETE"])
     def api_delete_questionnaire(questionnaire_id: int):
         _, error = ensure_admin_access()
@@ -891,6 +3046,10 @@ def register_routes(app: Flask) -> None:
             return error
 
         questionnaire = Questionnaire.query.get_or_404(questionnaire_id)
+        # Questions, options and results go with ON DELETE CASCADE
+        db.session.execute(
+            delete(AnalyticsRollup).where(AnalyticsRollup.kind == "questionnaire", AnalyticsRollup.ref_id == questionnaire.id)
+        )
         db.session.delete(questionnaire)
         db.session.commit()
         return jsonify({"ok": True})
@@ -923,34 +3082,19 @@ def register_routes(app: Flask) -> None:
         db.session.add(questionnaire)
         db.session.flush()
 
+        position = 0
         for question_data in questions_data:
             text = (question_data.get("text") or "").strip()
             q_type = (question_data.get("type") or "single").strip()
             points = int(question_data.get("points") or 0)
             if not text:
                 continue
-            question = Question(text=text, type=q_type, points=max(points, 0), questionnaire=questionnaire)
+            question = Question(
+                text=text, type=q_type, points=max(points, 0), position=position, questionnaire=questionnaire
+            )
             db.session.add(question)
-
-            options = question_data.get("options") or []
-            if q_type in {"single", "multiple"}:
-                # For single-choice, only the first marked option is kept as correct
-                seen_correct = False
-                for opt in options:
-                    label = (opt.get("label") or "").strip()
-                    if not label:
-                        continue
-                    is_correct = bool(opt.get("is_correct")) and (q_type == "multiple" or not seen_correct)
-                    if is_correct and q_type == "single":
-                        seen_correct = True
-                    db.session.add(AnswerOption(label=label, is_correct=is_correct, question=question))
-            elif q_type == "text":
-                text_option = next(
-                    ((opt.get("label") or "").strip() for opt in options if (opt.get("label") or "").strip()),
-                    None,
-                )
-                if text_option:
-                    db.session.add(AnswerOption(label=text_option, is_correct=True, question=question))
+            position += 1
+            question.options = build_answer_options(q_type, question_data.get("options") or [])
 
         db.session.commit()
         return jsonify(serialize_questionnaire(questionnaire)), 201
@@ -980,36 +3124,33 @@ def register_routes(app: Flask) -> None:
         questionnaire.category = category
         questionnaire.icon = icon
 
-        questionnaire.questions.clear()
-        db.session.flush()
-
+        # Questions are updated in place: ids and positions survive the edit,
+        # so logged attempts and difficulty counters keep their questions.
+        # New questions go after the last position ever used.
+        existing = {question.id: question for question in questionnaire.questions}
+        position = max((question.position for question in existing.values()), default=-1) + 1
+        kept = set()
         for question_data in questions_data:
             text = (question_data.get("text") or "").strip()
             q_type = (question_data.get("type") or "single").strip()
             points = int(question_data.get("points") or 0)
             if not text:
                 continue
-            question = Question(text=text, type=q_type, points=max(points, 0), questionnaire=questionnaire)
-            db.session.add(question)
-
-            options = question_data.get("options") or []
-            if q_type in {"single", "multiple"}:
-                seen_correct = False
-                for opt in options:
-                    label = (opt.get("label") or "").strip()
-                    if not label:
-                        continue
-                    is_correct = bool(opt.get("is_correct")) and (q_type == "multiple" or not seen_correct)
-                    if is_correct and q_type == "single":
-                        seen_correct = True
-                    db.session.add(AnswerOption(label=label, is_correct=is_correct, question=question))
-            elif q_type == "text":
-                text_option = next(
-                    ((opt.get("label") or "").strip() for opt in options if (opt.get("label") or "").strip()),
-                    None,
-                )
-                if text_option:
-                    db.session.add(AnswerOption(label=text_option, is_correct=True, question=question))
+            question = existing.get(question_data.get("id"))
+            if question is None or question.id in kept:
+                question = Question(position=position, questionnaire=questionnaire)
+                db.session.add(question)
+                position += 1
+            else:
+                kept.add(question.id)
+            question.text = text
+            question.type = q_type
+            question.points = max(points, 0)
+            question.options = build_answer_options(q_type, question_data.get("options") or [])
+
+        for question_id, question in existing.items():
+            if question_id not in kept:
+                questionnaire.questions.remove(question)
 
         db.session.commit()
         return jsonify(serialize_questionnaire(questionnaire))
@@ -1020,115 +3161,164 @@ def register_routes(app: Flask) -> None:
 
     @app.route("/api/pendu/state")
     def api_pendu_state():
-        user = current_user()
+        user = session_user()
         if not user:
              return jsonify({"error": "Authentification requise"}), 401
         
-        level = Level.query.filter_by(slug="pendu_300").first_or_404()
-        progress = Progress.query.filter_by(user_id=user.id, level_id=level.id).first()
+        level_id = level_id_for_slug("pendu_300")
+        progress = Progress.query.filter_by(user_id=user.id, level_id=level_id).first()
         
         if not progress:
-            progress = Progress(user_id=user.id, level_id=level.id, data={"played_indices": [], "won": 0, "lost": 0}, status="en_cours")
+            progress = Progress(
+                user_id=user.id, level_id=level_id, score=0, status="en_cours",
+                data={"played_ids": [], "won": 0, "lost": 0},
+            )
             db.session.add(progress)
-            db.session.commit()
             
-        data = progress.data or {}
-        if not isinstance(data, dict): data = {} 
+        data = pendu_data(progress)
         
-        played = data.get("played_indices", [])
+        played = data.get("played_ids", [])
         won = data.get("won", 0)
         lost = data.get("lost", 0)
         
-        total_words = 300
+        total_words = word_bank.TOTAL
         played_count = len(played)
         
         # Sync score in case of drift
         correct_score = won * 10
         if progress.score != correct_score:
             progress.score = correct_score
-            db.session.commit()
         
-        return jsonify({
+        body = {
             "played_count": played_count,
             "won_count": won,
             "lost_count": lost,
             "total_words": total_words,
             "score": progress.score,
             "is_finished": played_count >= total_words
-        })
+        }
+        # One commit for the new row and the score fix, after the response is built
+        if db.session.new or db.session.dirty:
+            db.session.commit()
+        return jsonify(body)
 
     @app.route("/api/pendu/word")
     def api_pendu_word():
-        import random
-        user = current_user()
+        user = session_user()
         if not user: return jsonify({"error": "Authentification requise"}), 401
         
         level = Level.query.filter_by(slug="pendu_300").first_or_404()
         progress = Progress.query.filter_by(user_id=user.id, level_id=level.id).first()
+        played = set(pendu_data(progress).get("played_ids", [])) if progress else set()
         
-        data = progress.data or {}
-        played_indices = set(data.get("played_indices", []))
-        
-        all_indices = set(range(len(PENDU_WORDS)))
-        available = list(all_indices - played_indices)
-        
-        if not available:
+        if len(played) >= word_bank.TOTAL:
             return jsonify({"finished": True})
-            
-        idx = random.choice(available)
-        word = PENDU_WORDS[idx]
-        
-        return jsonify({
-            "word": word,
-            "index": idx,
-            "length": len(word)
-        })
+
+        # Optional filters, e.g. ?tier=facile for difficulty-tiered play
+        filters = {
+            "tier": request.args.get("tier"),
+            "category": request.args.get("category"),
+            "length": request.args.get("length", type=int),
+        }
+        count = request.args.get("count", type=int)
+        if count is not None and count < 1:
+            return jsonify({"error": "Nombre de mots invalide (1 au minimum)"}), 400
+        words = word_bank.pick(played, min(count or 1, PENDU_PREFETCH_MAX), **filters)
+        if not words:
+            return jsonify({"finished": True, "filtered": True})
+        if count:
+            # Batch for the offline client, which keeps a few words ahead
+            return jsonify({"words": [word_bank.serialize(word) for word in words]})
+        return jsonify(word_bank.serialize(words[0]))
 
     @app.route("/api/pendu/result", methods=["POST"])
     def api_pendu_result():
-        user = current_user()
+        user = session_user()
         if not user: return jsonify({"error": "Authentification requise"}), 401
         
         payload = request.get_json()
-        word_index = payload.get("index")
-        success = payload.get("success")
-        
-        if word_index is None or success is None:
-            return jsonify({"error": "Invalid payload"}), 400
-            
-        level = Level.query.filter_by(slug="pendu_300").first_or_404()
-        progress = Progress.query.filter_by(user_id=user.id, level_id=level.id).first()
-        
-        data = dict(progress.data or {})
-        played = set(data.get("played_indices", []))
-        
-        if word_index in played:
-            return jsonify({"error": "Already played"}), 400
-            
-        data.setdefault("played_indices", []).append(word_index)
-        
-        if success:
-            data["won"] = data.get("won", 0) + 1
-            progress.score += 10
-        else:
-            data["lost"] = data.get("lost", 0) + 1
-            
-        progress.data = data
-        
-        if len(data["played_indices"]) >= 300:
-            progress.status = "termine"
-            
-        # Enforce score calculation rule: 10 pts per win
-        progress.score = data["won"] * 10
+        try:
+            progress = apply_pendu_result(user, pendu_word_ref(payload), payload.get("success"))
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+        body = {"ok": True, **pendu_summary(progress)}
         db.session.commit()
-        
-        return jsonify({
-            "ok": True,
-            "score": progress.score,
-            "won": data["won"],
-            "lost": data["lost"],
-            "finished": len(data["played_indices"]) >= 300
-        })
+        record_score_change([user.id])
+        return jsonify(body)
+
+    # --------------------------------------------------------------------------
+    # OFFLINE SYNC
+    # --------------------------------------------------------------------------
+
+    @app.route("/api/sync", methods=["POST"])
+    def api_sync():
+        user = session_user()
+        if not user:
+            return jsonify({"error": "Authentification requise"}), 401
+
+        data = request.get_json(silent=True) or {}
+        # Queues are kept per account on the device: never apply one under another session
+        if data.get("user_id") is not None and data.get("user_id") != user.id:
+            return jsonify({"error": "Ces événements appartiennent à un autre compte"}), 409
+        events = data.get("events")
+        if not isinstance(events, list) or not events:
+            return jsonify({"error": "Aucun événement à synchroniser"}), 400
+        if len(events) > SYNC_MAX_EVENTS:
+            return jsonify({"error": f"{SYNC_MAX_EVENTS} événements maximum par lot"}), 400
+
+        event_ids = [str(item.get("id") or "")[:64] for item in events if isinstance(item, dict)]
+        receipts = {
+            receipt.event_id: receipt
+            for receipt in SyncReceipt.query.filter(
+                SyncReceipt.user_id == user.id, SyncReceipt.event_id.in_(event_ids)
+            )
+        }
+
+        results = []
+        new_receipts = []
+        applied = 0
+        for item in events:
+            event_id = str(item.get("id") or "")[:64] if isinstance(item, dict) else ""
+            if not event_id:
+                results.append({"id": None, "status": "rejected", "error": "Identifiant d'événement manquant"})
+                continue
+            if event_id in receipts:
+                receipt = receipts[event_id]
+                results.append({"id": event_id, "status": "duplicate", "result": receipt.result})
+                continue
+
+            kind = str(item.get("type") or "")
+            payload = item.get("payload") if isinstance(item.get("payload"), dict) else {}
+            try:
+                # Each apply_* helper validates before writing, so a rejected event leaves no trace
+                result, status = apply_sync_event(user, kind, payload), "applied"
+            except ValueError as exc:
+                result, status = {"error": str(exc)}, "rejected"
+            except TypeError:
+                result, status = {"error": "Événement invalide"}, "rejected"
+            applied += status == "applied"
+
+            receipt = SyncReceipt(user_id=user.id, event_id=event_id, kind=kind[:40], status=status, result=result)
+            new_receipts.append(receipt)
+            receipts[event_id] = receipt
+            results.append({"id": event_id, "status": status, "result": result})
+
+        db.session.execute(
+            delete(SyncReceipt).where(
+                SyncReceipt.user_id == user.id, SyncReceipt.created_at < datetime.utcnow() - SYNC_RECEIPT_TTL
+            )
+        )
+        # Added last so autoflush cannot hit a concurrent duplicate mid-batch
+        db.session.add_all(new_receipts)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Same events flushed concurrently from another tab: retry later as duplicates
+            db.session.rollback()
+            return jsonify({"error": "Synchronisation déjà en cours"}), 409, {"Retry-After": "2"}
+        if applied:
+            record_score_change([user.id])
+        return jsonify({"ok": True, "applied": applied, "results": results})
 
 
 
@@ -0,0 +1,129 @@
+"""Append-only log of questionnaire attempts.
+
+Each finished attempt is one row: score, day and two bitmaps over the
+question positions of the questionnaire (bit ``i`` is position ``i``):
+``asked`` (NULL when every question was asked) and ``correct``. A
+10-question attempt costs two bytes of answers instead of ten rows.
+
+Attempts are not inserted by the request that records them: ``AttemptBuffer``
+collects them and hands them to ``flush`` in batches (``ATTEMPT_LOG_BATCH``
+rows, or every ``ATTEMPT_LOG_FLUSH_INTERVAL`` seconds), which writes the
+whole batch with one multi-row insert and one per-question counter upsert.
+``QuestionnaireResult`` remains the read path for best scores; old attempts
+are pruned by day (``attempts_prune`` job).
+"""
+import atexit
+import threading
+
+
+def pack_positions(positions, size):
+    """Bitmap of ``size`` bits with the given positions set."""
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return bytes(bits)
+
+
+def unpack_positions(bitmap):
+    return [
+        index * 8 + bit
+        for index, byte in enumerate(bitmap or b"")
+        if byte
+        for bit in range(8)
+        if byte >> bit & 1
+    ]
+
+
+def encode_answers(outcomes, size):
+    """(asked, correct) bitmaps from {position: is_correct}; asked is None for a full attempt."""
+    asked = None if len(outcomes) == size else pack_positions(outcomes, size)
+    correct = pack_positions([position for position, ok in outcomes.items() if ok], size)
+    return asked, correct
+
+
+def parse_answers(value, limit):
+    """{question_id: bool} from a request payload, at most ``limit`` entries."""
+    answers = {}
+    if not isinstance(value, dict):
+        return answers
+    for key, ok in list(value.items())[:limit]:
+        try:
+            answers[int(key)] = bool(ok)
+        except (TypeError, ValueError):
+            continue
+    return answers
+
+
+class AttemptBuffer:
+    """Collects attempts and writes them in batches from a background thread.
+
+    With ``interval`` 0 every attempt is written right away, by the caller.
+    A failed batch is kept for the next flush while the backlog stays under
+    ``max_pending``; beyond that the oldest attempts are dropped.
+    """
+
+    def __init__(self, flush, batch_size=500, interval=2.0, max_pending=20000, on_error=None):
+        self.flush_rows = flush
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.on_error = on_error
+        self.dropped = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    @property
+    def pending_count(self):
+        return len(self._pending)
+
+    def add(self, row):
+        if not self.interval:
+            try:
+                self.flush_rows([row])
+            except Exception as exc:
+                self.dropped += 1
+                if self.on_error:
+                    self.on_error(exc)
+            return
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self.batch_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="attempt-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write everything pending; returns the number of attempts written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = self._pending[:self.batch_size]
+                    del self._pending[:self.batch_size]
+                if not batch:
+                    return written
+                try:
+                    self.flush_rows(batch)
+                except Exception as exc:
+                    with self._lock:
+                        self._pending[:0] = batch
+                        overflow = len(self._pending) - self.max_pending
+                        if overflow > 0:
+                            del self._pending[:overflow]
+                            self.dropped += overflow
+                    if self.on_error:
+                        self.on_error(exc)
+                    return written
+                written += len(batch)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
@@ -0,0 +1,209 @@
+"""Scaling benchmarks for the dashboard and leaderboard render path.
+
+Times the dashboard (``GET /``, served from the fragment cache and re-rendered
+after a data change), ``/api/menu``, ``/api/profile`` and
+``/api/questionnaires`` against synthetic databases of growing size, and
+records query counts and peak memory next to wall time:
+
+    python bench.py run --sizes 100,10000,100000 --output benchmarks/baseline.json
+    python bench.py run --output benchmarks/current.json
+    python bench.py compare benchmarks/baseline.json benchmarks/current.json
+
+``compare`` exits with status 1 when a benchmark got slower than the
+tolerance, issues more queries or needs noticeably more memory.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+
+DEFAULT_SIZES = "100,10000,100000"
+
+
+def _client_call(client, path):
+    def call():
+        response = client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+    return call
+
+
+def build_targets(app, participant_id, designer_id):
+    from fragment_cache import DATA_VERSIONS
+
+    participant = app.test_client()
+    designer = app.test_client()
+    with participant.session_transaction() as sess:
+        sess["user_id"] = participant_id
+    with designer.session_transaction() as sess:
+        sess["user_id"] = designer_id
+
+    home = _client_call(participant, "/")
+
+    def home_after_write():
+        # What the first page view after a score change pays: every shared panel is rendered again
+        DATA_VERSIONS.bump("dashboard")
+        home()
+
+    return {
+        "home[cached]": home,
+        "home[after write]": home_after_write,
+        "api_menu": _client_call(participant, "/api/menu"),
+        "api_profile": _client_call(participant, "/api/profile"),
+        "api_questionnaires": _client_call(participant, "/api/questionnaires"),
+        "api_questionnaires[designer]": _client_call(designer, "/api/questionnaires"),
+    }
+
+
+def measure(call, repeat):
+    from query_profiler import record_queries
+
+    call()  # warm-up: template compilation, statement cache, first connection
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+
+    with record_queries() as recorder:
+        call()
+
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "max_s": max(timings),
+        "repeat": repeat,
+        "queries": recorder.count,
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def run(args):
+    sizes = sorted({int(size) for size in args.sizes.split(",") if size.strip()})
+    database_url = args.database_url
+    if not database_url:
+        handle, path = tempfile.mkstemp(prefix="protec-bench-", suffix=".db")
+        os.close(handle)
+        database_url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = database_url
+    # No replay verifier thread competing with the measured requests
+    os.environ.setdefault("AMBULANCE_VERIFY_INTERVAL", "0")
+
+    from app import User, app, db
+    from query_profiler import instrument_engine
+    from synthetic import seed_synthetic
+
+    results = {}
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        instrument_engine(db.engine)
+        seeded = db.session.query(User).filter(User.email.like("synthetic-%")).count()
+    for size in sizes:
+        with app.app_context():
+            if size > seeded:
+                print(f"Seeding {size - seeded} users...", file=sys.stderr)
+                seed_synthetic(
+                    users=size - seeded,
+                    questionnaires=args.questionnaires if not seeded else 0,
+                    seed=args.seed + size,
+                )
+                seeded = size
+            participant_id = (
+                User.query.filter_by(role="participant").filter(User.email.like("synthetic-%")).first().id
+            )
+            designer_id = User.query.filter_by(role="admin").first().id
+
+        # Requests run outside this app context: each one gets its own session and g, as when served
+        results[str(size)] = {}
+        for name, call in build_targets(app, participant_id, designer_id).items():
+            stats = measure(call, args.repeat)
+            results[str(size)][name] = stats
+            print(
+                f"{size:>8} users  {name:30} {stats['median_s'] * 1000:9.2f} ms  "
+                f"{stats['queries']:>3} queries  {stats['peak_memory_kb']:>10} KiB",
+                file=sys.stderr,
+            )
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "database": dialect,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+    return 0
+
+
+def compare(args):
+    with open(args.baseline, encoding="utf-8") as handle:
+        baseline = json.load(handle)["results"]
+    with open(args.current, encoding="utf-8") as handle:
+        current = json.load(handle)["results"]
+
+    regressions = 0
+    for size, benchmarks in current.items():
+        for name, stats in benchmarks.items():
+            reference = baseline.get(size, {}).get(name)
+            if not reference:
+                print(f"{size:>8} users  {name:30} new benchmark")
+                continue
+            problems = []
+            time_ratio = stats["median_s"] / reference["median_s"] if reference["median_s"] else 1.0
+            if time_ratio > 1 + args.tolerance:
+                problems.append(f"time x{time_ratio:.2f}")
+            if stats["queries"] > reference["queries"]:
+                problems.append(f"queries {reference['queries']} -> {stats['queries']}")
+            if reference["peak_memory_kb"] and stats["peak_memory_kb"] > reference["peak_memory_kb"] * (1 + args.tolerance):
+                problems.append(f"memory {reference['peak_memory_kb']} -> {stats['peak_memory_kb']} KiB")
+            status = "REGRESSION " + ", ".join(problems) if problems else "ok"
+            regressions += bool(problems)
+            print(
+                f"{size:>8} users  {name:30} {reference['median_s'] * 1000:9.2f} -> "
+                f"{stats['median_s'] * 1000:9.2f} ms  {status}"
+            )
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard and leaderboard render path.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks and write a JSON report")
+    run_parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"user counts (default: {DEFAULT_SIZES})")
+    run_parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    run_parser.add_argument("--questionnaires", type=int, default=20)
+    run_parser.add_argument("--seed", type=int, default=38)
+    run_parser.add_argument("--database-url", help="empty database to seed (default: temporary SQLite file)")
+    run_parser.add_argument("--output", default="benchmarks/latest.json")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = subparsers.add_parser("compare", help="compare a report against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown ratio (default: 0.25)")
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Read-replica routing for the Flask-SQLAlchemy session.
+
+With ``DATABASE_READ_URL`` set, plain ``SELECT`` statements issued while
+handling a GET/HEAD request go to the replica bind; everything else (writes,
+other methods, CLI commands and background threads) uses the primary. A
+request switches to the primary for good once it writes, and a user who
+wrote recently stays on the primary for ``DATABASE_READ_STICKY_SECONDS`` so
+they always read their own writes. The replica is health-checked
+periodically (and its replication lag on Postgres); while unhealthy every
+read goes to the primary. GET endpoints that create rows they first looked
+up (``PRIMARY_ENDPOINTS``) always use the primary: a lagging replica would
+make them insert the row twice.
+"""
+import os
+import threading
+import time
+
+from flask import has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.sql import Select
+
+import metrics
+
+
+REPLICA_BIND = "replica"
+READ_METHODS = {"GET", "HEAD"}
+STICKY_SESSION_KEY = "db_primary_until"
+PRIMARY_ENDPOINTS = {"mission_detail", "api_pendu_state"}
+# Seconds behind the primary; 0 once all received WAL is replayed (an idle
+# primary has no new transactions to replay), NULL when not a standby
+REPLICATION_LAG_SQL = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+ROUTED_STATEMENTS = metrics.REGISTRY.counter(
+    "protec_db_routed_statements_total", "SELECT statements routed by target database.", ("target",)
+)
+
+
+class ReplicaHealth:
+    """Cached replica status, refreshed by at most one thread at a time."""
+
+    def __init__(self, check_interval=5.0, max_lag=10.0):
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self.healthy = True
+        self.reason = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def mark_unhealthy(self, reason):
+        self.healthy = False
+        self.reason = reason
+        self.checked_at = time.monotonic()
+
+    def is_healthy(self, engine):
+        if time.monotonic() - self.checked_at >= self.check_interval and self._lock.acquire(blocking=False):
+            try:
+                self._check(engine)
+            finally:
+                self._lock.release()
+        return self.healthy
+
+    def _check(self, engine):
+        try:
+            with engine.connect() as connection:
+                # sqlite_master forces SQLite to actually read the file
+                probe = "SELECT count(*) FROM sqlite_master" if engine.dialect.name == "sqlite" else "SELECT 1"
+                connection.execute(text(probe))
+                if engine.dialect.name == "postgresql":
+                    lag = connection.execute(text(REPLICATION_LAG_SQL)).scalar()
+                    if lag is not None and float(lag) > self.max_lag:
+                        self.mark_unhealthy(f"replication lag {float(lag):.1f}s")
+                        return
+        except Exception as exc:
+            self.mark_unhealthy(f"{type(exc).__name__}: {exc}")
+            return
+        self.healthy = True
+        self.reason = None
+        self.checked_at = time.monotonic()
+
+
+REPLICA_HEALTH = ReplicaHealth()
+
+
+def sticky_seconds():
+    return float(os.environ.get("DATABASE_READ_STICKY_SECONDS", 10))
+
+
+def mark_user_wrote():
+    """Keep the current browser on the primary for the stickiness window."""
+    if has_request_context():
+        session[STICKY_SESSION_KEY] = time.time() + sticky_seconds()
+
+
+class RoutingSession(Session):
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self.wrote = False
+
+    def _can_use_replica(self, clause):
+        if REPLICA_BIND not in self._db.engines or not has_request_context():
+            return False
+        if self.wrote or self.new or self.dirty or self.deleted:
+            return False
+        if request.method not in READ_METHODS or not isinstance(clause, Select):
+            return False
+        if request.endpoint in PRIMARY_ENDPOINTS:
+            return False
+        if session.get(STICKY_SESSION_KEY, 0) > time.time():
+            return False
+        return REPLICA_HEALTH.is_healthy(self._db.engines[REPLICA_BIND])
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._can_use_replica(clause):
+            ROUTED_STATEMENTS.inc(target="replica")
+            return self._db.engines[REPLICA_BIND]
+        if isinstance(clause, Select):
+            ROUTED_STATEMENTS.inc(target="primary")
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _mark_write(session_, *args):
+    # Anything flushed or executed as DML pins the rest of the request to the primary
+    if isinstance(session_, RoutingSession) and REPLICA_BIND in session_._db.engines and has_request_context():
+        session_.wrote = True
+        mark_user_wrote()
+
+
+def _mark_dml(orm_execute_state):
+    if not orm_execute_state.is_select:
+        _mark_write(orm_execute_state.session)
+
+
+def configure(app):
+    """Add the replica bind to the app config when DATABASE_READ_URL is set."""
+    read_url = os.environ.get("DATABASE_READ_URL")
+    if not read_url:
+        return False
+    if read_url.startswith("postgres://"):
+        read_url = read_url.replace("postgres://", "postgresql+psycopg2://", 1)
+    options = {"url": read_url, "pool_pre_ping": True}
+    if read_url.startswith("postgresql"):
+        options["connect_args"] = {"connect_timeout": 2}
+    app.config.setdefault("SQLALCHEMY_BINDS", {})[REPLICA_BIND] = options
+    REPLICA_HEALTH.check_interval = float(os.environ.get("DATABASE_READ_CHECK_INTERVAL", 5))
+    REPLICA_HEALTH.max_lag = float(os.environ.get("DATABASE_READ_MAX_LAG", 10))
+    return True
+
+
+def copy_sqlite_database(source, target):
+    """Overwrite the target SQLite database with the source (local replica testing)."""
+    source_connection = source.raw_connection()
+    target_connection = target.raw_connection()
+    try:
+        source_connection.driver_connection.backup(target_connection.driver_connection)
+    finally:
+        target_connection.close()
+        source_connection.close()
+
+
+def init_app(app, db):
+    with app.app_context():
+        replica = db.engines.get(REPLICA_BIND)
+    if replica is None:
+        return
+    if not event.contains(RoutingSession, "after_flush", _mark_write):
+        event.listen(RoutingSession, "after_flush", _mark_write)
+        event.listen(RoutingSession, "do_orm_execute", _mark_dml)
+
+    @event.listens_for(replica, "handle_error")
+    def _replica_failed(context):
+        # Connection-level failures stop routing until the next successful check
+        if context.is_disconnect or context.connection is None:
+            REPLICA_HEALTH.mark_unhealthy(str(context.original_exception))
+
+    metrics.REGISTRY.gauge(
+        "protec_db_replica_healthy", "1 when reads are routed to the replica.",
+        callback=lambda: {(): int(REPLICA_HEALTH.healthy)},
+    )
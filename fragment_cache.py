@@ -0,0 +1,167 @@
+"""Template fragment cache keyed by data versions.
+
+``{% cache "leaderboard", dashboard_version %}...{% endcache %}`` renders its
+body once per key and serves it from memory afterwards. Keys carry a data
+version: ``track_models`` bumps a topic's version after every commit that
+touched one of its models, so a fragment is re-rendered only once the data it
+shows has changed. Versions live in the process, like the live leaderboard
+hub; ``FRAGMENT_CACHE_TTL`` bounds how long a fragment can be reused when
+writes happen elsewhere (another worker, a CLI command).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from sqlalchemy import event
+
+import metrics
+
+
+FRAGMENT_LOOKUPS = metrics.REGISTRY.counter(
+    "protec_fragment_cache_total", "Template fragment lookups.", ("fragment", "result")
+)
+
+
+class DataVersions:
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def current(self, topic):
+        return self._versions.get(topic, 0)
+
+    def bump(self, *topics):
+        with self._lock:
+            for topic in topics:
+                self._versions[topic] = self._versions.get(topic, 0) + 1
+
+
+class FragmentCache:
+    """Small LRU of rendered fragments; stale versions simply age out."""
+
+    def __init__(self, max_entries=256, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (not self.ttl or entry[1] > now):
+                self._entries.move_to_end(key)
+                FRAGMENT_LOOKUPS.inc(fragment=key[0], result="hit")
+                return entry[0]
+        FRAGMENT_LOOKUPS.inc(fragment=key[0], result="miss")
+        html = render()
+        with self._lock:
+            self._entries[key] = (html, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+DATA_VERSIONS = DataVersions()
+FRAGMENTS = FragmentCache(ttl=float(os.environ.get("FRAGMENT_CACHE_TTL", 300)))
+
+
+class FragmentCacheExtension(Extension):
+    """``{% cache name, key... %}body{% endcache %}``"""
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        call = self.call_method("_render_fragment", [nodes.List(args)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, key, caller):
+        return FRAGMENTS.get_or_render(tuple(key), caller)
+
+
+class Lazy:
+    """Defers an expensive template value until a template actually reads it.
+
+    Passed in place of the value so that a cached fragment skips both the
+    rendering and the queries behind it.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._loaded = False
+        self._value = None
+
+    def _get(self):
+        if not self._loaded:
+            self._value = self._loader()
+            self._loaded = True
+        return self._value
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._get(), name)
+
+    def __getitem__(self, key):
+        return self._get()[key]
+
+    def __iter__(self):
+        return iter(self._get())
+
+    def __len__(self):
+        return len(self._get())
+
+    def __bool__(self):
+        return bool(self._get())
+
+
+def track_models(session_class, topic, models):
+    """Bump ``topic`` after each commit that wrote one of ``models``."""
+    models = tuple(models)
+    tables = {model.__table__ for model in models}
+
+    @event.listens_for(session_class, "after_flush")
+    def _collect_flushed(session, flush_context):
+        if any(isinstance(obj, models) for obj in (*session.new, *session.dirty, *session.deleted)):
+            session.info.setdefault("fragment_topics", set()).add(topic)
+
+    @event.listens_for(session_class, "do_orm_execute")
+    def _collect_bulk(orm_execute_state):
+        # Set-based INSERT/UPDATE/DELETE statements never go through the flush
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            if getattr(orm_execute_state.statement, "table", None) in tables:
+                orm_execute_state.session.info.setdefault("fragment_topics", set()).add(topic)
+
+    @event.listens_for(session_class, "after_commit")
+    def _bump_committed(session):
+        topics = session.info.pop("fragment_topics", None)
+        if topics:
+            DATA_VERSIONS.bump(*topics)
+
+    @event.listens_for(session_class, "after_rollback")
+    def _discard_rolled_back(session):
+        session.info.pop("fragment_topics", None)
+
+
+def init_app(app):
+    """Enable the compiled-template cache and the ``{% cache %}`` tag."""
+    cache_dir = os.environ.get("JINJA_CACHE_DIR") or os.path.join(app.instance_path, "jinja_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_options = {
+        **app.jinja_options,
+        "bytecode_cache": FileSystemBytecodeCache(cache_dir),
+        "extensions": [*app.jinja_options.get("extensions", ()), FragmentCacheExtension],
+    }
@@ -0,0 +1,301 @@
+"""Background jobs for long admin operations.
+
+Job types are registered with ``@jobs.job("kind")``; a job function receives a
+``JobContext`` and its JSON parameters and returns a JSON-serialisable result.
+Submitted jobs are stored in the ``job`` table and run on a small thread pool
+(``JOB_WORKERS``, 2 by default) outside the request that submitted them, so
+web workers are freed immediately. With ``JOB_WORKERS=0`` jobs stay queued
+until ``flask job-worker`` runs them in a separate process.
+
+A process that dies mid-job leaves its rows behind: when the next one starts
+running jobs (first request served, or ``job-worker`` start) it marks them
+``failed`` and queues the waiting ones again. Only one process should run jobs.
+
+Jobs are claimed with a conditional ``UPDATE`` so a job never runs twice, and
+cancellation is cooperative: ``ctx.check()`` raises ``JobCancelled`` once a
+cancel was requested, and everything not yet committed is rolled back.
+"""
+import inspect
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import select, update
+
+import metrics
+
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE = (QUEUED, RUNNING)
+
+# Progress and cancel flags are read from / written to the database at most this often
+SYNC_INTERVAL = 1.0
+
+JOBS_FINISHED = metrics.REGISTRY.counter(
+    "protec_jobs_total", "Background jobs finished.", ("kind", "status")
+)
+JOB_SECONDS = metrics.REGISTRY.histogram(
+    "protec_job_seconds", "Background job run time.", ("kind",),
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0),
+)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobType(NamedTuple):
+    kind: str
+    func: object
+    label: str
+    # Only one queued or running job of this kind at a time
+    exclusive: bool
+
+
+JOB_TYPES = {}
+
+
+def job(kind, label, exclusive=False):
+    def register(func):
+        JOB_TYPES[kind] = JobType(kind, func, label, exclusive)
+        return func
+
+    return register
+
+
+def validate_params(kind, params):
+    """Raise ValueError unless ``kind`` is registered and accepts ``params``."""
+    if kind not in JOB_TYPES:
+        raise ValueError("Type de tâche inconnu")
+    if not isinstance(params, dict):
+        raise ValueError("Paramètres invalides")
+    try:
+        inspect.signature(JOB_TYPES[kind].func).bind(None, **params)
+    except TypeError:
+        raise ValueError("Paramètres invalides") from None
+
+
+class JobContext:
+    def __init__(self, runner, job_id):
+        self.runner = runner
+        self.job_id = job_id
+        self.done = 0
+        self.total = None
+        self._cancel = threading.Event()
+        self._synced_at = time.monotonic()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        if self._cancel.is_set():
+            return True
+        if time.monotonic() - self._synced_at >= SYNC_INTERVAL:
+            self._sync()
+        return self._cancel.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def progress(self, done, total=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        if time.monotonic() - self._synced_at >= SYNC_INTERVAL:
+            self._sync()
+
+    def _sync(self):
+        # Reads the cancel flag (set by another process) and saves the progress,
+        # but only between the job's own transactions: never commit its work halfway
+        self._synced_at = time.monotonic()
+        session, table = self.runner.db.session, self.runner.model.__table__
+        if session().in_transaction():
+            with self.runner.db.engine.connect() as connection:
+                requested = connection.execute(
+                    select(table.c.cancel_requested).where(table.c.id == self.job_id)
+                ).scalar()
+        else:
+            session.execute(
+                update(table).where(table.c.id == self.job_id).values(progress=self.done, total=self.total)
+            )
+            requested = session.execute(select(table.c.cancel_requested).where(table.c.id == self.job_id)).scalar()
+            session.commit()
+        if requested:
+            self._cancel.set()
+
+
+class JobRunner:
+    def __init__(self, app, db, model, workers):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="job") if workers else None
+        self._running = {}
+        self._lock = threading.Lock()
+        self._recovered = False
+
+    def submit(self, kind, params=None, created_by=None, background=True):
+        """Queue a job (after ``validate_params``); return (job, created).
+
+        Exclusive kinds return the job already queued or running instead.
+        ``background=False`` leaves it to the caller to ``run()`` the job.
+        """
+        model, session = self.model, self.db.session
+        if JOB_TYPES[kind].exclusive:
+            existing = session.execute(
+                select(model).where(model.kind == kind, model.status.in_(ACTIVE)).order_by(model.id).limit(1)
+            ).scalar()
+            if existing is not None:
+                return existing, False
+        job_row = model(kind=kind, params=params or {}, status=QUEUED, created_by=created_by)
+        session.add(job_row)
+        session.commit()
+        if background and self.executor is not None:
+            self.executor.submit(self.run, job_row.id)
+        return job_row, True
+
+    def cancel(self, job_id):
+        """Request cancellation; a queued job is cancelled right away."""
+        table, session = self.model.__table__, self.db.session
+        session.execute(
+            update(table)
+            .where(table.c.id == job_id, table.c.status == QUEUED)
+            .values(status=CANCELLED, cancel_requested=True, finished_at=datetime.utcnow())
+        )
+        session.execute(
+            update(table).where(table.c.id == job_id, table.c.status == RUNNING).values(cancel_requested=True)
+        )
+        session.commit()
+        with self._lock:
+            context = self._running.get(job_id)
+        if context is not None:
+            context.cancel()
+
+    def recover(self, resubmit=True):
+        """Fail the jobs a previous process left running; resubmit the queued ones to the pool."""
+        if self._recovered:
+            return
+        with self._lock:
+            if self._recovered:
+                return
+            self._recovered = True
+            mine = list(self._running)
+        table = self.model.__table__
+        with self.app.app_context():
+            session = self.db.session
+            session.execute(
+                update(table)
+                .where(table.c.status == RUNNING, table.c.id.notin_(mine))
+                .values(status=FAILED, error="Interrompue par un redémarrage", finished_at=datetime.utcnow())
+            )
+            queued = session.execute(
+                select(table.c.id).where(table.c.status == QUEUED).order_by(table.c.id)
+            ).scalars().all()
+            session.commit()
+            session.remove()
+        if resubmit and self.executor is not None:
+            for job_id in queued:
+                self.executor.submit(self.run, job_id)
+
+    def live_progress(self, job_id):
+        """(done, total) of a job running in this process, else None."""
+        with self._lock:
+            context = self._running.get(job_id)
+        return (context.done, context.total) if context is not None else None
+
+    def run(self, job_id):
+        with self.app.app_context():
+            try:
+                return self._run(job_id)
+            except Exception:
+                self.app.logger.exception("Job %s crashed", job_id)
+                return None
+            finally:
+                self.db.session.remove()
+
+    def run_queued(self, limit=None):
+        """Run queued jobs one after the other in this thread (``flask job-worker``)."""
+        model = self.model
+        with self.app.app_context():
+            ids = self.db.session.execute(
+                select(model.id).where(model.status == QUEUED).order_by(model.id).limit(limit)
+            ).scalars().all()
+            self.db.session.remove()
+        return [job_id for job_id in ids if self.run(job_id) is not None]
+
+    def _run(self, job_id):
+        table, session = self.model.__table__, self.db.session
+        claimed = session.execute(
+            update(table)
+            .where(table.c.id == job_id, table.c.status == QUEUED)
+            .values(status=RUNNING, started_at=datetime.utcnow())
+        ).rowcount
+        session.commit()
+        if not claimed:
+            # Cancelled while queued, or picked up by another worker
+            return None
+        kind, params = session.execute(select(table.c.kind, table.c.params).where(table.c.id == job_id)).one()
+        context = JobContext(self, job_id)
+        with self._lock:
+            self._running[job_id] = context
+        result, error = None, None
+        started = time.perf_counter()
+        try:
+            job_type = JOB_TYPES.get(kind)
+            if job_type is None:
+                raise ValueError(f"Type de tâche inconnu : {kind}")
+            result = job_type.func(context, **(params or {}))
+            status = SUCCEEDED
+        except JobCancelled:
+            session.rollback()
+            status = CANCELLED
+        except Exception as exc:
+            session.rollback()
+            self.app.logger.exception("Job %s (%s) failed", job_id, kind)
+            status, error = FAILED, str(exc)[:500] or type(exc).__name__
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
+        session.execute(
+            update(table)
+            .where(table.c.id == job_id)
+            .values(
+                status=status,
+                result=result,
+                error=error,
+                progress=context.done,
+                total=context.total,
+                finished_at=datetime.utcnow(),
+            )
+        )
+        session.commit()
+        JOBS_FINISHED.inc(kind=kind, status=status)
+        JOB_SECONDS.observe(time.perf_counter() - started, kind=kind)
+        return status
+
+    @property
+    def running_count(self):
+        return len(self._running)
+
+
+def init_app(app, db, model):
+    workers = int(os.environ.get("JOB_WORKERS", 2))
+    runner = JobRunner(app, db, model, workers)
+    app.extensions["jobs"] = runner
+    if runner.executor is not None:
+        # Not at import: CLI commands create the app too, while the server may be running jobs
+        app.before_request(runner.recover)
+    metrics.REGISTRY.gauge(
+        "protec_jobs_running", "Background jobs running in this process.",
+        callback=lambda: {(): runner.running_count},
+    )
+    return runner
@@ -0,0 +1,129 @@
+"""In-process fan-out hub pushing leaderboard deltas over Server-Sent Events.
+
+Score-writing endpoints publish one small event per change. The hub keeps
+only the latest delta per user, flushes bursts every ``coalesce_interval``
+seconds and hands the batch to every connected browser. A client that has
+not taken ``max_backlog`` flushes in a row is too slow: its backlog is dropped
+and it is told to re-fetch the scoreboard instead of slowing the others down. Events only reach clients connected to the same
+process, so run a single worker (threaded) when relying on live updates.
+"""
+import json
+import threading
+import time
+
+
+class Subscriber:
+    def __init__(self, max_backlog):
+        self.max_backlog = max_backlog
+        self.pending = {}
+        self.backlog = 0
+        self.resync = False
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def offer(self, deltas):
+        with self.condition:
+            if self.resync:
+                return
+            for delta in deltas:
+                self.pending[delta["user_id"]] = delta
+            # Flushes the stream has not written out yet, however big each one was
+            self.backlog += 1
+            if self.backlog > self.max_backlog:
+                # Slow consumer: drop the backlog and ask for a fresh scoreboard
+                self.pending.clear()
+                self.resync = True
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def wait(self, timeout):
+        with self.condition:
+            if not self.pending and not self.resync and not self.closed:
+                self.condition.wait(timeout)
+            deltas = list(self.pending.values())
+            resync = self.resync
+            self.pending.clear()
+            self.backlog = 0
+            self.resync = False
+            return deltas, resync
+
+
+class LeaderboardHub:
+    def __init__(self, max_clients=500, heartbeat=15.0, coalesce_interval=0.5, max_backlog=10):
+        self.max_clients = max_clients
+        self.heartbeat = heartbeat
+        self.coalesce_interval = coalesce_interval
+        self.max_backlog = max_backlog
+        self._subscribers = set()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._dispatcher = None
+        self.published = 0
+        self.rejected = 0
+
+    @property
+    def client_count(self):
+        return len(self._subscribers)
+
+    @property
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def subscribe(self):
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                self.rejected += 1
+                return None
+            subscriber = Subscriber(self.max_backlog)
+            self._subscribers.add(subscriber)
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(target=self._dispatch, name="leaderboard-hub", daemon=True)
+                self._dispatcher.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+        subscriber.close()
+
+    def publish(self, delta):
+        if not self._subscribers:
+            return
+        with self._lock:
+            self._pending[delta["user_id"]] = delta
+            self.published += 1
+        self._wakeup.set()
+
+    def _dispatch(self):
+        while True:
+            self._wakeup.wait()
+            # Let the burst accumulate, then fan out a single coalesced batch
+            time.sleep(self.coalesce_interval)
+            with self._lock:
+                self._wakeup.clear()
+                deltas = list(self._pending.values())
+                self._pending.clear()
+                subscribers = list(self._subscribers)
+            if deltas:
+                for subscriber in subscribers:
+                    subscriber.offer(deltas)
+
+    def stream(self, subscriber):
+        try:
+            yield "retry: 5000\n\n"
+            while not subscriber.closed:
+                deltas, resync = subscriber.wait(self.heartbeat)
+                if resync:
+                    yield "event: resync\ndata: {}\n\n"
+                elif deltas:
+                    payload = json.dumps({"entries": deltas}, ensure_ascii=False)
+                    yield f"event: leaderboard\ndata: {payload}\n\n"
+                else:
+                    yield ": heartbeat\n\n"
+        finally:
+            self.unsubscribe(subscriber)
@@ -0,0 +1,295 @@
+"""In-process metrics exported in the Prometheus text format.
+
+No external collector is needed: counters, gauges and histograms live in
+memory and ``/metrics`` renders them on demand so they can be scraped locally.
+"""
+import hmac
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, abort, g, has_request_context, request
+from sqlalchemy import event
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+LOOPBACK_ADDRESSES = {"127.0.0.1", "::1", "localhost"}
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self.header()
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        # Optional callable returning {label tuple: value}, evaluated at scrape time
+        self._callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def collect(self):
+        if self._callback:
+            try:
+                items = sorted(self._callback().items())
+            except Exception:
+                items = []
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        lines = self.header()
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][index] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self):
+        with self._lock:
+            items = sorted(
+                (key, {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]})
+                for key, s in self._series.items()
+            )
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        # One metric per name: a gauge registered again by a second create_app()
+        # (scripts, tests) replaces the first instead of being exported twice
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_COUNT = REGISTRY.counter(
+    "protec_http_requests_total", "HTTP requests handled, by Flask endpoint.", ("endpoint", "method", "status")
+)
+REQUEST_ERRORS = REGISTRY.counter(
+    "protec_http_request_errors_total", "HTTP requests answered with a 5xx status.", ("endpoint",)
+)
+REQUEST_LATENCY = REGISTRY.histogram(
+    "protec_http_request_duration_seconds", "Time spent handling a request.", ("endpoint",)
+)
+DB_QUERIES = REGISTRY.counter("protec_db_queries_total", "SQL statements executed.", ("endpoint",))
+DB_QUERY_SECONDS = REGISTRY.counter(
+    "protec_db_query_seconds_total", "Time spent executing SQL statements.", ("endpoint",)
+)
+DB_QUERIES_PER_REQUEST = REGISTRY.histogram(
+    "protec_db_queries_per_request", "SQL statements executed per request.", ("endpoint",), QUERY_COUNT_BUCKETS
+)
+DB_TIME_PER_REQUEST = REGISTRY.histogram(
+    "protec_db_time_per_request_seconds", "Time spent in SQL per request.", ("endpoint",)
+)
+PASSWORD_HASH_SECONDS = REGISTRY.histogram(
+    "protec_password_hash_duration_seconds", "Time spent hashing or verifying passwords.", ("operation",),
+    (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+
+def _endpoint_label():
+    if has_request_context():
+        return request.endpoint or "unmatched"
+    return "none"
+
+
+def _pool_stats(engine):
+    pool = engine.pool
+    stats = {}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            stats[(name,)] = method()
+    return stats
+
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        endpoint = _endpoint_label()
+        DB_QUERIES.inc(endpoint=endpoint)
+        DB_QUERY_SECONDS.inc(elapsed, endpoint=endpoint)
+        if has_request_context() and "metrics_start" in g:
+            g.metrics_queries += 1
+            g.metrics_query_time += elapsed
+
+
+def metrics_authorized():
+    token = os.environ.get("METRICS_TOKEN")
+    if token:
+        supplied = request.headers.get("Authorization", "")
+        return hmac.compare_digest(supplied, f"Bearer {token}")
+    return request.remote_addr in LOOPBACK_ADDRESSES
+
+
+def init_app(app, db):
+    with app.app_context():
+        engine = db.engine
+        engines = list(db.engines.values())
+    for bound_engine in engines:
+        instrument_engine(bound_engine)
+    REGISTRY.gauge(
+        "protec_db_pool_connections",
+        "Connection pool state (size, checkedin, checkedout, overflow).",
+        ("state",),
+        callback=lambda: _pool_stats(engine),
+    )
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_query_time = 0.0
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return response
+        endpoint = _endpoint_label()
+        REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+        REQUEST_COUNT.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        if response.status_code >= 500:
+            REQUEST_ERRORS.inc(endpoint=endpoint)
+        DB_QUERIES_PER_REQUEST.observe(g.metrics_queries, endpoint=endpoint)
+        DB_TIME_PER_REQUEST.observe(g.metrics_query_time, endpoint=endpoint)
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        if not metrics_authorized():
+            abort(404)
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
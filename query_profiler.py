@@ -0,0 +1,201 @@
+"""Per-request SQL recorder for development and tests.
+
+When ``QUERY_PROFILER`` is enabled every statement is recorded with its
+duration and the project call site that issued it. Statements repeated with
+different parameters (the N+1 pattern hidden behind lazy relationships) are
+flagged, and a summary is returned in ``X-Query-*`` headers and the log.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+N_PLUS_ONE_THRESHOLD = 3
+
+# Maximum number of statements per endpoint; exceeding it is reported in the
+# X-Query-Budget header and the log, and fails assert_query_budget().
+QUERY_BUDGETS = {
+    "api_menu": 3,
+    "api_profile": 5,
+    "api_questionnaires": 4,
+    "api_questions_search": 5,
+    "api_admin_users": 1,
+    "api_questionnaire_detail": 5,
+    "api_pendu_state": 3,
+    "api_pendu_word": 2,
+    "api_pendu_result": 8,
+    "api_ambulance_score": 8,
+    "api_progress": 7,
+    "home": 6,
+}
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+_local = threading.local()
+
+
+def normalize_statement(statement: str) -> str:
+    statement = _LITERALS.sub("?", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+def _call_site():
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_ROOT) and filename != __file__ and "site-packages" not in filename:
+            return f"{os.path.relpath(filename, PROJECT_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def record(self, statement, duration, call_site):
+        self.queries.append({"statement": statement, "duration": duration, "call_site": call_site})
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(query["duration"] for query in self.queries)
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        groups = defaultdict(list)
+        for query in self.queries:
+            groups[normalize_statement(query["statement"])].append(query)
+        return [
+            {
+                "statement": statement,
+                "count": len(queries),
+                "call_sites": sorted({query["call_site"] for query in queries}),
+            }
+            for statement, queries in groups.items()
+            if len(queries) >= threshold
+        ]
+
+    def summary(self):
+        lines = [f"{self.count} queries in {self.total_time * 1000:.1f} ms"]
+        for query in self.queries:
+            lines.append(f"  {query['duration'] * 1000:7.2f} ms  {query['call_site']}  {query['statement'][:120]}")
+        for group in self.repeated():
+            lines.append(f"  N+1: {group['count']}x from {', '.join(group['call_sites'])}: {group['statement'][:120]}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def record_queries():
+    """Record the statements issued by the current thread inside the block."""
+    recorder = QueryRecorder()
+    stack = getattr(_local, "recorders", None)
+    if stack is None:
+        stack = _local.recorders = []
+    stack.append(recorder)
+    try:
+        yield recorder
+    finally:
+        stack.remove(recorder)
+
+
+def _active_recorders():
+    recorders = list(getattr(_local, "recorders", ()))
+    if has_request_context():
+        recorder = g.get("query_recorder")
+        if recorder is not None:
+            recorders.append(recorder)
+    return recorders
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("profiler_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("profiler_query_start")
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    recorders = _active_recorders()
+    if not recorders:
+        return
+    call_site = _call_site()
+    for recorder in recorders:
+        recorder.record(statement, duration, call_site)
+
+
+def instrument_engine(engine):
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def assert_query_budget(client, url, budget=None, method="GET", **kwargs):
+    """Issue a request through a Flask test client and check its query budget.
+
+    ``budget`` defaults to the QUERY_BUDGETS entry of the matched endpoint.
+    Returns the response so callers can keep asserting on it.
+    """
+    response = client.open(url, method=method, **kwargs)
+    if "X-Query-Count" not in response.headers:
+        raise AssertionError(f"{method} {url}: no X-Query-Count header, is QUERY_PROFILER=1 set?")
+    count = int(response.headers["X-Query-Count"])
+    if budget is None:
+        endpoint = response.headers.get("X-Query-Endpoint")
+        budget = QUERY_BUDGETS.get(endpoint)
+        if budget is None:
+            raise AssertionError(f"No query budget declared for {method} {url} (endpoint {endpoint})")
+    if count > budget:
+        raise AssertionError(
+            f"{method} {url} issued {count} queries (budget {budget}); "
+            f"repeated statements: {response.headers.get('X-Query-N-Plus-One', '0')}"
+        )
+    return response
+
+
+def init_app(app, db):
+    if not app.config.get("QUERY_PROFILER"):
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument_engine(engine)
+
+    @app.before_request
+    def _start_query_recorder():
+        g.query_recorder = QueryRecorder()
+
+    @app.after_request
+    def _report_queries(response):
+        recorder = g.pop("query_recorder", None)
+        if recorder is None:
+            return response
+        endpoint = request.endpoint or "unmatched"
+        repeated = recorder.repeated()
+        response.headers["X-Query-Count"] = str(recorder.count)
+        response.headers["X-Query-Time-Ms"] = f"{recorder.total_time * 1000:.2f}"
+        response.headers["X-Query-N-Plus-One"] = str(len(repeated))
+        response.headers["X-Query-Endpoint"] = endpoint
+
+        budget = QUERY_BUDGETS.get(endpoint)
+        over_budget = budget is not None and recorder.count > budget
+        if budget is not None:
+            response.headers["X-Query-Budget"] = f"{recorder.count}/{budget}"
+        if repeated or over_budget:
+            app.logger.warning("%s %s (%s)\n%s", request.method, request.path, endpoint, recorder.summary())
+        else:
+            app.logger.info(
+                "%s %s: %d queries in %.1f ms", request.method, request.path, recorder.count, recorder.total_time * 1000
+            )
+        return response
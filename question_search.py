@@ -0,0 +1,168 @@
+"""Full-text index over the question bank.
+
+One document per question: its text, its answer labels and the title and
+category of its questionnaire. SQLite uses an FTS5 table (``unicode61``,
+diacritics removed) fed with text folded and stemmed here by a light French
+stemmer; Postgres stores a weighted ``tsvector`` under a GIN index built with
+the ``french`` configuration. Both sides analyse queries the same way as
+documents, and the last query term matches as a prefix so results show up
+while typing.
+"""
+import re
+import unicodedata
+
+from sqlalchemy import bindparam, text
+
+
+TABLE = "question_search"
+MAX_QUERY_TERMS = 8
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+SQLITE_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+    "text, options, title, category, questionnaire_id UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+)
+POSTGRES_DDL = (
+    f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+    "question_id INTEGER PRIMARY KEY, questionnaire_id INTEGER NOT NULL, document TSVECTOR NOT NULL)",
+    f"CREATE INDEX IF NOT EXISTS ix_{TABLE}_document ON {TABLE} USING GIN (document)",
+    f"CREATE INDEX IF NOT EXISTS ix_{TABLE}_questionnaire ON {TABLE} (questionnaire_id)",
+)
+# bm25 column weights: question text, answers, questionnaire title, category
+SQLITE_WEIGHTS = (4.0, 1.0, 2.0, 1.0)
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('french', :text), 'A') || setweight(to_tsvector('french', :title), 'B')"
+    " || setweight(to_tsvector('french', :options), 'C') || setweight(to_tsvector('french', :category), 'D')"
+)
+
+
+def fold(value):
+    """Lowercase and strip accents (``Brûlure`` -> ``brulure``)."""
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def stem(word):
+    """Minimal French stemmer (Savoy): plurals and a few common endings."""
+    if len(word) < 6:
+        return word
+    if word.endswith("x"):
+        return word[:-2] + "l" if word.endswith("aux") else word[:-1]
+    for ending in ("s", "r", "e", "e"):
+        if word.endswith(ending):
+            word = word[:-1]
+    if len(word) > 1 and word[-1] == word[-2]:
+        word = word[:-1]
+    return word
+
+
+def terms(value):
+    return _TOKEN.findall(fold(value))
+
+
+def analyze(value):
+    return " ".join(stem(term) for term in terms(value))
+
+
+def is_postgres(connection):
+    return connection.dialect.name == "postgresql"
+
+
+def ensure_index(connection):
+    for statement in POSTGRES_DDL if is_postgres(connection) else SQLITE_DDL:
+        connection.execute(text(statement))
+
+
+def is_empty(connection):
+    return connection.execute(text(f"SELECT 1 FROM {TABLE} LIMIT 1")).first() is None
+
+
+def delete_questions(connection, question_ids):
+    if not question_ids:
+        return
+    column = "question_id" if is_postgres(connection) else "rowid"
+    connection.execute(
+        text(f"DELETE FROM {TABLE} WHERE {column} IN :ids").bindparams(bindparam("ids", expanding=True)),
+        {"ids": list(question_ids)},
+    )
+
+
+def delete_questionnaires(connection, questionnaire_ids):
+    # A scan of the FTS table on SQLite; questionnaires are rarely deleted
+    if not questionnaire_ids:
+        return
+    connection.execute(
+        text(f"DELETE FROM {TABLE} WHERE questionnaire_id IN :ids").bindparams(bindparam("ids", expanding=True)),
+        {"ids": list(questionnaire_ids)},
+    )
+
+
+def index_documents(connection, documents):
+    """Insert documents (dicts: id, questionnaire_id, text, options, title, category)."""
+    if not documents:
+        return
+    if is_postgres(connection):
+        rows = [
+            {
+                "id": doc["id"],
+                "questionnaire_id": doc["questionnaire_id"],
+                **{field: fold(doc[field]) for field in ("text", "options", "title", "category")},
+            }
+            for doc in documents
+        ]
+        statement = (
+            f"INSERT INTO {TABLE} (question_id, questionnaire_id, document) "
+            f"VALUES (:id, :questionnaire_id, {POSTGRES_DOCUMENT}) "
+            "ON CONFLICT (question_id) DO UPDATE SET "
+            "questionnaire_id = EXCLUDED.questionnaire_id, document = EXCLUDED.document"
+        )
+    else:
+        rows = [
+            {
+                "id": doc["id"],
+                "questionnaire_id": doc["questionnaire_id"],
+                **{field: analyze(doc[field]) for field in ("text", "options", "title", "category")},
+            }
+            for doc in documents
+        ]
+        statement = (
+            f"INSERT INTO {TABLE} (rowid, text, options, title, category, questionnaire_id) "
+            "VALUES (:id, :text, :options, :title, :category, :questionnaire_id)"
+        )
+    connection.execute(text(statement), rows)
+
+
+def match_expression(query, postgres):
+    """Build a MATCH / to_tsquery expression, or None when nothing is searchable."""
+    words = terms(query)[:MAX_QUERY_TERMS]
+    if not words:
+        return None
+    if postgres:
+        return " & ".join(words[:-1] + [words[-1] + ":*"])
+    phrases = [f'"{stem(word)}"' for word in words]
+    phrases[-1] += "*"
+    return " ".join(phrases)
+
+
+def search(connection, query, limit, offset=0):
+    """Return [(question_id, rank)] best first; rank is higher for better matches."""
+    postgres = is_postgres(connection)
+    expression = match_expression(query, postgres)
+    if expression is None:
+        return []
+    if postgres:
+        statement = (
+            f"SELECT question_id, ts_rank_cd(document, query) AS score "
+            f"FROM {TABLE}, to_tsquery('french', :expression) AS query "
+            "WHERE document @@ query ORDER BY score DESC, question_id LIMIT :limit OFFSET :offset"
+        )
+    else:
+        weights = ", ".join(str(weight) for weight in SQLITE_WEIGHTS)
+        statement = (
+            # bm25() is lower for better matches; negate it to rank like Postgres
+            f"SELECT rowid, -bm25({TABLE}, {weights}) AS score FROM {TABLE} "
+            f"WHERE {TABLE} MATCH :expression ORDER BY score DESC, rowid LIMIT :limit OFFSET :offset"
+        )
+    rows = connection.execute(text(statement), {"expression": expression, "limit": limit, "offset": offset})
+    return [(row[0], float(row[1])) for row in rows]
@@ -0,0 +1,78 @@
+"""Short-lived claims carried in the signed session cookie.
+
+At login the session receives ``claims``: user id, role, the account's
+``session_version`` and an expiry (``SESSION_CLAIMS_TTL`` seconds, 300 by
+default). While they are fresh, endpoints trust them without reading the
+``user`` table. Changing a role or a password, or deleting the account, bumps
+the version: ``VERSIONS`` marks the user as changed in this process so the
+next request re-reads the account, and a session holding an older version is
+signed out. Other processes notice once the claims expire.
+"""
+import os
+import threading
+import time
+from typing import NamedTuple
+
+
+CLAIMS_KEY = "claims"
+TTL = float(os.environ.get("SESSION_CLAIMS_TTL", 300))
+
+
+class SessionUser(NamedTuple):
+    id: int
+    role: str
+    version: int
+    expires: float
+
+    @property
+    def fresh(self):
+        return self.expires > time.time()
+
+
+class SessionVersions:
+    """Current session version per user, as known by this process."""
+
+    _CHANGED = object()
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def remember(self, user_id, version):
+        with self._lock:
+            self._versions[user_id] = version
+
+    def changed(self, user_ids):
+        # The new version is read from the database by the next request
+        with self._lock:
+            for user_id in user_ids:
+                self._versions[user_id] = self._CHANGED
+
+    def accepts(self, user_id, version):
+        """False once the user changed here; unknown users are trusted until their claims expire."""
+        known = self._versions.get(user_id, version)
+        return known is not self._CHANGED and known == version
+
+
+VERSIONS = SessionVersions()
+
+
+def issue(session, user_id, role, version, ttl=TTL):
+    claims = SessionUser(user_id, role, version or 0, time.time() + ttl)
+    session[CLAIMS_KEY] = list(claims)
+    VERSIONS.remember(user_id, claims.version)
+    return claims
+
+
+def read(session):
+    """Claims stored in the session (fresh or not), or None."""
+    try:
+        claims = SessionUser(*session.get(CLAIMS_KEY))
+    except TypeError:
+        return None
+    return claims if isinstance(claims.id, int) and isinstance(claims.version, int) else None
+
+
+def clear(session):
+    session.pop("user_id", None)
+    session.pop(CLAIMS_KEY, None)
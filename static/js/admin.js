@@ -1,5 +1,22 @@
 const adminTableBody = document.querySelector('#admin-users-body');
+const adminScroll = document.querySelector('#admin-users-scroll');
+const adminSearch = document.querySelector('#admin-user-search');
 const adminAlert = document.querySelector('#admin-alert');
+// Virtualized list: rows have a fixed height (styles.css) and only the
+// visible window (plus OVERSCAN rows each side) is rendered
+const ROW_HEIGHT = 64;
+const OVERSCAN = 10;
+const PAGE_SIZE = 100;
+const adminList = {
+  query: '',
+  users: [],
+  next: null,
+  done: false,
+  loading: null,
+  generation: 0,
+  window: null,
+  roleDrafts: {},
+};
 const ROLE_LABELS = {
   participant: 'Participant',
   formateur: 'Formateur',
@@ -17,18 +34,23 @@ function clearAdminAlert() {
   if (adminAlert) adminAlert.classList.add('hidden');
 }
 
+function escapeAdminHtml(value) {
+  return String(value ?? '').replace(/[&<>"']/g, (char) => `&#${char.charCodeAt(0)};`);
+}
+
 function renderAdminRow(user) {
+  const role = adminList.roleDrafts[user.id] || user.role;
   return `
     <tr data-user-id="${user.id}">
       <td class="scoreboard__user">
-        <span class="avatar" data-avatar="${user.avatar}">${user.avatar_emoji || '🛰️'}</span>
-        <span>${user.username}</span>
+        <span class="avatar" data-avatar="${escapeAdminHtml(user.avatar)}">${user.avatar_emoji || '🛰️'}</span>
+        <span>${escapeAdminHtml(user.username)}</span>
       </td>
-      <td>${user.email}</td>
+      <td>${escapeAdminHtml(user.email)}</td>
       <td>
         <select class="role-select">
           ${Object.keys(ROLE_LABELS)
-            .map((role) => `<option value="${role}" ${user.role === role ? 'selected' : ''}>${ROLE_LABELS[role]}</option>`)
+            .map((value) => `<option value="${value}" ${role === value ? 'selected' : ''}>${ROLE_LABELS[value]}</option>`)
             .join('')}
         </select>
       </td>
@@ -43,25 +65,72 @@ function renderAdminRow(user) {
   `;
 }
 
-async function refreshAdminUsers() {
+function spacerRow(height) {
+  return height > 0 ? `<tr aria-hidden="true" style="height:${height}px"><td colspan="5"></td></tr>` : '';
+}
+
+function renderAdminWindow(force = false) {
   if (!adminTableBody) return;
-  try {
-    const res = await fetch('/api/admin/users');
-    if (!res.ok) {
+  if (!adminList.users.length) {
+    adminList.window = null;
+    adminTableBody.innerHTML = adminList.done
+      ? '<tr><td colspan="5" class="muted">Aucun compte ne correspond.</td></tr>'
+      : '<tr><td colspan="5" class="muted">Chargement des comptes…</td></tr>';
+    return;
+  }
+  const viewport = adminScroll ? adminScroll.clientHeight : 600;
+  const scrollTop = adminScroll ? adminScroll.scrollTop : 0;
+  const start = Math.max(0, Math.floor(scrollTop / ROW_HEIGHT) - OVERSCAN);
+  const end = Math.min(adminList.users.length, Math.ceil((scrollTop + viewport) / ROW_HEIGHT) + OVERSCAN);
+  const key = `${start}:${end}:${adminList.users.length}`;
+  if (!force && adminList.window === key) return;
+  adminList.window = key;
+  const emojis = window.AVATAR_EMOJIS || {};
+  adminTableBody.innerHTML = spacerRow(start * ROW_HEIGHT)
+    + adminList.users
+      .slice(start, end)
+      .map((user) => renderAdminRow({ ...user, avatar_emoji: emojis[user.avatar] }))
+      .join('')
+    + spacerRow((adminList.users.length - end) * ROW_HEIGHT);
+  // Fetch the next page before the user reaches the end of what is loaded
+  if (end + OVERSCAN >= adminList.users.length) loadAdminPage();
+}
+
+function loadAdminPage() {
+  if (adminList.done || adminList.loading) return adminList.loading;
+  const generation = adminList.generation;
+  const params = new URLSearchParams({ limit: PAGE_SIZE });
+  if (adminList.query) params.set('q', adminList.query);
+  if (adminList.next) params.set('after', adminList.next);
+  adminList.loading = (async () => {
+    try {
+      const res = await fetch(`/api/admin/users?${params}`);
       const data = await res.json().catch(() => ({}));
-      throw new Error(data.error || 'Impossible de charger les utilisateurs');
-    }
-    const data = await res.json();
-    if (!data.users.length) {
-      adminTableBody.innerHTML = '<tr><td colspan="5" class="muted">Aucun compte enregistré pour le moment.</td></tr>';
-      return;
+      if (!res.ok) throw new Error(data.error || 'Impossible de charger les utilisateurs');
+      if (generation !== adminList.generation) return;
+      adminList.users.push(...data.users);
+      adminList.next = data.next;
+      adminList.done = !data.next;
+    } catch (err) {
+      adminList.done = true;
+      setAdminAlert(err.message);
+    } finally {
+      if (generation === adminList.generation) {
+        adminList.loading = null;
+        renderAdminWindow(true);
+      }
     }
-    adminTableBody.innerHTML = data.users
-      .map((user) => renderAdminRow({ ...user, avatar_emoji: (window.AVATAR_EMOJIS || {})[user.avatar] }))
-      .join('');
-  } catch (err) {
-    setAdminAlert(err.message);
-  }
+  })();
+  return adminList.loading;
+}
+
+async function refreshAdminUsers() {
+  if (!adminTableBody) return;
+  adminList.generation += 1;
+  Object.assign(adminList, { users: [], next: null, done: false, loading: null, window: null, roleDrafts: {} });
+  if (adminScroll) adminScroll.scrollTop = 0;
+  renderAdminWindow(true);
+  await loadAdminPage();
 }
 
 async function updateUser(userId, role, password, triggerBtn) {
@@ -76,7 +145,9 @@ async function updateUser(userId, role, password, triggerBtn) {
       const data = await res.json().catch(() => ({}));
       throw new Error(data.error || 'Mise à jour impossible');
     }
-    await refreshAdminUsers();
+    const user = adminList.users.find((item) => String(item.id) === String(userId));
+    if (user) user.role = role;
+    delete adminList.roleDrafts[userId];
     setAdminAlert('Rôle mis à jour avec succès', false);
   } catch (err) {
     setAdminAlert(err.message);
@@ -95,7 +166,8 @@ async function deleteUser(userId, triggerBtn) {
       const data = await res.json().catch(() => ({}));
       throw new Error(data.error || 'Suppression impossible');
     }
-    await refreshAdminUsers();
+    adminList.users = adminList.users.filter((user) => String(user.id) !== String(userId));
+    renderAdminWindow(true);
     setAdminAlert('Compte supprimé', false);
   } catch (err) {
     setAdminAlert(err.message);
@@ -108,6 +180,24 @@ function setupAdminPanel() {
   if (!adminTableBody) return;
   refreshAdminUsers();
 
+  adminScroll?.addEventListener('scroll', () => window.requestAnimationFrame(() => renderAdminWindow()), { passive: true });
+
+  let searchTimer = null;
+  adminSearch?.addEventListener('input', () => {
+    window.clearTimeout(searchTimer);
+    searchTimer = window.setTimeout(() => {
+      adminList.query = adminSearch.value.trim();
+      refreshAdminUsers();
+    }, 250);
+  });
+
+  // Keep unsaved role choices when their row scrolls out and back in
+  adminTableBody.addEventListener('change', (evt) => {
+    const select = evt.target.closest('.role-select');
+    const userId = select?.closest('tr')?.dataset.userId;
+    if (userId) adminList.roleDrafts[userId] = select.value;
+  });
+
   adminTableBody.addEventListener('click', (evt) => {
     const target = evt.target;
     if (target.classList.contains('save-role')) {
@@ -7,6 +7,18 @@ const TILE_SIZE = 30;
 const GRID_WIDTH = 20;
 const GRID_HEIGHT = 20;
 const COINS_PER_POINT = 4; // 4 pièces = 1 point
+const ENEMY_STEP_MS = 500;
+// Rules are replayed server-side (ambulance_replay.py): keep both in sync
+
+// xorshift32, reproduced bit for bit by the server replay
+function nextRandom() {
+    let x = gameState.rng;
+    x ^= x << 13;
+    x ^= x >>> 17;
+    x ^= x << 5;
+    gameState.rng = x >>> 0;
+    return gameState.rng;
+}
 
 // Game state
 let gameState = {
@@ -17,9 +29,15 @@ let gameState = {
     score: 0,
     gameOver: false,
     bestScore: parseInt(document.getElementById('best-score').textContent) || 0,
-    lastSpawnTime: 0,
-    spawnInterval: 10000 // Spawn new enemy every 10 seconds
+    spawnInterval: 10000, // Spawn new enemy every 10 seconds
+    // Input log sent with the score: seed, enemy steps played, [step, dir] moves
+    seed: ((Math.random() * 0xffffffff) >>> 0) || 1,
+    rng: 0,
+    ticks: 0,
+    moves: []
 };
+gameState.rng = gameState.seed;
+const SPAWN_EVERY_TICKS = gameState.spawnInterval / ENEMY_STEP_MS;
 
 // Maze layout (1 = wall, 0 = path)
 const maze = [
@@ -70,7 +88,6 @@ function init() {
 
     updateCoinsDisplay();
     setupControls();
-    gameState.lastSpawnTime = Date.now();
     gameLoop();
 }
 
@@ -90,7 +107,7 @@ function spawnNewEnemy() {
     );
 
     if (availableCorners.length > 0) {
-        const spawn = availableCorners[Math.floor(Math.random() * availableCorners.length)];
+        const spawn = availableCorners[nextRandom() % availableCorners.length];
         const color = colors[gameState.enemies.length % colors.length];
 
         gameState.enemies.push({
@@ -149,6 +166,7 @@ function movePlayer(dir) {
         gameState.player.x = newX;
         gameState.player.y = newY;
         gameState.player.dir = dir;
+        gameState.moves.push([gameState.ticks, dir[0]]);
 
         // Check collision with enemies IMMEDIATELY after moving
         const hitEnemy = gameState.enemies.some(enemy =>
@@ -306,16 +324,17 @@ function gameLoop() {
 
     const now = Date.now();
 
-    // Move enemies every 500ms
-    if (now - lastEnemyMove > 500) {
+    // Move enemies every 500ms; spawns are counted in enemy steps so they replay exactly
+    if (now - lastEnemyMove > ENEMY_STEP_MS) {
+        // Counted before moving: endGame() may run inside moveEnemies() and logs ticks
+        gameState.ticks++;
         moveEnemies();
         lastEnemyMove = now;
-    }
 
-    // Spawn new enemy every 10 seconds
-    if (now - gameState.lastSpawnTime > gameState.spawnInterval) {
-        spawnNewEnemy();
-        gameState.lastSpawnTime = now;
+        // Spawn new enemy every 10 seconds
+        if (!gameState.gameOver && gameState.ticks % SPAWN_EVERY_TICKS === 0) {
+            spawnNewEnemy();
+        }
     }
 
     requestAnimationFrame(gameLoop);
@@ -323,23 +342,17 @@ function gameLoop() {
 
 // End game
 async function endGame(won) {
+    // Several trucks can reach the ambulance on the same step
+    if (gameState.gameOver) return;
     gameState.gameOver = true;
 
-    // Save score
-    try {
-        const res = await fetch('/api/ambulance/score', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ score: gameState.score })
-        });
-
-        if (res.ok) {
-            const data = await res.json();
-            document.getElementById('best-score').textContent = data.best_score;
-        }
-    } catch (e) {
-        console.error('Failed to save score:', e);
-    }
+    // Save score with its input log (queued, works offline, verified by replay)
+    ProtecSync.record('ambulance_score', {
+        score: gameState.score,
+        replay: { seed: gameState.seed, ticks: gameState.ticks, moves: gameState.moves }
+    });
+    gameState.bestScore = Math.max(gameState.bestScore, gameState.score);
+    document.getElementById('best-score').textContent = gameState.bestScore;
 
     // Show game over screen
     document.getElementById('final-score').textContent = gameState.score;
@@ -14,12 +14,22 @@ function clearAlert() {
   if (authAlert) authAlert.classList.add('hidden');
 }
 
+const MAX_RETRIES = 3;
+
 async function postJson(url, payload) {
-  const res = await fetch(url, {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(payload),
-  });
+  let res;
+  for (let attempt = 0; ; attempt += 1) {
+    res = await fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(payload),
+    });
+    // Shed while the whole class signs in: wait as asked, with some jitter, and retry
+    const retryAfter = Number(res.headers.get('Retry-After'));
+    if (res.status !== 503 || !retryAfter || attempt >= MAX_RETRIES) break;
+    setAlert('Serveur très sollicité, nouvelle tentative…', false);
+    await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000 * (1 + Math.random() / 2)));
+  }
   if (!res.ok) {
     const data = await res.json().catch(() => ({}));
     throw new Error(data.error || 'Erreur serveur');
@@ -116,6 +116,15 @@ function clearAuthState() {
   localStorage.removeItem('isAuthenticated');
 }
 
+async function forgetOfflineData() {
+  // Queued scores and cached pages belong to this account, not to the next trainee
+  try {
+    await window.ProtecSync?.forget();
+  } catch (err) {
+    console.warn('Données hors ligne :', err);
+  }
+}
+
 function setAlert(message, isError = true) {
   if (!appAlert) return;
   appAlert.textContent = message;
@@ -334,10 +343,84 @@ async function refreshMenu() {
   fillProfileForm(currentUser);
 }
 
+function scoreOf(row) {
+  return Number(row.querySelector('[data-field="score"]')?.textContent || 0);
+}
+
+function applyLeaderboardEntries(entries) {
+  const body = qs('#scoreboard tbody');
+  if (!body) return;
+  entries.forEach((entry) => {
+    let row = body.querySelector(`tr[data-user-id="${entry.user_id}"]`);
+    if (!row) {
+      body.querySelector('td[colspan]')?.parentElement.remove();
+      row = document.createElement('tr');
+      row.dataset.userId = entry.user_id;
+      row.innerHTML = `
+        <td class="scoreboard__user"><span class="avatar"></span><span></span></td>
+        <td data-field="missions"></td>
+        <td data-field="score"></td>`;
+      const [avatar, name] = row.querySelectorAll('.scoreboard__user span');
+      avatar.dataset.avatar = entry.avatar;
+      avatar.textContent = AVATAR_EMOJIS[entry.avatar] || AVATAR_EMOJIS.alpha;
+      name.textContent = entry.username;
+      body.appendChild(row);
+    }
+    row.querySelector('[data-field="missions"]').textContent = entry.missions;
+    row.querySelector('[data-field="score"]').textContent = entry.score;
+    const userCell = row.querySelector('.scoreboard__user');
+    userCell.querySelectorAll('.badge').forEach((badge) => badge.remove());
+    (entry.badges || []).forEach((badge) => {
+      const span = document.createElement('span');
+      span.className = 'badge';
+      span.title = badge.label;
+      span.textContent = badge.icon;
+      userCell.appendChild(span);
+    });
+    row.classList.remove('scoreboard__row--updated');
+    void row.offsetWidth;
+    row.classList.add('scoreboard__row--updated');
+  });
+  const rows = qsa('#scoreboard tbody tr[data-user-id]');
+  rows.sort((a, b) => scoreOf(b) - scoreOf(a)).forEach((row) => body.appendChild(row));
+}
+
+async function refreshScoreboard() {
+  const wrapper = qs('#scoreboard')?.closest('.table-wrapper');
+  if (!wrapper) return;
+  try {
+    const res = await fetch('/api/leaderboard/fragment');
+    if (!res.ok) return;
+    wrapper.outerHTML = await res.text();
+  } catch (err) {
+    log('Classement non rafraîchi : ' + err.message);
+  }
+}
+
+function setupLiveLeaderboard() {
+  if (!qs('#scoreboard') || !window.EventSource) return;
+  const source = new EventSource('/api/leaderboard/stream');
+  source.addEventListener('leaderboard', (event) => {
+    const entries = JSON.parse(event.data).entries || [];
+    entries.filter((entry) => entry.removed).forEach((entry) => {
+      qs(`#scoreboard tr[data-user-id="${entry.user_id}"]`)?.remove();
+    });
+    applyLeaderboardEntries(entries.filter((entry) => !entry.removed));
+  });
+  // The server dropped our backlog: swap in a fresh scoreboard, after a
+  // random delay so clients told to resync together do not fetch together
+  source.addEventListener('resync', () => {
+    window.setTimeout(refreshScoreboard, Math.random() * 3000);
+  });
+  window.addEventListener('beforeunload', () => source.close());
+}
+
 async function handleLogout() {
   try {
+    await window.ProtecSync?.flush();
     await postJson('/api/logout', {});
     clearAuthState();
+    await forgetOfflineData();
     window.location.href = '/auth';
   } catch (err) {
     setAlert(err.message);
@@ -378,6 +461,7 @@ function setupProfileDrawer() {
         const res = await fetch('/api/profile', { method: 'DELETE' });
         if (!res.ok) throw new Error();
         clearAuthState();
+        await forgetOfflineData();
         window.location.href = '/auth';
       } catch (err) {
         setProfileAlert('Impossible de supprimer le compte.');
@@ -808,6 +892,7 @@ async function saveQuestionnaire() {
         category: wizardState.category,
         icon: wizardState.icon,
         questions: wizardState.questions.map((q) => ({
+          id: q.serverId,
           text: q.text,
           type: q.type,
           points: q.points,
@@ -816,7 +901,9 @@ async function saveQuestionnaire() {
       };
       const endpoint = wizardState.editingId ? `/api/questionnaires/${wizardState.editingId}` : '/api/questionnaires';
       const method = wizardState.editingId ? 'PUT' : 'POST';
-      await postJson(endpoint, payload, method);
+      const saved = await postJson(endpoint, payload, method);
+      // New questions now have ids: a second save must update them, not add them again
+      if (wizardState.editingId) loadQuestionnaireForEditing(saved);
       setWizardAlert(
         wizardState.editingId
           ? 'Questionnaire mis à jour avec succès.'
@@ -1146,9 +1233,14 @@ function showAnswerFeedback() {
 async function persistQuestionnaireResult() {
   if (!playerState.questionnaire) return;
   try {
+    const answers = {};
+    playerState.questionnaire.questions.forEach((question, idx) => {
+      answers[question.id] = isAnswerCorrect(question, playerState.answers[idx]);
+    });
     await postJson(`/api/questionnaires/${playerState.questionnaire.id}/result`, {
       score: playerState.score,
       max_score: playerState.totalPoints,
+      answers,
     });
     await refreshQuestionnaires();
     await loadProfileData();
@@ -1213,6 +1305,8 @@ function loadQuestionnaireForEditing(questionnaire) {
   wizardState.icon = questionnaire.icon;
   wizardState.questions = (questionnaire.questions || []).map((q) => ({
     id: `q-${q.id}`,
+    // Sent back on save so the question is updated in place
+    serverId: q.id,
     text: q.text,
     type: q.type,
     points: q.points,
@@ -1262,6 +1356,7 @@ async function init() {
   await refreshQuestionnaires();
   setupQuestionnaireActions();
   setupPlayerNavigation();
+  setupLiveLeaderboard();
   log('Interface initialisée avec GSAP et Flask.');
 }
 
@@ -1286,26 +1381,35 @@ async function playSplashThenInit() {
 }
 
 // --- ADMIN FUNCTIONS ---
-async function loadAdminUsers() {
+const adminBonusPaging = { next: null };
+
+async function loadAdminUsers(append = false) {
   const container = document.getElementById('admin-users-list');
+  const moreButton = document.getElementById('admin-users-more');
   if (!container) return;
 
-  container.innerHTML = 'Chargement...';
+  if (!append) {
+    adminBonusPaging.next = null;
+    container.innerHTML = 'Chargement...';
+  }
 
   try {
-    const res = await fetch('/api/admin/users');
+    const params = new URLSearchParams({ limit: 50 });
+    if (append && adminBonusPaging.next) params.set('after', adminBonusPaging.next);
+    const res = await fetch(`/api/admin/users?${params}`);
     if (!res.ok) throw new Error('Failed to load users');
-    const users = await res.json();
+    const data = await res.json();
 
-    // Ensure users is an array
-    if (!Array.isArray(users)) {
+    if (!Array.isArray(data.users)) {
       container.innerHTML = 'Format de réponse invalide.';
-      console.error('Expected array, got:', users);
+      console.error('Expected { users: [] }, got:', data);
       return;
     }
 
-    container.innerHTML = '';
-    users.forEach(u => {
+    if (!append) container.innerHTML = '';
+    adminBonusPaging.next = data.next;
+    moreButton?.classList.toggle('hidden', !data.next);
+    data.users.forEach(u => {
       const div = document.createElement('div');
       div.className = 'panel';
       div.style.display = 'flex';
@@ -1317,7 +1421,7 @@ async function loadAdminUsers() {
                 </div>
                 <div style="display:flex; gap:10px; align-items:center;">
                     <label style="font-size:12px;">Bonus:</label>
-                    <input type="number" value="${u.bonus_points}" id="bonus-${u.id}" style="width:80px; padding:4px;" />
+                    <input type="number" value="${u.bonus_points}" data-original="${u.bonus_points}" data-user-id="${u.id}" id="bonus-${u.id}" class="bonus-input" style="width:80px; padding:4px;" />
                     <button class="btn" onclick="saveBonusPoints(${u.id})">Sauver</button>
                 </div>
             `;
@@ -1355,4 +1459,40 @@ async function saveBonusPoints(userId) {
 
 window.saveBonusPoints = saveBonusPoints;
 
+async function saveAllBonusPoints() {
+  const changed = qsa('#admin-users-list .bonus-input').filter((input) => input.value !== input.dataset.original);
+  if (!changed.length) {
+    alert('Aucun bonus modifié.');
+    return;
+  }
+
+  try {
+    const res = await fetch('/api/admin/users/bulk', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        operations: changed.map((input) => ({ id: Number(input.dataset.userId), bonus: parseInt(input.value, 10) })),
+      }),
+    });
+    const data = await res.json().catch(() => ({}));
+    if (!res.ok) {
+      alert(data.error || 'Erreur lors de la mise à jour.');
+      return;
+    }
+    const failed = data.results.filter((result) => !result.ok);
+    data.results.filter((result) => result.ok).forEach((result) => {
+      const input = document.getElementById(`bonus-${result.id}`);
+      if (input) input.dataset.original = input.value;
+    });
+    alert(failed.length
+      ? `${data.updated} bonus mis à jour, ${failed.length} en erreur.`
+      : `${data.updated} bonus mis à jour !`);
+  } catch (e) {
+    console.error(e);
+    alert('Erreur technique.');
+  }
+}
+
+window.saveAllBonusPoints = saveAllBonusPoints;
+
 document.addEventListener('DOMContentLoaded', playSplashThenInit);
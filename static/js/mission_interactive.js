@@ -462,13 +462,13 @@ async function finishMission(success) {
     qs('#end-score').textContent = currentState.score;
     // Save progress
     if (success) {
-        try {
-            await fetch(`/api/progress/${MISSION_CONTEXT.levelId}`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ status: 'terminee', score: currentState.score }),
-            });
-        } catch (e) { console.error(e); }
+        // Queued, then flushed with /api/sync as soon as the network allows
+        await ProtecSync.record('progress', {
+            level_id: MISSION_CONTEXT.levelId,
+            status: 'terminee',
+            score: currentState.score,
+        });
+        ProtecSync.flush();
     }
 }
 
@@ -3,7 +3,7 @@ const qs = (sel) => document.querySelector(sel);
 
 // Logic State
 let currentWord = "";
-let currentWordIndex = -1;
+let currentWordId = null;
 let guessedLetters = new Set();
 let wrongCount = 0;
 const MAX_ERRORS = 6; // Emoji steps: 0=Happy -> 6=Skull
@@ -21,15 +21,23 @@ const keyboard = qs('#keyboard');
 const activeGame = qs('#active-game');
 const endScreen = qs('#end-screen');
 
+// Offline play: words are fetched a few at a time and results are queued
+const WORD_BUFFER_TARGET = 10;
+let wordBuffer = [];
+let playedLocally = new Set();
+let stats = { played_count: 0, won_count: 0, lost_count: 0, total_words: 0, score: 0 };
+
 // Logic State
 let baseScore = 0;
 if (gameData) {
     baseScore = parseInt(gameData.dataset.baseScore || "0");
+    stats.total_words = parseInt(gameData.dataset.totalWords || "0");
 }
 
 // Init
 async function init() {
     console.log("Pendu Init");
+    await ProtecSync.flush(); // Results queued offline count in the stats below
     await fetchStats();
     fetchNextWord();
     renderKeyboard();
@@ -40,6 +48,7 @@ async function fetchStats() {
         const res = await fetch('/api/pendu/state');
         if (!res.ok) throw new Error("Failed to fetch state");
         const data = await res.json();
+        stats = { ...stats, ...data };
         updateStats(data);
         if (data.is_finished) {
             showEndScreen(data);
@@ -60,35 +69,55 @@ function updateStats(data) {
     if (totalScoreVal) totalScoreVal.textContent = baseScore + currentScore;
 
     if (progressBar) {
-        const pct = (data.played_count / (data.total_words || 300)) * 100;
+        const pct = (data.played_count / (data.total_words || stats.total_words || 1)) * 100;
         progressBar.style.width = `${pct}%`;
     }
 }
 
+async function refillWords() {
+    const res = await fetch(`/api/pendu/word?count=${WORD_BUFFER_TARGET}`);
+    if (!res.ok) throw new Error("Failed to fetch words");
+    const data = await res.json();
+    if (data.finished) return true;
+    const known = new Set(wordBuffer.map((w) => w.id));
+    data.words
+        .filter((w) => !playedLocally.has(w.id) && !known.has(w.id))
+        .forEach((w) => wordBuffer.push(w));
+    return false;
+}
+
 async function fetchNextWord() {
     console.log("Fetching next word...");
     resetBoard();
 
-    // Explicitly sync stats when starting new word (after 3s delay)
-    // This ensures header info is up to date
-    await fetchStats();
-
     try {
-        const res = await fetch('/api/pendu/word');
-        if (!res.ok) throw new Error("Failed to fetch word");
-        const data = await res.json();
-
-        if (data.finished) {
-            fetchStats(); // Trigger end screen via stats
-            return;
+        if (!wordBuffer.length) {
+            const finished = await refillWords();
+            if (finished) {
+                fetchStats(); // Trigger end screen via stats
+                return;
+            }
         }
+        const next = wordBuffer.shift();
+        if (!next) throw new Error("No word available");
 
-        currentWord = (data.word || "").toUpperCase();
-        currentWordIndex = data.index;
+        currentWord = (next.word || "").toUpperCase();
+        currentWordId = next.id;
         console.log("New word loaded:", currentWord);
         renderWordSlots();
+
+        // Top the buffer up in the background while the network is there
+        if (wordBuffer.length < WORD_BUFFER_TARGET / 2) refillWords().catch(() => {});
     } catch (err) {
         console.error("fetchNextWord error:", err);
+        const msg = qs('#result-message');
+        if (msg) {
+            msg.textContent = "Hors ligne : reconnecte-toi pour charger de nouveaux mots.";
+            msg.className = "danger-text";
+        }
+        if (keyboard) keyboard.classList.add('hidden');
+        const nextAction = qs('#next-action');
+        if (nextAction) nextAction.classList.remove('hidden');
     }
 }
 
@@ -178,53 +207,35 @@ function checkLoss() {
 async function endRound(success) {
     console.log("End round. Success:", success);
 
-    try {
-        const res = await fetch('/api/pendu/result', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ index: currentWordIndex, success: success })
-        });
-        const data = await res.json();
-
-        // Update stats UI immediately
-        updateStats({
-            played_count: data.finished ? 300 : parseInt(statPlayed.textContent || "0") + 1,
-            won_count: data.won,
-            lost_count: data.lost,
-            total_words: 300,
-            score: data.score
-        });
-
-        // Show result message
-        const msg = qs('#result-message');
-        if (msg) {
-            msg.textContent = success ? "BRAVO ! +10 pts" : `DOMMAGE ! C'était "${currentWord}"`;
-            msg.className = success ? "success-text" : "danger-text";
-        }
+    // Applied locally right away, sent to the server with the next sync batch
+    playedLocally.add(currentWordId);
+    ProtecSync.record('pendu_result', { id: currentWordId, success: success });
+
+    stats.played_count += 1;
+    if (success) stats.won_count += 1;
+    else stats.lost_count += 1;
+    stats.score = stats.won_count * 10;
+    const finished = stats.played_count >= stats.total_words;
+    updateStats(stats);
+
+    // Show result message
+    const msg = qs('#result-message');
+    if (msg) {
+        msg.textContent = success ? "BRAVO ! +10 pts" : `DOMMAGE ! C'était "${currentWord}"`;
+        msg.className = success ? "success-text" : "danger-text";
+    }
 
-        // Hide keyboard, show next button (as backup)
-        if (keyboard) keyboard.classList.add('hidden');
-        const nextAction = qs('#next-action');
-        if (nextAction) nextAction.classList.remove('hidden');
+    // Hide keyboard, show next button (as backup)
+    if (keyboard) keyboard.classList.add('hidden');
+    const nextAction = qs('#next-action');
+    if (nextAction) nextAction.classList.remove('hidden');
 
-        const nextBtn = qs('#next-word-btn');
-        if (nextBtn) nextBtn.onclick = () => fetchNextWord();
-
-        // AUTO ADVANCE REMOVED - User must click Next
-        // if (!data.finished) {
-        //     console.log("Auto-advancing in 3s...");
-        //     setTimeout(() => {
-        //         fetchNextWord();
-        //     }, 3000);
-        // } else {
-        if (data.finished) {
-            showEndScreen(data);
-        }
-        // }
+    const nextBtn = qs('#next-word-btn');
+    if (nextBtn) nextBtn.onclick = () => fetchNextWord();
 
-    } catch (err) {
-        console.error("endRound error:", err);
-        // Fallback removed
+    if (finished) {
+        ProtecSync.flush();
+        showEndScreen(stats);
     }
 }
 
@@ -0,0 +1,168 @@
+// Offline score queue: events are stored in IndexedDB with a client-generated id
+// and flushed in batches to /api/sync, which ignores ids it has already applied.
+// Each signed-in user has a queue of their own (the user id is on the script
+// tag): on a shared device, events are only ever sent for the account that
+// played them, and the server refuses a queue that belongs to another account.
+// Loaded by the game pages and imported by the service worker (sw.js).
+(function (scope) {
+  const DB_PREFIX = 'protec-offline-';
+  const LEGACY_DB = 'protec-offline';
+  const STORE = 'events';
+  const BATCH_SIZE = 100;
+  const FLUSH_DELAY = 3000;
+  const SYNC_TAG_PREFIX = 'protec-sync-';
+  const PAGE_CACHE = 'protec-pages';
+
+  const script = scope.document && scope.document.currentScript;
+  const currentUser = (script && script.dataset.user) || null;
+
+  let flushTimer = null;
+  const flushing = {};
+
+  function openDb(owner) {
+    return new Promise((resolve, reject) => {
+      const req = indexedDB.open(DB_PREFIX + owner, 1);
+      req.onupgradeneeded = () => req.result.createObjectStore(STORE, { keyPath: 'seq', autoIncrement: true });
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => reject(req.error);
+    });
+  }
+
+  async function transaction(owner, mode, work) {
+    const db = await openDb(owner);
+    return new Promise((resolve, reject) => {
+      const tx = db.transaction(STORE, mode);
+      const req = work(tx.objectStore(STORE));
+      tx.oncomplete = () => {
+        db.close();
+        resolve(req ? req.result : undefined);
+      };
+      tx.onerror = () => {
+        db.close();
+        reject(tx.error);
+      };
+    });
+  }
+
+  function newId() {
+    if (scope.crypto && scope.crypto.randomUUID) return scope.crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+  }
+
+  async function sendBatch(owner, events, keepalive) {
+    const res = await fetch('/api/sync', {
+      method: 'POST',
+      credentials: 'same-origin',
+      keepalive: Boolean(keepalive),
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        user_id: Number(owner),
+        events: events.map(({ id, type, payload, at }) => ({ id, type, payload, at })),
+      }),
+    });
+    if (!res.ok) throw new Error(`sync failed (${res.status})`);
+    return res.json();
+  }
+
+  function registerBackgroundSync(owner) {
+    if (!scope.navigator || !scope.navigator.serviceWorker || scope.registration) return;
+    scope.navigator.serviceWorker.ready
+      .then((reg) => reg.sync && reg.sync.register(SYNC_TAG_PREFIX + owner))
+      .catch(() => {});
+  }
+
+  async function drain(owner, keepalive) {
+    let synced = 0;
+    for (;;) {
+      const events = await transaction(owner, 'readonly', (store) => store.getAll(undefined, BATCH_SIZE));
+      if (!events.length) return synced;
+      // Refused with 409 when another account is signed in: the events stay queued
+      const data = await sendBatch(owner, events, keepalive);
+      // Applied, duplicate and rejected events are all settled server-side
+      const settled = new Set(data.results.filter((r) => r.id).map((r) => r.id));
+      await transaction(owner, 'readwrite', (store) => {
+        events.filter((e) => settled.has(e.id)).forEach((e) => store.delete(e.seq));
+      });
+      synced += settled.size;
+      if (events.length < BATCH_SIZE) return synced;
+    }
+  }
+
+  function flush(options = {}) {
+    const owner = options.owner || currentUser;
+    clearTimeout(flushTimer);
+    if (!owner) return Promise.resolve(0);
+    if (!flushing[owner]) {
+      flushing[owner] = drain(owner, options.keepalive)
+        .catch((err) => {
+          if (options.throwOnError) throw err;
+          console.warn('Synchronisation reportée :', err.message);
+          registerBackgroundSync(owner);
+          return 0;
+        })
+        .finally(() => {
+          delete flushing[owner];
+        });
+    }
+    return flushing[owner];
+  }
+
+  function scheduleFlush() {
+    clearTimeout(flushTimer);
+    flushTimer = setTimeout(flush, FLUSH_DELAY);
+  }
+
+  async function record(type, payload) {
+    const event = { id: newId(), type, payload, at: new Date().toISOString() };
+    try {
+      await transaction(currentUser, 'readwrite', (store) => store.add(event));
+    } catch (err) {
+      // No IndexedDB (private browsing): fall back to a direct request
+      return sendBatch(currentUser, [event]).catch((e) => console.error('Événement perdu :', e));
+    }
+    scheduleFlush();
+    return event;
+  }
+
+  function pending() {
+    if (!currentUser) return Promise.resolve(0);
+    return transaction(currentUser, 'readonly', (store) => store.count()).catch(() => 0);
+  }
+
+  function deleteDb(name) {
+    return new Promise((resolve) => {
+      const req = indexedDB.deleteDatabase(name);
+      req.onsuccess = req.onerror = req.onblocked = () => resolve();
+    });
+  }
+
+  // Signing out: nothing of this account stays on the device for the next user
+  async function forget() {
+    clearTimeout(flushTimer);
+    await Promise.all([
+      currentUser ? deleteDb(DB_PREFIX + currentUser) : null,
+      scope.caches ? scope.caches.delete(PAGE_CACHE) : null,
+    ]);
+  }
+
+  scope.ProtecSync = { record, flush, pending, forget, SYNC_TAG_PREFIX, PAGE_CACHE };
+
+  if (scope.indexedDB) {
+    // Queue shared by every account on the device, from before per-user queues:
+    // its events cannot be attributed to anyone, so they are dropped
+    deleteDb(LEGACY_DB);
+  }
+
+  if (scope.document) {
+    if ('serviceWorker' in navigator) {
+      window.addEventListener('load', () => {
+        navigator.serviceWorker.register('/sw.js').catch((err) => console.warn('Service worker :', err));
+      });
+    }
+    window.addEventListener('online', () => flush());
+    document.addEventListener('visibilitychange', () => {
+      if (document.visibilityState === 'hidden') flush({ keepalive: true });
+    });
+    flush();
+  }
+})(self);
@@ -0,0 +1,231 @@
+"""Synthetic dataset generation for scale testing and benchmarks.
+
+Rows are written with batched Core ``INSERT`` statements and explicit primary
+keys, and every synthetic account shares one precomputed password hash, so
+large datasets build without per-row ORM overhead or password hashing.
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, text
+from werkzeug.security import generate_password_hash
+
+import word_bank
+
+
+SYNTHETIC_PASSWORD = "synthetic-password"
+ROLE_WEIGHTS = {"participant": 0.9, "formateur": 0.08, "admin": 0.02}
+# Share of users who have started each level
+LEVEL_PARTICIPATION = {"arret_cardiaque": 0.6, "pendu_300": 0.7, "ambulance_chase": 0.5}
+
+
+def _next_id(model):
+    from app import db
+
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _insert_batches(model, rows, batch_size):
+    from app import db
+
+    # Core executemany on the table skips ORM bulk bookkeeping entirely
+    connection = db.session.connection()
+    statement = model.__table__.insert()
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            connection.execute(statement, batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        connection.execute(statement, batch)
+        written += len(batch)
+    return written
+
+
+def _sync_sequences(models):
+    from app import db
+
+    # Explicit ids do not advance Postgres serial sequences; catch them up
+    if db.engine.dialect.name != "postgresql":
+        return
+    for model in models:
+        table = model.__table__.name
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM \"{table}\"))"
+        ))
+
+
+def _level_progress(slug, rng, word_ids):
+    if slug == "pendu_300":
+        # Most players stop early, a few go through the whole word bank
+        played = max(1, round(len(word_ids) * rng.betavariate(1.2, 3)))
+        won = round(played * rng.uniform(0.4, 0.95))
+        status = "termine" if played >= len(word_ids) else "en_cours"
+        data = {"played_ids": rng.sample(word_ids, played), "won": won, "lost": played - won}
+        return won * 10, status, data
+    if slug == "ambulance_chase":
+        score = int(rng.expovariate(1 / 25))
+        return score, "termine" if score else "en_cours", {}
+    score = rng.choice([0, 0, 50, 80, 100])
+    return score, "termine" if score else "en_cours", {}
+
+
+def seed_synthetic(
+    users=1000,
+    questionnaires=20,
+    questions_per_questionnaire=10,
+    options_per_question=4,
+    results_per_user=3.0,
+    batch_size=5000,
+    seed=38,
+    log=None,
+):
+    """Bulk-generate users, progress, questionnaires and results.
+
+    Returns a dict with the number of rows written per table.
+    """
+    from app import (
+        LEVEL_SEED,
+        USER_ROLES,
+        AnswerOption,
+        Level,
+        Progress,
+        Question,
+        Questionnaire,
+        QuestionnaireResult,
+        User,
+        db,
+    )
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    password_hash = generate_password_hash(SYNTHETIC_PASSWORD)
+    roles = [role for role in ROLE_WEIGHTS if role in USER_ROLES]
+    role_weights = [ROLE_WEIGHTS[role] for role in roles]
+    avatars = ["alpha", "bravo", "charlie", "delta"]
+    counts = {}
+
+    def report(table):
+        if log:
+            log(f"{table}: {counts[table]} rows ({time.perf_counter() - started:.1f} s)")
+
+    first_user_id = _next_id(User)
+    user_ids = range(first_user_id, first_user_id + users)
+    counts["user"] = _insert_batches(User, (
+        {
+            "id": user_id,
+            "username": f"Secouriste {user_id}",
+            "email": f"synthetic-{user_id}@protec.local",
+            "password_hash": password_hash,
+            "role": rng.choices(roles, role_weights)[0],
+            "avatar": rng.choice(avatars),
+            "bonus_points": rng.choice([0, 0, 0, 10, 25, 50]),
+            "created_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+        }
+        for user_id in user_ids
+    ), batch_size)
+    report("user")
+
+    levels = {level.slug: level.id for level in Level.query.all()}
+    word_ids = list(word_bank.ALL_IDS)
+
+    def progress_rows():
+        for user_id in user_ids:
+            for level in LEVEL_SEED:
+                slug = level["slug"]
+                if slug not in levels or rng.random() >= LEVEL_PARTICIPATION.get(slug, 0.5):
+                    continue
+                score, status, data = _level_progress(slug, rng, word_ids)
+                yield {
+                    "user_id": user_id,
+                    "level_id": levels[slug],
+                    "score": score,
+                    "status": status,
+                    "data": data,
+                    "updated_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+                }
+
+    counts["progress"] = _insert_batches(Progress, progress_rows(), batch_size)
+    report("progress")
+
+    author_id = first_user_id if users else User.query.filter_by(role="admin").first().id
+    first_questionnaire_id = _next_id(Questionnaire)
+    questionnaire_ids = list(range(first_questionnaire_id, first_questionnaire_id + questionnaires))
+    counts["questionnaire"] = _insert_batches(Questionnaire, (
+        {
+            "id": questionnaire_id,
+            "title": f"Questionnaire {questionnaire_id}",
+            "description": "Questionnaire généré pour les tests de charge",
+            "category": rng.choice(["PSE1", "PSE2", "Général"]),
+            "icon": "sparkles",
+            "created_by": author_id,
+            "created_at": now,
+        }
+        for questionnaire_id in questionnaire_ids
+    ), batch_size)
+
+    first_question_id = _next_id(Question)
+    question_ids = {}
+
+    def question_rows():
+        question_id = first_question_id
+        for questionnaire_id in questionnaire_ids:
+            for number in range(questions_per_questionnaire):
+                question_ids.setdefault(questionnaire_id, []).append(question_id)
+                yield {
+                    "id": question_id,
+                    "text": f"Question {number + 1} du questionnaire {questionnaire_id}",
+                    "type": "single",
+                    "points": 1,
+                    "questionnaire_id": questionnaire_id,
+                    "position": number,
+                }
+                question_id += 1
+
+    counts["question"] = _insert_batches(Question, question_rows(), batch_size)
+
+    def option_rows():
+        for ids in question_ids.values():
+            for question_id in ids:
+                correct = rng.randrange(options_per_question) if options_per_question else None
+                for number in range(options_per_question):
+                    yield {"label": f"Réponse {number + 1}", "is_correct": number == correct, "question_id": question_id}
+
+    counts["answer_option"] = _insert_batches(AnswerOption, option_rows(), batch_size)
+    report("answer_option")
+
+    def result_rows():
+        if not questionnaire_ids:
+            return
+        max_score = questions_per_questionnaire
+        for user_id in user_ids:
+            taken = min(len(questionnaire_ids), int(rng.expovariate(1 / results_per_user))) if results_per_user else 0
+            for questionnaire_id in rng.sample(questionnaire_ids, taken):
+                yield {
+                    "user_id": user_id,
+                    "questionnaire_id": questionnaire_id,
+                    "score": rng.randint(0, max_score),
+                    "max_score": max_score,
+                    "attempts": 1 + int(rng.expovariate(1 / 1.5)),
+                    "updated_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+                }
+
+    counts["questionnaire_result"] = _insert_batches(QuestionnaireResult, result_rows(), batch_size)
+    report("questionnaire_result")
+
+    _sync_sequences([User, Questionnaire, Question])
+    db.session.commit()
+    # Core inserts bypass the incremental rollup, search index and award hooks
+    from app import rebuild_awards, rebuild_question_index, rebuild_rollups
+
+    rebuild_rollups()
+    rebuild_question_index()
+    rebuild_awards()
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    return counts
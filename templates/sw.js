@@ -0,0 +1,78 @@
+// Service worker: precaches static assets, keeps the last visited pages for
+// offline use and replays queued score events (offline_sync.js).
+importScripts('/static/js/offline_sync.js');
+
+const CACHE_VERSION = {{ cache_version | tojson }};
+const STATIC_CACHE = `protec-static-${CACHE_VERSION}`;
+const { PAGE_CACHE } = ProtecSync;
+const PRECACHE = {{ assets | tojson }};
+const CDN_HOSTS = ['cdn.jsdelivr.net', 'cdnjs.cloudflare.com', 'fonts.googleapis.com', 'fonts.gstatic.com'];
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(
+    caches.open(STATIC_CACHE)
+      .then((cache) => cache.addAll(PRECACHE))
+      .then(() => self.skipWaiting()),
+  );
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(
+        keys.filter((key) => key.startsWith('protec-static-') && key !== STATIC_CACHE).map((key) => caches.delete(key)),
+      ))
+      .then(() => self.clients.claim()),
+  );
+});
+
+async function cacheFirst(request, cacheName) {
+  const cached = await caches.match(request);
+  if (cached) return cached;
+  const response = await fetch(request);
+  if (response.ok || response.type === 'opaque') {
+    const cache = await caches.open(cacheName);
+    cache.put(request, response.clone());
+  }
+  return response;
+}
+
+async function networkFirst(request) {
+  const cache = await caches.open(PAGE_CACHE);
+  try {
+    const response = await fetch(request);
+    // Never keep the login redirect as the offline copy of a page
+    if (response.ok && !response.redirected) cache.put(request, response.clone());
+    return response;
+  } catch (err) {
+    const cached = await cache.match(request);
+    if (cached) return cached;
+    throw err;
+  }
+}
+
+self.addEventListener('fetch', (event) => {
+  const { request } = event;
+  if (request.method !== 'GET') return;
+  const url = new URL(request.url);
+
+  if (url.origin !== self.location.origin) {
+    if (CDN_HOSTS.includes(url.hostname)) event.respondWith(cacheFirst(request, STATIC_CACHE));
+    return;
+  }
+  if (url.pathname.startsWith('/static/')) {
+    event.respondWith(cacheFirst(request, STATIC_CACHE));
+    return;
+  }
+  if (request.mode === 'navigate') {
+    event.respondWith(networkFirst(request));
+  }
+  // API calls go straight to the network; score writes are queued by the pages
+});
+
+self.addEventListener('sync', (event) => {
+  if (event.tag.startsWith(ProtecSync.SYNC_TAG_PREFIX)) {
+    const owner = event.tag.slice(ProtecSync.SYNC_TAG_PREFIX.length);
+    event.waitUntil(ProtecSync.flush({ owner, throwOnError: true }));
+  }
+});
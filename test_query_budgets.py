@@ -0,0 +1,113 @@
+"""SQL query budgets of the budgeted endpoints.
+
+Runs the app in-process on a temporary SQLite database with the query
+profiler on, and drives every endpoint of ``query_profiler.QUERY_BUDGETS``
+through ``assert_query_budget``: first as a new player (rows created, medals
+awarded), then again once the rows exist.
+
+    python -m pytest -q test_query_budgets.py
+"""
+import os
+
+import pytest
+
+
+PARTICIPANT_PAGES = (
+    "/",
+    "/api/menu",
+    "/api/profile",
+    "/api/questionnaires",
+    "/api/questionnaires/{questionnaire_id}",
+    "/api/pendu/state",
+)
+DESIGNER_PAGES = (
+    "/api/questionnaires",
+    "/api/questions/search?q=question",
+    "/api/admin/users",
+)
+
+
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory):
+    # The app is built at import: configure it first
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp_path_factory.mktemp('budgets') / 'protec.db'}"
+    os.environ["QUERY_PROFILER"] = "1"
+    os.environ["AMBULANCE_VERIFY_INTERVAL"] = "0"
+    import app
+
+    return app
+
+
+@pytest.fixture(scope="module")
+def bank(app_module):
+    from app import AnswerOption, Level, Question, Questionnaire, User, app, db, rebuild_question_index
+
+    with app.app_context():
+        admin = User.query.filter_by(role="admin").first()
+        questionnaire = Questionnaire(title="Quiz des budgets", category="Contrôle", created_by=admin.id)
+        db.session.add(questionnaire)
+        for number in range(10):
+            question = Question(text=f"Question {number + 1}", points=1, position=number, questionnaire=questionnaire)
+            db.session.add(question)
+            db.session.add(AnswerOption(label="Bonne réponse", is_correct=True, question=question))
+            db.session.add(AnswerOption(label="Mauvaise réponse", is_correct=False, question=question))
+        db.session.commit()
+        rebuild_question_index()
+        db.session.commit()
+        mission = Level.query.filter_by(category="mission").order_by(Level.id).first()
+        return {"questionnaire_id": questionnaire.id, "mission_id": mission.id}
+
+
+@pytest.fixture(scope="module")
+def participant(app_module):
+    client = app_module.app.test_client()
+    client.post("/api/register", json={"username": "Budget", "email": "budget@protec.local", "password": "budget"})
+    return client
+
+
+@pytest.fixture(scope="module")
+def designer(app_module):
+    client = app_module.app.test_client()
+    client.post("/api/login", json={"email": "admin@protec.local", "password": "admin"})
+    return client
+
+
+def endpoint_of(app_module, method, url):
+    adapter = app_module.app.url_map.bind("localhost")
+    return adapter.match(url.split("?")[0], method=method)[0]
+
+
+@pytest.mark.parametrize("score", [250, 600], ids=["first-play", "repeat-play"])
+def test_participant_endpoints_within_budget(app_module, bank, participant, score):
+    from query_profiler import assert_query_budget
+
+    for page in PARTICIPANT_PAGES:
+        assert_query_budget(participant, page.format(**bank))
+    word = assert_query_budget(participant, "/api/pendu/word").get_json()
+    assert_query_budget(participant, "/api/pendu/result", method="POST", json={"id": word["id"], "success": True})
+    assert_query_budget(participant, "/api/ambulance/score", method="POST", json={"score": score})
+    assert_query_budget(
+        participant, f"/api/progress/{bank['mission_id']}", method="POST", json={"status": "termine", "score": score}
+    )
+
+
+def test_designer_endpoints_within_budget(app_module, bank, designer):
+    from query_profiler import assert_query_budget
+
+    for page in DESIGNER_PAGES:
+        assert_query_budget(designer, page)
+
+
+def test_every_budget_is_exercised(app_module):
+    from query_profiler import QUERY_BUDGETS
+
+    exercised = {
+        endpoint_of(app_module, "GET", page.format(questionnaire_id=1)) for page in PARTICIPANT_PAGES + DESIGNER_PAGES
+    }
+    exercised |= {
+        endpoint_of(app_module, "GET", "/api/pendu/word"),
+        endpoint_of(app_module, "POST", "/api/pendu/result"),
+        endpoint_of(app_module, "POST", "/api/ambulance/score"),
+        endpoint_of(app_module, "POST", "/api/progress/1"),
+    }
+    assert set(QUERY_BUDGETS) <= exercised
@@ -0,0 +1,171 @@
+"""Indexed word bank for the pendu mini-game.
+
+Each word gets an id derived from its text, so editing ``pendu_words.py``
+never changes what a stored id points to. Indexes by length, category (the
+sections of ``PENDU_WORD_SECTIONS``) and difficulty tier are built once at
+import time.
+"""
+import hashlib
+import random
+from typing import NamedTuple
+
+from pendu_words import PENDU_WORD_SECTIONS
+
+
+# Word length bounds of the difficulty tiers (inclusive upper bounds)
+TIERS = (("facile", 6), ("moyen", 10), ("difficile", None))
+# Sampling attempts before falling back to an explicit set difference
+_SAMPLE_ATTEMPTS = 32
+
+
+class Word(NamedTuple):
+    id: str
+    text: str
+    category: str
+    length: int
+    tier: str
+
+
+def word_id(text: str) -> str:
+    return hashlib.sha1(text.strip().upper().encode("utf-8")).hexdigest()[:12]
+
+
+def tier_for(length: int) -> str:
+    for name, upper in TIERS:
+        if upper is None or length <= upper:
+            return name
+    return TIERS[-1][0]
+
+
+def _build():
+    words = []
+    seen = set()
+    for category, texts in PENDU_WORD_SECTIONS.items():
+        for text in texts:
+            text = text.strip().upper()
+            if text in seen:
+                continue  # a word shared by two sections belongs to the first one
+            seen.add(text)
+            length = sum(char.isalpha() for char in text)
+            words.append(Word(word_id(text), text, category, length, tier_for(length)))
+    return tuple(words)
+
+
+WORDS = _build()
+TOTAL = len(WORDS)
+BY_ID = {word.id: word for word in WORDS}
+BY_LENGTH = {}
+BY_CATEGORY = {}
+BY_TIER = {}
+for _word in WORDS:
+    BY_LENGTH.setdefault(_word.length, []).append(_word.id)
+    BY_CATEGORY.setdefault(_word.category, []).append(_word.id)
+    BY_TIER.setdefault(_word.tier, []).append(_word.id)
+BY_LENGTH = {key: tuple(ids) for key, ids in BY_LENGTH.items()}
+BY_CATEGORY = {key: tuple(ids) for key, ids in BY_CATEGORY.items()}
+BY_TIER = {key: tuple(ids) for key, ids in BY_TIER.items()}
+ALL_IDS = tuple(BY_ID)
+del _word
+
+if len(BY_ID) != TOTAL:
+    raise RuntimeError("Collision d'identifiants dans la banque de mots du pendu")
+
+# Ids of the words by position in the pre-id sorted list (legacy index ->
+# id), frozen: stored progress still holds these positions, whatever the
+# word list becomes
+LEGACY_IDS = (
+    "87d930717519", "80a70f8651d7", "2b9f1cf5c4d3", "b3aa49f05649", "b1af06045ade", "fb30fd663b05", "7c2842a8b54d",
+    "dd7d1a847dfc", "3f3bb08f40e7", "30dbd5402bf1", "c32ab9356ca2", "a690dd5657be", "7a4f70e4c93e", "778ca383f51a",
+    "501026b15e24", "f6d120531a82", "53079c1a9da5", "e490e1b109f4", "7c8c572e298a", "755c4760abf1", "3878734cc529",
+    "049aaf60d2c7", "12fb4dc55d7c", "50edffa93884", "5b89a411af14", "a2b61c97c0ba", "22a5977bcced", "4bb65a3cb291",
+    "05368a159f91", "fb0b6670bcbd", "2992744c3f04", "cfd49540adca", "272ea1941340", "086076b394a7", "5d1e2bdf74a0",
+    "1c583507ea5f", "141a90d56cad", "fb3f096c4171", "1926c6f5df97", "6d09a0056af2", "b40138805998", "15edab735d89",
+    "10c38e381183", "7f5b03114569", "2a2786796593", "a6c60f04fa2d", "6d37f0377729", "17a24d051569", "0bcf824746a8",
+    "2b77abc12f23", "1298d0b804ff", "abcd69757a15", "388d1b9d146b", "d362d8baa5ef", "5c4bf302fb71", "1dfa5f1b3287",
+    "1b72c36eeec6", "0fc45cd0faae", "0e04520ef6be", "ace35c7f6ebb", "56cfed68426b", "82e636e1eb0f", "ac389a55af36",
+    "079014b6cc82", "c39eec5d25e6", "3b0162f10f50", "052f61f99f67", "64cbf7e194c1", "06ae10be9961", "57560fd8c1e0",
+    "31588d9c27ab", "e2260d3567da", "9330c1e312cd", "fcf314e163a6", "f65270a9374d", "39682a264221", "295533bb37d7",
+    "eb5a9671ae86", "42d5257db9a3", "1fc1198ba1dd", "817210ca6763", "11a008365009", "a5d9eca9f9c7", "06959fb94561",
+    "056d850b4989", "76e14ac690ac", "a420a6a6e257", "e619ca25cb5e", "a40f24047282", "9238f739fcac", "0b74647d860c",
+    "3587c7c97acf", "ddaecb0470a7", "7848433ad6b6", "c47f3e2daf70", "ea6ea9cfc701", "c7f43a32222b", "994d19e381f5",
+    "284f3272ea8a", "18df2d0756dc", "8e1f862d7445", "e4fcee0ebbdf", "984a60535953", "c45f9bc29550", "793ba2163a22",
+    "e74895d84e9d", "26e85199039e", "b99cafc05907", "5666399f9510", "67f95fb902f0", "9b85d840006a", "75c3155529db",
+    "ab35033ae3fb", "61d8265db533", "bb44e2dec242", "353a451c85a8", "f21dff64deb2", "431ebf1e8e78", "6757d59d005b",
+    "66447a2482a6", "05459369befe", "20380fcdb4d6", "fca8406ccc8f", "424d388472a5", "a4b5748efa75", "ca1c8630b274",
+    "f9d3db29bfd4", "ef58648f1202", "2df9730f0271", "6c09a7452a27", "050a5bcd6dab", "bb3ba0905dbb", "c5c9f56f26cf",
+    "9594b35022b6", "7432f058edc1", "f9acfc5b0b9a", "3498eb3c0787", "ff21a54ee398", "639d6cd056b6", "516ecba4d620",
+    "fc8a55438b58", "9bc18ebbd41f", "a68730a7123f", "4e13796784a3", "4cbc020b938d", "e3fc6ab9f99b", "f6165c510278",
+    "e6c3ba044a46", "cb5ee3c56fa6", "c53637b744ea", "49dc31190615", "6d6cb8c471fc", "219fd926b67d", "fd89deaa3b2d",
+    "89baf83709c4", "6d9f9048cd3f", "a8ad860c1581", "0314d2a87570", "3f4c1225c817", "8817cbed1da2", "e18b4d42def6",
+    "486df22edf58", "6153d852a2f0", "d114518e8523", "9d79dba1fd56", "00d18ac370eb", "8f02cf890b10", "fc7277353ec8",
+    "73694d97f16b", "d753cfb79154", "3f89ac137d29", "fadc6446932b", "daabaa9375e0", "9caaf0fe2df2", "b17f481131e9",
+    "a1df7b7748a9", "b242cd79c2fe", "5a61e634ec49", "416a88ce73f3", "51fc392ff9a5", "35cffe091521", "e885fa4d1f60",
+    "d53f3da0a7f4", "87a6466e014f", "9d753e97ce23", "0ead9cf95405", "6a5479f5e08d", "24f8023f3986", "a7fecb4c7e51",
+    "c9c9202c84c1", "f4ef8bac9f18", "c9dbd016ba63", "1c9fdafe25af", "10e1fc3d368d", "2e1c05d675e6", "d6a3412a1e46",
+    "dc282bb7d7fe", "730fad277ae3", "b6254866ad36", "b7ce56111c7d", "27fd00d671cc", "0c6cc76f3e70", "df11a993091d",
+    "7a1e04723712", "b485fa3d4199", "88c109224bae", "2263f1d1facc", "5db963c66474", "2ec1fac1caa9", "d91b1b28ff19",
+    "c3a01c21247b", "f13f41d2561d", "ff60fcc8c5d6", "a41d4e7e27d3", "be1b6334a95f", "243580d939b2", "53cde43811a6",
+    "f03a5a48ed88", "d803cb822133", "623a45ae2cea", "33d2f0e12f33", "23f8657aecfd", "097feb573217", "865e2735defa",
+    "8e4a104eda1a", "52f004bab222", "b701e719b23e", "115cb610bfdd", "bb9ced2e149d", "82ff303bb6e6", "b84dafef1d18",
+    "5f5cdfd63a66", "289e7cb687cf", "de8d9181cc19", "e07d33c0c13d", "bffffb62de8a", "d11ba0f3752e", "2f9dcde68244",
+    "a2790527ab92", "3c08cf1bae24", "1784c62bc004", "cf71540e2666", "7ce3adafad3e", "494321065c8c", "174d76146f9b",
+    "ab38e9728bb2", "3f9bded4b57d", "43239b6a39ab", "db16f2083219", "07cdc82a80d6", "cc6906a89599", "abe0acae5392",
+    "6f56dc8387d8", "708f90cfaae5", "ef8dd2465cff", "de4fd1b31e49", "2fe1adcabbab", "d3407af480ec", "0a0e3e3735bc",
+    "bdbb70dd6743", "0c5355003eda", "0df3f0c248d9", "ef5214372069", "32c48ee2072a", "8f516b032183",
+)
+LEGACY_INDEX_TO_ID = dict(enumerate(LEGACY_IDS))
+
+
+def get(identifier):
+    return BY_ID.get(identifier)
+
+
+def candidates(tier=None, category=None, length=None):
+    """Return the precomputed id tuple for a filter (one filter at a time)."""
+    if tier:
+        return BY_TIER.get(tier, ())
+    if category:
+        return BY_CATEGORY.get(category, ())
+    if length:
+        return BY_LENGTH.get(int(length), ())
+    return ALL_IDS
+
+
+def pick(played, count=1, tier=None, category=None, length=None, rng=random):
+    """Pick up to ``count`` distinct words not in ``played`` (a set of ids)."""
+    pool = candidates(tier, category, length)
+    picked = []
+    chosen = set()
+    # Cheap while most of the pool is still unplayed: no pass over the list
+    for _ in range(_SAMPLE_ATTEMPTS * count):
+        if len(picked) >= count or not pool:
+            break
+        identifier = pool[rng.randrange(len(pool))]
+        if identifier not in played and identifier not in chosen:
+            chosen.add(identifier)
+            picked.append(BY_ID[identifier])
+    if len(picked) < count:
+        remaining = [identifier for identifier in pool if identifier not in played and identifier not in chosen]
+        picked.extend(BY_ID[identifier] for identifier in rng.sample(remaining, min(count - len(picked), len(remaining))))
+    return picked
+
+
+def migrate_played(data):
+    """Return pendu progress data with ``played_indices`` converted to ``played_ids``.
+
+    Returns None when the data is already in the current format.
+    """
+    if not isinstance(data, dict) or "played_indices" not in data:
+        return None
+    migrated = {key: value for key, value in data.items() if key != "played_indices"}
+    ids = list(data.get("played_ids") or [])
+    for index in data.get("played_indices") or []:
+        identifier = LEGACY_INDEX_TO_ID.get(index)
+        if identifier and identifier not in ids:
+            ids.append(identifier)
+    migrated["played_ids"] = ids
+    return migrated
+
+
+def serialize(word: Word):
+    return {"id": word.id, "word": word.text, "length": len(word.text), "category": word.category, "tier": word.tier}